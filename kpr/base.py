@@ -12,22 +12,40 @@
 #    under the License.
 
 import contextlib
+import functools
 import json
 import mock
 import os
 import random
 import string
 import subprocess
+import threading
 import unittest
 
+from keystoneauth1.exceptions import http
+
+from kpr.fake import local
+from kpr.utils import assignments
+from kpr.utils import cassette
 from kpr.utils import clients
+from kpr.utils import clipool
+from kpr.utils import concurrency
+from kpr.utils import pool
+from kpr.utils import registry
+from kpr.utils import rest
+from kpr.utils import shell
+from kpr.utils import stats
+from kpr.utils import sweeper
+from kpr.utils import throttle
+from kpr.utils import tokens
 
 
 def id_generator(
         size=8,
         chars=string.ascii_uppercase + string.ascii_lowercase + string.digits
     ):
-    return ''.join(random.choice(chars) for _ in range(size))
+    return cassette.remember(
+        ''.join(random.choice(chars) for _ in range(size)))
 
 
 def getid(obj):
@@ -50,14 +68,43 @@ def getid(obj):
 
 class TestCase(unittest.TestCase):
 
+    # 'test' provisions the fixtures of setup_fixtures() around every test
+    # method. 'class' provisions them once in setUpClass and shares them
+    # between all test methods of the class, so it must only be used by
+    # classes whose tests leave the fixtures as they found them. When
+    # KPR_FIXTURE_POOL_SIZE is set, 'class' scoped classes lease their
+    # fixture_projects from the cross-class pool instead.
+    fixture_scope = 'test'
+
+    # setup_project() keyword arguments of the projects the default
+    # setup_fixtures() creates.
+    fixture_projects = ()
+
+    # With the 'test' scope, create the admin auditor and each project and
+    # user of fixture_projects on first access to its attribute, and tear
+    # down only those. Set to False when a test depends on fixtures it
+    # never reads, e.g. to count the users of a project. Classes that
+    # override setup_fixtures() are always set up eagerly.
+    fixture_lazy = True
+
+    # Description of the users and projects this class creates, which
+    # tells kpr.utils.sweeper what it may delete.
+    fixture_marker = sweeper.MARKER
+
+    def __getattr__(self, name):
+        # Only called for attributes which are not set yet.
+        lazy = self.__dict__.get('lazy_fixtures')
+        if not lazy or name not in lazy:
+            raise AttributeError(name)
+        with self.__dict__['lazy_fixtures_lock']:
+            if name not in self.__dict__:
+                self.__dict__[name] = lazy[name]()
+        return self.__dict__[name]
+
     @contextlib.contextmanager
     def grant_role_temporary(self, target_role, user, project):
         try:
-            self.admin.roles.grant(
-                target_role,
-                user=user,
-                project=project
-            )
+            self.grant_role(target_role, user, project)
             yield
         except Exception as e:
             pass
@@ -67,6 +114,8 @@ class TestCase(unittest.TestCase):
                 user=user,
                 project=project
             )
+            assignments.snapshot.revoked(project, user, target_role)
+            self.invalidate_credentials(user)
 
     @contextlib.contextmanager
     def create_user_and_cleanup(self, project, username, role):
@@ -79,16 +128,20 @@ class TestCase(unittest.TestCase):
         finally:
             self.delete_user(project, user, role)
 
+    def invalidate_credentials(self, user):
+        tokens.token_cache.evict(user)
+        clients.forget_sessions(user)
+
     def create_admin_auditor(self):
-        project = self.admin.projects.find(
-            name=clients.OS_ADMIN_PROJECT_NAME
+        project = registry.registry.find_project(
+            clients.OS_ADMIN_PROJECT_NAME
         )
         username = 'admin-auditor-{}'.format(id_generator())
         return self.create_user(project, username, self.cloud_admin_auditor_role)
 
     def delete_admin_auditor(self, user, force=True):
-        project = self.admin.projects.find(
-            name=clients.OS_ADMIN_PROJECT_NAME
+        project = registry.registry.find_project(
+            clients.OS_ADMIN_PROJECT_NAME
         )
         self.delete_user(project, user, self.cloud_admin_auditor_role, force=force)
 
@@ -98,15 +151,23 @@ class TestCase(unittest.TestCase):
             domain=clients.OS_USER_DOMAIN_ID,
             default_project=project,
             password=clients.OS_PASSWORD,
+            description=self.fixture_marker,
         )
+        sweeper.created(user)
+        self.grant_role(role, user, project)
+        return user
+
+    def grant_role(self, role, user, project):
         self.admin.roles.grant(
             role,
             user=user,
             project=project,
         )
-        return user
+        assignments.snapshot.granted(project, user, role)
+        self.invalidate_credentials(user)
 
     def delete_user(self, project, user, role, force=True):
+        self.invalidate_credentials(user)
         try:
             self.admin.roles.revoke(
                 role,
@@ -120,6 +181,8 @@ class TestCase(unittest.TestCase):
         except Exception as e:
             if not force:
                 raise e
+        finally:
+            assignments.snapshot.forget_user(user)
 
     def os_run_text(
         self,
@@ -128,15 +191,51 @@ class TestCase(unittest.TestCase):
         username='admin',
         format='json',
     ):
+        with stats.as_persona(username, project):
+            return self._os_run_text(command, project, username, format)
+
+    def _os_run_text(self, command, project, username, format):
+        if clients.KPR_OS_RUN_MODE == 'rest':
+            output = rest.run(command, project=project, username=username)
+            if not format:
+                return b''
+            return json.dumps(output).encode('utf-8')
+
         args = ['openstack'] + command
         if format:
             args = args + ['-f', format]
-
-        return subprocess.check_output(
-            args,
-            stderr=subprocess.STDOUT,
-            env=self.get_os_env(project=project, username=username)
-        )
+        env = self.get_os_env(project=project, username=username)
+
+        if clients.KPR_OS_RUN_MODE == 'inprocess':
+            return shell.run_in_process(args, env)
+
+        # The forked or pooled command makes its requests outside of this
+        # process' throttle and stats, so it counts as one call while it runs.
+        # A run takes longer than any API call, so only a refusal for
+        # overload, not its duration, shrinks the throttle's window.
+        def attempt():
+            with throttle.call(timed=False) as limited:
+                with stats.timed('cli', stats.cli_operation(args)) as outcome:
+                    try:
+                        if clients.KPR_OS_RUN_MODE == 'pool':
+                            output = clipool.check_output(args, env)
+                        else:
+                            output = subprocess.check_output(
+                                args,
+                                stderr=subprocess.STDOUT,
+                                env=env
+                            )
+                    except subprocess.CalledProcessError as e:
+                        outcome['status'] = e.returncode
+                        if throttle.cli_overloaded(e.output):
+                            limited['overloaded'] = True
+                            raise throttle.Overloaded(error=e)
+                        raise
+                    outcome['status'] = 0
+                    return output
+
+        return throttle.retrying(
+            attempt, idempotent=command[1:2] in (['list'], ['show']))
 
     def os_run(
         self,
@@ -145,6 +244,9 @@ class TestCase(unittest.TestCase):
         username='admin',
         format='json',
     ):
+        if clients.KPR_OS_RUN_MODE == 'rest':
+            with stats.as_persona(username, project):
+                return rest.run(command, project=project, username=username)
         return json.loads(self.os_run_text(
             command=command,
             project=project,
@@ -153,6 +255,29 @@ class TestCase(unittest.TestCase):
         ).decode('utf-8'))
 
     def get_os_env(self, project='admin', username='admin'):
+        if clients.KPR_TOKEN_CACHE:
+            try:
+                return self.get_os_token_env(
+                    project=project, username=username)
+            except Exception as e:
+                # Let the CLI report the authentication failure itself.
+                pass
+        return self.get_os_password_env(project=project, username=username)
+
+    def get_os_token_env(self, project='admin', username='admin'):
+        token = tokens.token_cache.get(username, project)
+        return {
+            'OS_AUTH_TYPE': 'admin_token',
+            'OS_ENDPOINT': token.endpoint,
+            'OS_IDENTITY_API_VERSION': '3',
+            'OS_NO_CACHE': '1',
+            'OS_REGION_NAME': clients.OS_REGION_NAME,
+            'OS_TOKEN': token.token,
+            'OS_VOLUME_API_VERSION': '2',
+            'PATH': os.environ['PATH'],
+        }
+
+    def get_os_password_env(self, project='admin', username='admin'):
         return {
             'OS_AUTH_URL': clients.OS_AUTH_URL,
             'OS_IDENTITY_API_VERSION': '3',
@@ -167,30 +292,188 @@ class TestCase(unittest.TestCase):
             'PATH': os.environ['PATH'],
         }
 
+    @classmethod
+    @contextlib.contextmanager
+    def use_cassette(cls, name):
+        """Record or replay the HTTP requests made in the block."""
+        if not clients.KPR_CASSETTE_MODE:
+            yield
+            return
+        stop = cassette.start('{}.{}'.format(cls.class_id(), name))
+        try:
+            yield
+        finally:
+            stop()
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestCase, cls).setUpClass()
+        # Installed in this order, stats do not count the time spent
+        # waiting for the throttle.
+        stats.install()
+        throttle.install()
+        sweeper.start()
+        stats.enter(cls.class_id(), 'setUpClass')
+        try:
+            with cls.use_cassette('setUpClass'):
+                cls.setup_class_fixtures()
+        finally:
+            stats.leave()
+
+    @classmethod
+    def class_id(cls):
+        return '{}.{}'.format(cls.__module__, cls.__name__)
+
+    @classmethod
+    def setup_class_fixtures(cls):
+        cls.class_fixtures = None
+        cls.class_fixtures_lease = None
+        cls.class_snapshot = None
+        cls.test_snapshot = None
+        if clients.KPR_FAKE_KEYSTONE:
+            # Fixtures are built once per class and every test starts from
+            # the same snapshot of the fake, whatever the fixture_scope.
+            cls.class_snapshot = local.start().snapshot()
+        elif cls.fixture_scope != 'class':
+            return
+
+        # Provision on a spare instance; setUp copies the attributes it
+        # created onto every test instance.
+        fixtures = cls()
+        attributes = set(vars(fixtures))
+        fixtures.bootstrap()
+        if (clients.KPR_FIXTURE_POOL_SIZE and cls.fixture_projects and
+                cls.class_snapshot is None):
+            cls.class_fixtures_lease = pool.lease(
+                fixtures, cls.fixture_projects)
+            fixtures.__dict__.update(cls.class_fixtures_lease.attributes)
+        else:
+            fixtures.admin_auditor = fixtures.create_admin_auditor()
+            try:
+                fixtures.setup_fixtures()
+            except Exception:
+                if cls.class_snapshot is not None:
+                    local.start().rollback(cls.class_snapshot)
+                else:
+                    fixtures.cleanup_fixtures()
+                raise
+        cls.class_fixtures = dict(
+            (name, value) for name, value in vars(fixtures).items()
+            if name not in attributes
+        )
+        cls.class_fixtures_owner = fixtures
+        if cls.class_snapshot is not None:
+            cls.test_snapshot = local.start().snapshot()
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestCase, cls).tearDownClass()
+        stats.enter(cls.class_id(), 'tearDownClass')
+        try:
+            with cls.use_cassette('tearDownClass'):
+                cls.teardown_class_fixtures()
+        finally:
+            stats.leave()
+
+    @classmethod
+    def teardown_class_fixtures(cls):
+        if cls.class_snapshot is not None:
+            local.start().rollback(cls.class_snapshot)
+            assignments.snapshot.invalidate()
+        elif cls.class_fixtures_lease is not None:
+            cls.class_fixtures_lease.release()
+        elif cls.class_fixtures is not None:
+            fixtures = cls.class_fixtures_owner
+            fixtures.teardown_fixtures()
+            fixtures.delete_admin_auditor(fixtures.admin_auditor)
+
     def setUp(self):
         super(TestCase, self).setUp()
+        # Cleanups run last in, first out: this one ends the tearDown phase.
+        self.addCleanup(stats.leave)
+        stats.enter(self.id(), 'setUp')
         self.addCleanup(mock.patch.stopall)
+        if clients.KPR_CASSETTE_MODE:
+            self.addCleanup(cassette.start(self.id()))
+        if self.class_fixtures is not None:
+            self.__dict__.update(self.class_fixtures)
+        elif (self.fixture_lazy and
+              type(self).setup_fixtures is TestCase.setup_fixtures):
+            self.bootstrap()
+            self.defer_fixtures()
+        else:
+            self.bootstrap()
+            self.admin_auditor = self.create_admin_auditor()
+            try:
+                self.setup_fixtures()
+            except Exception:
+                self.cleanup_fixtures()
+                raise
+        stats.enter(self.id(), 'body')
+
+    def tearDown(self):
+        super(TestCase, self).tearDown()
+        stats.enter(self.id(), 'tearDown')
+        if self.test_snapshot is not None:
+            local.start().rollback(self.test_snapshot)
+            assignments.snapshot.invalidate()
+        elif self.fixture_scope != 'class':
+            self.teardown_fixtures()
+            if 'admin_auditor' in vars(self):
+                self.delete_admin_auditor(self.admin_auditor)
+
+    def bootstrap(self):
         self.admin = clients.get_admin_client()
-        self.cloud_admin_role = self.admin.roles.find(
-            name='admin'
-        )
-        self.cloud_admin_auditor_role = self.admin.roles.find(
-            name='admin_auditor'
+        self.cloud_admin_role = registry.registry.find_role('admin')
+        self.cloud_admin_auditor_role = registry.registry.find_role(
+            'admin_auditor'
         )
-        self.project_admin_role = self.admin.roles.find(
-            name='project_admin'
+        self.project_admin_role = registry.registry.find_role(
+            'project_admin'
         )
-        self.project_auditor_role = self.admin.roles.find(
-            name='project_auditor'
+        self.project_auditor_role = registry.registry.find_role(
+            'project_auditor'
         )
-        self.project_member_role = self.admin.roles.find(
-            name='Member'
+        self.project_member_role = registry.registry.find_role('Member')
+
+    def setup_fixtures(self):
+        for spec in self.fixture_projects:
+            self.setup_project(**spec)
+
+    def defer_fixtures(self):
+        """Make the attributes setup_fixtures() would set lazy."""
+        def user(project, attribute, role):
+            # Using a user first creates its project.
+            return self.create_project_user(
+                getattr(self, project), attribute, role)
+
+        lazy = {'admin_auditor': self.create_admin_auditor}
+        for spec in self.fixture_projects:
+            project = spec.get('project', 'project1')
+            lazy[project] = functools.partial(self.create_project, project)
+            for attribute, role in self.get_project_users(**spec):
+                lazy[attribute] = functools.partial(
+                    user, project, attribute, role)
+        self.lazy_fixtures_lock = threading.RLock()
+        self.lazy_fixtures = lazy
+
+    def teardown_fixtures(self):
+        concurrency.run_all(
+            (
+                functools.partial(self.teardown_project, **spec)
+                for spec in self.fixture_projects
+            ),
+            workers=1,
         )
-        self.admin_auditor = self.create_admin_auditor()
 
-    def tearDown(self):
-        super(TestCase, self).tearDown()
-        self.delete_admin_auditor(self.admin_auditor)
+    def cleanup_fixtures(self):
+        # Best effort removal of what a failed setup_fixtures left behind.
+        try:
+            self.teardown_fixtures()
+        except Exception as e:
+            pass
+        if 'admin_auditor' in vars(self):
+            self.delete_admin_auditor(self.admin_auditor)
 
     def setup_project(
         self,
@@ -199,26 +482,26 @@ class TestCase(unittest.TestCase):
         auditor=False,
         user=2
     ):
-        try:
-            project_name = '{}-{}'.format(project, id_generator())
-            project_instance = self.admin.projects.create(
-                project_name,
-                clients.OS_PROJECT_DOMAIN_ID
-            )
-            setattr(
-                self,
-                project,
-                project_instance
-            )
-        except Exception as e:
-            pass
+        setattr(
+            self,
+            project,
+            self.create_project(project)
+        )
 
-        if admin:
-            self.setup_project_admin(project)
-        if auditor:
-            self.setup_project_auditor(project)
+        self.setup_project_users(
+            project,
+            self.get_project_users(project, admin, auditor, user),
+        )
 
-        self.setup_project_user(project, user)
+    def create_project(self, project):
+        project_name = '{}-{}'.format(project, id_generator())
+        project_instance = self.admin.projects.create(
+            project_name,
+            clients.OS_PROJECT_DOMAIN_ID,
+            description=self.fixture_marker,
+        )
+        sweeper.created(project_instance)
+        return project_instance
 
     def get_role_by_name(self, role='admin'):
         return {
@@ -226,25 +509,58 @@ class TestCase(unittest.TestCase):
             'auditor': self.project_auditor_role,
         }[role]
 
-    def setup_project_admin_or_auditor(self, project='project1', role='admin'):
-        try:
-            user = '{}_{}'.format(project, role)
-            user_name = '{}-{}'.format(user, id_generator())
-            project_instance = getattr(self, project)
-            role = self.get_role_by_name(role)
+    def get_project_users(
+        self,
+        project='project1',
+        admin=True,
+        auditor=False,
+        user=2
+    ):
+        """Return (attribute name, role) of the users of a project."""
+        users = []
+        if admin:
+            users.append(('{}_admin'.format(project), self.project_admin_role))
+        if auditor:
+            users.append(
+                ('{}_auditor'.format(project), self.project_auditor_role))
+        for i in range(user):
+            users.append(
+                ('{}_user{}'.format(project, i), self.project_member_role))
+        return users
 
-            user_instance = self.create_user(
+    def setup_project_users(self, project, users):
+        # Users only depend on the project, so they are created side by side.
+        project_instance = getattr(self, project)
+        concurrency.run_all(
+            functools.partial(
+                self.setup_project_user_as,
                 project_instance,
-                user_name,
-                role
-            )
-            setattr(
-                self,
-                user,
-                user_instance
+                attribute,
+                role,
             )
-        except Exception as e:
-            pass
+            for attribute, role in users
+        )
+
+    def setup_project_user_as(self, project_instance, attribute, role):
+        setattr(
+            self,
+            attribute,
+            self.create_project_user(project_instance, attribute, role)
+        )
+
+    def create_project_user(self, project_instance, attribute, role):
+        user_name = '{}-{}'.format(attribute, id_generator())
+        return self.create_user(
+            project_instance,
+            user_name,
+            role
+        )
+
+    def setup_project_admin_or_auditor(self, project='project1', role='admin'):
+        self.setup_project_users(
+            project,
+            [('{}_{}'.format(project, role), self.get_role_by_name(role))],
+        )
 
     def setup_project_admin(self, project='project1'):
         self.setup_project_admin_or_auditor(project=project, role='admin')
@@ -253,26 +569,10 @@ class TestCase(unittest.TestCase):
         self.setup_project_admin_or_auditor(project=project, role='auditor')
 
     def setup_project_user(self, project='project1', user=2):
-        try:
-            project_user = '{}_user'.format(project)
-            project_instance = getattr(self, project)
-
-            for i in range(user):
-                _project_user = '{}{}'.format(project_user, i)
-                _project_user_name = '{}-{}'.format(
-                    _project_user, id_generator())
-                _project_user_instance = self.create_user(
-                    project_instance,
-                    _project_user_name,
-                    self.project_member_role
-                )
-                setattr(
-                    self,
-                    _project_user,
-                    _project_user_instance,
-                )
-        except Exception as e:
-            pass
+        self.setup_project_users(
+            project,
+            self.get_project_users(project, admin=False, user=user),
+        )
 
     def teardown_project(
         self,
@@ -281,28 +581,62 @@ class TestCase(unittest.TestCase):
         auditor=False,
         user=2
     ):
-        project_instance = getattr(self, project)
-        if admin:
-            self.teardown_project_admin(project)
-        if auditor:
-            self.teardown_project_auditor(project)
-
-        self.teardown_project_user(project, user)
+        project_instance = vars(self).get(project)
+        stages = self.teardown_project_users_stages(
+            project,
+            self.get_project_users(project, admin, auditor, user),
+        )
+        if project_instance is not None:
+            stages.append([
+                functools.partial(self.admin.projects.delete, project_instance)
+            ])
+        concurrency.run_stages(stages)
+
+    def teardown_project_users_stages(self, project, users):
+        """Return the stages which remove the given users of a project.
+
+        All grants are revoked before any user is deleted. Users which were
+        never created (or, with lazy fixtures, never used) are skipped.
+        """
+        project_instance = vars(self).get(project)
+        users = [
+            (vars(self)[attribute], role)
+            for attribute, role in users
+            if attribute in vars(self)
+        ]
+        revokes = []
+        if project_instance is not None:
+            revokes = [
+                functools.partial(
+                    self.revoke_role, role, user_instance, project_instance)
+                for user_instance, role in users
+            ]
+        deletes = [
+            functools.partial(self.admin.users.delete, user_instance)
+            for user_instance, role in users
+        ]
+        return [revokes, deletes]
+
+    def teardown_project_users(self, project, users):
+        concurrency.run_stages(
+            self.teardown_project_users_stages(project, users))
+
+    def revoke_role(self, role, user, project):
         try:
-            self.admin.projects.delete(project_instance)
-        except Exception as e:
+            self.admin.roles.revoke(
+                role,
+                user=user,
+                project=project,
+            )
+        except http.NotFound:
             pass
+        assignments.snapshot.revoked(project, user, role)
+        self.invalidate_credentials(user)
 
     def teardown_project_admin_or_auditor(self, project='project1', role='admin'):
-        project_instance = getattr(self, project)
-        user = '{}_{}'.format(project, role)
-        user = getattr(self, user)
-        role = self.get_role_by_name(role)
-
-        self.delete_user(
-            project_instance,
-            user,
-            role,
+        self.teardown_project_users(
+            project,
+            [('{}_{}'.format(project, role), self.get_role_by_name(role))],
         )
 
     def teardown_project_admin(self, project='project1'):
@@ -312,14 +646,7 @@ class TestCase(unittest.TestCase):
         self.teardown_project_admin_or_auditor(project=project, role='auditor')
 
     def teardown_project_user(self, project='project1', user=2):
-        project_instance = getattr(self, project)
-        project_user = '{}_user'.format(project)
-
-        for i in range(user):
-            _project_user = '{}{}'.format(project_user, i)
-            _project_user = getattr(self, _project_user)
-            self.delete_user(
-                project_instance,
-                _project_user,
-                self.project_member_role,
-            )
+        self.teardown_project_users(
+            project,
+            self.get_project_users(project, admin=False, user=user),
+        )
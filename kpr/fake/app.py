@@ -0,0 +1,577 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import re
+from urllib import parse
+from wsgiref import util
+
+from kpr.fake import store
+from kpr.policy import compiler
+from kpr.policy import enforcer
+
+STATUS = {
+    200: '200 OK',
+    201: '201 Created',
+    204: '204 No Content',
+    300: '300 Multiple Choices',
+    400: '400 Bad Request',
+    401: '401 Unauthorized',
+    403: '403 Forbidden',
+    404: '404 Not Found',
+    405: '405 Method Not Allowed',
+    409: '409 Conflict',
+}
+
+TIME_FORMAT = '%Y-%m-%dT%H:%M:%S.000000Z'
+
+
+class HTTPError(Exception):
+
+    def __init__(self, code, message):
+        super(HTTPError, self).__init__(message)
+        self.code = code
+        self.message = message
+
+
+class Request(object):
+
+    def __init__(self, environ):
+        self.environ = environ
+        self.method = environ['REQUEST_METHOD']
+        self.path = environ.get('PATH_INFO', '/').rstrip('/') or '/'
+        self.params = dict(
+            (k, v[-1]) for k, v in
+            parse.parse_qs(environ.get('QUERY_STRING', '')).items()
+        )
+        self.base_url = util.application_uri(environ).rstrip('/')
+        self.creds = None
+        self.kwargs = {}
+
+    def header(self, name):
+        return self.environ.get('HTTP_' + name.upper().replace('-', '_'))
+
+    @property
+    def json(self):
+        try:
+            length = int(self.environ.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            length = 0
+        if not length:
+            return {}
+        try:
+            return json.loads(
+                self.environ['wsgi.input'].read(length).decode('utf-8'))
+        except ValueError:
+            raise HTTPError(400, 'Malformed request body.')
+
+
+def _route(method, pattern):
+    def decorator(function):
+        function.route = (method, re.compile('^/v3{}$'.format(pattern)))
+        return function
+    return decorator
+
+
+class Application(object):
+    """A WSGI stand-in for the Keystone v3 identity API.
+
+    It implements the calls the suite and its clients make (tokens,
+    users, projects, roles, grants and role assignments) on top of a
+    ``store.Store`` and checks every call against a policy file with the
+    same rule names and targets as Keystone, answering 403 when the
+    policy denies it.
+    """
+
+    def __init__(self, policy, data=None):
+        if not isinstance(policy, compiler.CompiledPolicy):
+            policy = compiler.CompiledPolicy.from_file(policy)
+        self.policy = policy
+        if data is None:
+            data = store.Store()
+            data.bootstrap()
+        self.store = data
+        self.routes = []
+        for name in sorted(dir(self)):
+            handler = getattr(self, name)
+            if hasattr(handler, 'route'):
+                self.routes.append(handler.route + (handler,))
+
+    def __call__(self, environ, start_response):
+        request = Request(environ)
+        headers = [('Content-Type', 'application/json')]
+        try:
+            code, body, extra = self.dispatch(request)
+            headers.extend(extra)
+        except HTTPError as e:
+            code, body = e.code, self._error(e.code, e.message)
+        except store.NotFound as e:
+            code, body = 404, self._error(404, str(e))
+        except store.Conflict as e:
+            code, body = 409, self._error(409, str(e))
+        except store.Unauthorized as e:
+            code, body = 401, self._error(401, str(e))
+
+        if body is None:
+            payload = b''
+        else:
+            payload = json.dumps(body).encode('utf-8')
+        headers.append(('Content-Length', str(len(payload))))
+        start_response(STATUS[code], headers)
+        return [payload]
+
+    def dispatch(self, request):
+        if request.path in ('/', '/v3'):
+            return self.versions(request)
+
+        allowed = False
+        for method, pattern, handler in self.routes:
+            match = pattern.match(request.path)
+            if match is None:
+                continue
+            allowed = True
+            if method != request.method and not (
+                    method == 'GET' and request.method == 'HEAD'):
+                continue
+            if not request.path.startswith('/v3/auth/tokens'):
+                self.authenticate(request)
+            request.kwargs = match.groupdict()
+            result = handler(request, **request.kwargs)
+            if not isinstance(result, tuple):
+                result = (200 if result is not None else 204, result)
+            if len(result) == 2:
+                result = result + ([],)
+            return result
+        if allowed:
+            raise HTTPError(405, 'The method is not allowed.')
+        raise HTTPError(404, 'The resource could not be found.')
+
+    def authenticate(self, request):
+        token_id = request.header('X-Auth-Token')
+        if not token_id:
+            raise HTTPError(401, 'The request you have made requires '
+                                 'authentication.')
+        token = self.store.validate_token(token_id)
+        user = self.store.get('users', token['user_id'])
+        project = self.store.get('projects', token['project_id'])
+        roles = self.store.roles_of(user['id'], project['id'])
+        request.token = token
+        request.creds = enforcer.credentials(
+            user['id'],
+            project['id'],
+            [r['name'] for r in roles],
+            user_domain_id=user['domain_id'],
+            project_domain_id=project['domain_id'],
+        )
+
+    def enforce(self, request, action, target=None):
+        # Like Keystone, the URL parameters (e.g. user_id) are part of the
+        # target.
+        target = dict(target or {}, **request.kwargs)
+        if not self.policy.enforce(action, target, request.creds):
+            raise HTTPError(
+                403, 'You are not authorized to perform the requested '
+                     'action: {}.'.format(action))
+
+    def _error(self, code, message):
+        title = STATUS[code].split(' ', 1)[1]
+        return {'error': {'code': code, 'title': title, 'message': message}}
+
+    def _ref(self, request, kind, resource):
+        resource = dict(resource)
+        resource['links'] = {
+            'self': '{}/v3/{}/{}'.format(
+                request.base_url, kind, resource['id']),
+        }
+        return resource
+
+    def _collection(self, request, kind, resources):
+        return {
+            kind: [self._ref(request, kind, r) for r in resources],
+            'links': {
+                'self': '{}{}'.format(request.base_url, request.path),
+                'previous': None,
+                'next': None,
+            },
+        }
+
+    def _filters(self, request, names):
+        return dict(
+            (name, request.params[name]) for name in names
+            if name in request.params)
+
+    # Version discovery
+
+    def versions(self, request):
+        version = {
+            'id': 'v3.8',
+            'status': 'stable',
+            'updated': '2017-02-22T00:00:00Z',
+            'links': [{'rel': 'self', 'href': request.base_url + '/v3/'}],
+            'media-types': [{
+                'base': 'application/json',
+                'type': 'application/vnd.openstack.identity-v3+json',
+            }],
+        }
+        if request.path == '/v3':
+            return 200, {'version': version}, []
+        return 300, {'versions': {'values': [version]}}, []
+
+    # Tokens
+
+    @_route('POST', '/auth/tokens')
+    def create_token(self, request):
+        auth = request.json.get('auth', {})
+        identity = auth.get('identity', {})
+        methods = identity.get('methods', [])
+        if 'password' in methods:
+            user = identity.get('password', {}).get('user', {})
+            user_id = self._user_id(user)
+            password = user.get('password')
+            project_id = self._project_id(auth.get('scope'), user_id)
+            token = self.store.authenticate(user_id, password, project_id)
+        elif 'token' in methods:
+            token = self.store.validate_token(
+                identity.get('token', {}).get('id'))
+            project_id = self._project_id(
+                auth.get('scope'), token['user_id'])
+            token = self.store.issue_token(token['user_id'], project_id)
+        else:
+            raise HTTPError(401, 'Unsupported authentication method.')
+        return (
+            201,
+            self._token_body(request, token, methods),
+            [('X-Subject-Token', token['id'])],
+        )
+
+    @_route('GET', '/auth/tokens')
+    def validate_token(self, request):
+        self.authenticate(request)
+        token = self.store.validate_token(request.header('X-Subject-Token'))
+        return (
+            200,
+            self._token_body(request, token, ['password']),
+            [('X-Subject-Token', token['id'])],
+        )
+
+    @_route('GET', '/auth/projects')
+    def list_auth_projects(self, request):
+        return self._collection(
+            request, 'projects', self._user_projects(request.token['user_id']))
+
+    def _user_id(self, user):
+        if 'id' in user:
+            return user['id']
+        domain = user.get('domain', {})
+        domain_id = domain.get('id')
+        if domain_id is None and 'name' in domain:
+            domain_id = self.store.find('domains', domain['name'])['id']
+        try:
+            return self.store.find(
+                'users', user.get('name'), domain_id or 'default')['id']
+        except store.NotFound:
+            raise store.Unauthorized('The request you have made requires '
+                                     'authentication.')
+
+    def _project_id(self, scope, user_id):
+        if not scope:
+            # The fake only issues project scoped tokens.
+            return self.store.get('users', user_id).get('default_project_id')
+        project = scope.get('project', {})
+        if 'id' in project:
+            return project['id']
+        domain = project.get('domain', {})
+        domain_id = domain.get('id')
+        if domain_id is None and 'name' in domain:
+            domain_id = self.store.find('domains', domain['name'])['id']
+        try:
+            return self.store.find(
+                'projects', project.get('name'), domain_id or 'default')['id']
+        except store.NotFound:
+            raise store.Unauthorized(
+                'Could not find project: {}.'.format(project.get('name')))
+
+    def _token_body(self, request, token, methods):
+        user = self.store.get('users', token['user_id'])
+        project = self.store.get('projects', token['project_id'])
+        url = request.base_url + '/v3'
+        return {'token': {
+            'methods': methods,
+            'user': {
+                'id': user['id'],
+                'name': user['name'],
+                'domain': {'id': user['domain_id'], 'name': 'Default'},
+                'password_expires_at': None,
+            },
+            'project': {
+                'id': project['id'],
+                'name': project['name'],
+                'domain': {'id': project['domain_id'], 'name': 'Default'},
+            },
+            'roles': [
+                {'id': r['id'], 'name': r['name']}
+                for r in self.store.roles_of(user['id'], project['id'])
+            ],
+            'catalog': [{
+                'id': 'identity',
+                'type': 'identity',
+                'name': 'keystone',
+                'endpoints': [
+                    {
+                        'id': interface,
+                        'interface': interface,
+                        'region': 'RegionOne',
+                        'region_id': 'RegionOne',
+                        'url': url,
+                    }
+                    for interface in ('public', 'internal', 'admin')
+                ],
+            }],
+            'is_domain': False,
+            'audit_ids': [token['audit_id']],
+            'issued_at': token['issued_at'].strftime(TIME_FORMAT),
+            'expires_at': token['expires_at'].strftime(TIME_FORMAT),
+        }}
+
+    # Domains
+
+    @_route('GET', '/domains')
+    def list_domains(self, request):
+        self.enforce(request, 'identity:list_domains')
+        return self._collection(request, 'domains', self.store.list(
+            'domains', **self._filters(request, ('name', 'enabled'))))
+
+    @_route('GET', '/domains/(?P<domain_id>[^/]+)')
+    def get_domain(self, request, domain_id):
+        domain = self.store.get('domains', domain_id)
+        self.enforce(
+            request, 'identity:get_domain', {'target': {'domain': domain}})
+        return {'domain': self._ref(request, 'domains', domain)}
+
+    # Projects
+
+    @_route('GET', '/projects')
+    def list_projects(self, request):
+        filters = self._filters(request, ('name', 'domain_id'))
+        self.enforce(request, 'identity:list_projects', filters)
+        return self._collection(
+            request, 'projects', self.store.list('projects', **filters))
+
+    @_route('POST', '/projects')
+    def create_project(self, request):
+        project = request.json.get('project', {})
+        project.setdefault('domain_id', 'default')
+        self.enforce(request, 'identity:create_project', {'project': project})
+        project = self.store.create('projects', project)
+        return 201, {'project': self._ref(request, 'projects', project)}
+
+    @_route('GET', '/projects/(?P<project_id>[^/]+)')
+    def get_project(self, request, project_id):
+        project = self.store.get('projects', project_id)
+        self.enforce(
+            request, 'identity:get_project', {'target': {'project': project}})
+        return {'project': self._ref(request, 'projects', project)}
+
+    @_route('PATCH', '/projects/(?P<project_id>[^/]+)')
+    def update_project(self, request, project_id):
+        project = self.store.get('projects', project_id)
+        body = request.json.get('project', {})
+        self.enforce(request, 'identity:update_project', {
+            'target': {'project': project},
+            'project': body,
+        })
+        project = self.store.update('projects', project_id, body)
+        return {'project': self._ref(request, 'projects', project)}
+
+    @_route('DELETE', '/projects/(?P<project_id>[^/]+)')
+    def delete_project(self, request, project_id):
+        project = self.store.get('projects', project_id)
+        self.enforce(
+            request, 'identity:delete_project',
+            {'target': {'project': project}})
+        self.store.delete('projects', project_id)
+
+    # Users
+
+    @_route('GET', '/users')
+    def list_users(self, request):
+        filters = self._filters(request, ('name', 'domain_id'))
+        self.enforce(request, 'identity:list_users', filters)
+        return self._collection(
+            request, 'users', self.store.list('users', **filters))
+
+    @_route('POST', '/users')
+    def create_user(self, request):
+        user = request.json.get('user', {})
+        user.setdefault('domain_id', 'default')
+        self.enforce(request, 'identity:create_user', {'user': user})
+        user = self.store.create('users', user)
+        return 201, {'user': self._ref(request, 'users', user)}
+
+    @_route('GET', '/users/(?P<user_id>[^/]+)')
+    def get_user(self, request, user_id):
+        user = self.store.get('users', user_id)
+        self.enforce(request, 'identity:get_user', {'target': {'user': user}})
+        return {'user': self._ref(request, 'users', user)}
+
+    @_route('PATCH', '/users/(?P<user_id>[^/]+)')
+    def update_user(self, request, user_id):
+        user = self.store.get('users', user_id)
+        body = request.json.get('user', {})
+        self.enforce(request, 'identity:update_user', {
+            'target': {'user': user},
+            'user': body,
+        })
+        user = self.store.update('users', user_id, body)
+        return {'user': self._ref(request, 'users', user)}
+
+    @_route('DELETE', '/users/(?P<user_id>[^/]+)')
+    def delete_user(self, request, user_id):
+        user = self.store.get('users', user_id)
+        self.enforce(
+            request, 'identity:delete_user', {'target': {'user': user}})
+        self.store.delete('users', user_id)
+
+    @_route('GET', '/users/(?P<user_id>[^/]+)/projects')
+    def list_user_projects(self, request, user_id):
+        self.enforce(
+            request, 'identity:list_user_projects', {'user_id': user_id})
+        return self._collection(
+            request, 'projects', self._user_projects(user_id))
+
+    def _user_projects(self, user_id):
+        project_ids = sorted(set(
+            project_id for project_id, _, _ in
+            self.store.role_assignments(user_id=user_id)
+        ))
+        return [self.store.get('projects', p) for p in project_ids]
+
+    # Roles
+
+    @_route('GET', '/roles')
+    def list_roles(self, request):
+        filters = self._filters(request, ('name',))
+        self.enforce(request, 'identity:list_roles', filters)
+        return self._collection(
+            request, 'roles', self.store.list('roles', **filters))
+
+    @_route('POST', '/roles')
+    def create_role(self, request):
+        role = request.json.get('role', {})
+        self.enforce(request, 'identity:create_role', {'role': role})
+        role = self.store.create('roles', role)
+        return 201, {'role': self._ref(request, 'roles', role)}
+
+    @_route('GET', '/roles/(?P<role_id>[^/]+)')
+    def get_role(self, request, role_id):
+        role = self.store.get('roles', role_id)
+        self.enforce(request, 'identity:get_role', {'target': {'role': role}})
+        return {'role': self._ref(request, 'roles', role)}
+
+    @_route('DELETE', '/roles/(?P<role_id>[^/]+)')
+    def delete_role(self, request, role_id):
+        role = self.store.get('roles', role_id)
+        self.enforce(
+            request, 'identity:delete_role', {'target': {'role': role}})
+        self.store.delete('roles', role_id)
+
+    # Grants
+
+    def _grant_target(self, project_id, user_id, role_id=None):
+        target = {
+            'project': self.store.get('projects', project_id),
+            'user': self.store.get('users', user_id),
+        }
+        if role_id is not None:
+            target['role'] = self.store.get('roles', role_id)
+        return {'target': target}
+
+    @_route(
+        'GET',
+        '/projects/(?P<project_id>[^/]+)/users/(?P<user_id>[^/]+)/roles')
+    def list_grants(self, request, project_id, user_id):
+        self.enforce(
+            request, 'identity:list_grants',
+            self._grant_target(project_id, user_id))
+        return self._collection(
+            request, 'roles', self.store.roles_of(user_id, project_id))
+
+    @_route(
+        'PUT',
+        '/projects/(?P<project_id>[^/]+)/users/(?P<user_id>[^/]+)'
+        '/roles/(?P<role_id>[^/]+)')
+    def create_grant(self, request, project_id, user_id, role_id):
+        self.enforce(
+            request, 'identity:create_grant',
+            self._grant_target(project_id, user_id, role_id))
+        self.store.grant(project_id, user_id, role_id)
+
+    @_route(
+        'GET',
+        '/projects/(?P<project_id>[^/]+)/users/(?P<user_id>[^/]+)'
+        '/roles/(?P<role_id>[^/]+)')
+    def check_grant(self, request, project_id, user_id, role_id):
+        self.enforce(
+            request, 'identity:check_grant',
+            self._grant_target(project_id, user_id, role_id))
+        if not self.store.role_assignments(project_id, user_id, role_id):
+            raise store.NotFound('grant', role_id)
+
+    @_route(
+        'DELETE',
+        '/projects/(?P<project_id>[^/]+)/users/(?P<user_id>[^/]+)'
+        '/roles/(?P<role_id>[^/]+)')
+    def revoke_grant(self, request, project_id, user_id, role_id):
+        self.enforce(
+            request, 'identity:revoke_grant',
+            self._grant_target(project_id, user_id, role_id))
+        self.store.revoke(project_id, user_id, role_id)
+
+    @_route('GET', '/role_assignments')
+    def list_role_assignments(self, request):
+        filters = self._filters(
+            request, ('scope.project.id', 'user.id', 'role.id'))
+        self.enforce(request, 'identity:list_role_assignments', filters)
+        assignments = self.store.role_assignments(
+            project_id=filters.get('scope.project.id'),
+            user_id=filters.get('user.id'),
+            role_id=filters.get('role.id'),
+        )
+        include_names = request.params.get('include_names', '').lower() in (
+            'true', '1')
+
+        def ref(kind, resource_id):
+            ref = {'id': resource_id}
+            if include_names:
+                ref['name'] = self.store.get(kind, resource_id)['name']
+            return ref
+
+        return {
+            'role_assignments': [
+                {
+                    'scope': {'project': ref('projects', project_id)},
+                    'user': ref('users', user_id),
+                    'role': ref('roles', role_id),
+                    'links': {'assignment': '{}/v3/projects/{}/users/{}'
+                              '/roles/{}'.format(request.base_url,
+                                                 project_id, user_id,
+                                                 role_id)},
+                }
+                for project_id, user_id, role_id in assignments
+            ],
+            'links': {
+                'self': '{}{}'.format(request.base_url, request.path),
+                'previous': None,
+                'next': None,
+            },
+        }
@@ -0,0 +1,47 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from kpr.fake import app
+from kpr.fake import server
+from kpr.fake import store
+from kpr.utils import clients
+
+_lock = threading.Lock()
+_store = None
+
+
+def start(policy=None):
+    """Serve a fake Keystone from this process and return its store.
+
+    The first call starts the server on a free port and points
+    ``clients.OS_AUTH_URL`` at it; later calls return the same store.
+    Each test process gets its own fake, so rolling its store back never
+    undoes the work of another test worker.
+    """
+    global _store
+    with _lock:
+        if _store is None:
+            data = store.Store()
+            data.bootstrap(
+                username=clients.OS_USERNAME,
+                password=clients.OS_PASSWORD,
+                project_name=clients.OS_PROJECT_NAME,
+            )
+            fake = server.start(app.Application(
+                policy or clients.KPR_FAKE_KEYSTONE, data))
+            clients.OS_AUTH_URL = server.url(fake) + '/v3'
+            clients.reset_admin_client()
+            _store = data
+        return _store
@@ -0,0 +1,116 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import socketserver
+import sys
+import threading
+from wsgiref import simple_server
+
+from keystoneauth1.identity import v3
+from keystoneauth1 import session
+from keystoneclient.v3 import client as keystoneclient
+
+from kpr.fake import app
+from kpr.fake import store
+from kpr.utils import clients
+
+
+class _Server(socketserver.ThreadingMixIn, simple_server.WSGIServer):
+    daemon_threads = True
+
+
+class _Handler(simple_server.WSGIRequestHandler):
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super(_Handler, self).log_message(format, *args)
+
+
+def make_server(application, host='127.0.0.1', port=0, verbose=False):
+    """Return a threaded HTTP server for ``application``.
+
+    Port 0 picks a free port; the chosen one is ``server.server_port``.
+    """
+    server = simple_server.make_server(
+        host, port, application,
+        server_class=_Server, handler_class=_Handler)
+    server.verbose = verbose
+    return server
+
+
+def start(application, host='127.0.0.1', port=0):
+    """Serve ``application`` from a daemon thread and return the server.
+
+    Stop it with ``server.shutdown()``.
+    """
+    server = make_server(application, host, port)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    return server
+
+
+def url(server):
+    host, port = server.server_address[:2]
+    return 'http://{}:{}'.format(host, port)
+
+
+def client(server, username='admin', project_name='admin',
+           password='openstack'):
+    """Return a keystoneclient of ``username`` talking to ``server``.
+
+    The defaults are the cloud admin created by ``Store.bootstrap``.
+    """
+    auth = v3.Password(
+        auth_url=url(server) + '/v3',
+        username=username,
+        project_name=project_name,
+        password=password,
+        user_domain_id='default',
+        project_domain_id='default',
+    )
+    return keystoneclient.Client(session=session.Session(auth=auth))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Run a local fake Keystone enforcing a policy file.')
+    arg_parser.add_argument(
+        '--policy', default='policy.project-admin.json',
+        help='policy.json file to enforce')
+    arg_parser.add_argument('--host', default='127.0.0.1')
+    arg_parser.add_argument('--port', type=int, default=5000)
+    arg_parser.add_argument('--verbose', action='store_true')
+    args = arg_parser.parse_args(argv)
+
+    data = store.Store()
+    data.bootstrap(
+        username=clients.OS_USERNAME,
+        password=clients.OS_PASSWORD,
+        project_name=clients.OS_PROJECT_NAME,
+    )
+    server = make_server(
+        app.Application(args.policy, data),
+        args.host, args.port, verbose=args.verbose)
+    print('Fake Keystone listening on {}/v3'.format(url(server)))
+    sys.stdout.flush()
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
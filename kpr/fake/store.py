@@ -0,0 +1,304 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import datetime
+import threading
+import uuid
+
+# Lifetime of the tokens issued by the fake, like Keystone's default.
+TOKEN_LIFETIME = datetime.timedelta(hours=1)
+
+DEFAULT_ROLES = (
+    'admin',
+    'Member',
+    'admin_auditor',
+    'project_admin',
+    'project_auditor',
+)
+
+
+class NotFound(Exception):
+
+    def __init__(self, kind, resource_id):
+        super(NotFound, self).__init__(
+            'Could not find {}: {}.'.format(kind, resource_id))
+
+
+class Conflict(Exception):
+    pass
+
+
+class Unauthorized(Exception):
+    pass
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+class Store(object):
+    """In-memory identity data of the fake Keystone.
+
+    Resources are plain dicts keyed by id, grouped by kind ('domains',
+    'projects', 'users', 'roles'). Role assignments are (project id, user
+    id, role id) tuples kept as the keys of a dict. Every method takes the
+    store lock, so the store can be shared by the threads of the WSGI
+    server.
+
+    Once ``snapshot`` has been called, every change is recorded in an
+    undo journal and ``rollback`` reverts to a snapshot by undoing the
+    changes made since, so its cost only depends on what changed. Stored
+    resource dicts are never modified in place, which lets the journal
+    keep references instead of copies. Tokens are not journaled: they
+    stay valid as long as their user still has a role on the project.
+    """
+
+    # Attributes whose value must be unique per domain (or globally for
+    # roles).
+    UNIQUE = {
+        'domains': ('name',),
+        'projects': ('domain_id', 'name'),
+        'roles': ('name',),
+        'users': ('domain_id', 'name'),
+    }
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.resources = dict((kind, {}) for kind in self.UNIQUE)
+        self.passwords = {}
+        self.assignments = {}
+        self.tokens = {}
+        self.journal = None
+
+    def snapshot(self):
+        """Return a mark that ``rollback`` can later restore."""
+        with self.lock:
+            if self.journal is None:
+                self.journal = []
+            return len(self.journal)
+
+    def rollback(self, mark):
+        """Undo every change made since ``snapshot`` returned ``mark``."""
+        with self.lock:
+            while len(self.journal) > mark:
+                table, key, value, existed = self.journal.pop()
+                if existed:
+                    table[key] = value
+                else:
+                    table.pop(key, None)
+
+    def _set(self, table, key, value):
+        self._record(table, key)
+        table[key] = value
+
+    def _pop(self, table, key):
+        self._record(table, key)
+        return table.pop(key, None)
+
+    def _record(self, table, key):
+        if self.journal is not None:
+            self.journal.append((table, key, table.get(key), key in table))
+
+    def bootstrap(
+        self,
+        username='admin',
+        password='openstack',
+        project_name='admin',
+        roles=DEFAULT_ROLES,
+    ):
+        """Create the default domain, roles and the cloud admin."""
+        with self.lock:
+            self.create('domains', {
+                'id': 'default',
+                'name': 'Default',
+                'description': 'The default domain',
+            })
+            for name in roles:
+                self.create('roles', {'name': name})
+            project = self.create('projects', {
+                'name': project_name,
+                'domain_id': 'default',
+            })
+            user = self.create('users', {
+                'name': username,
+                'domain_id': 'default',
+                'default_project_id': project['id'],
+                'password': password,
+            })
+            admin_role = self.find('roles', 'admin')
+            self.grant(project['id'], user['id'], admin_role['id'])
+
+    def create(self, kind, attributes):
+        with self.lock:
+            resource = dict(attributes)
+            resource.setdefault('id', new_id())
+            password = resource.pop('password', None)
+            if kind in ('domains', 'projects', 'users'):
+                resource.setdefault('enabled', True)
+            if kind == 'projects':
+                resource.setdefault('description', '')
+                resource.setdefault('is_domain', False)
+                resource.setdefault('parent_id', resource.get('domain_id'))
+                resource.setdefault('tags', [])
+            if kind == 'users':
+                resource.setdefault('options', {})
+                resource.setdefault('password_expires_at', None)
+            if kind == 'roles':
+                resource.setdefault('domain_id', None)
+            self._check_unique(kind, resource)
+            if kind == 'users':
+                self._set(self.passwords, resource['id'], password)
+            self._set(self.resources[kind], resource['id'], resource)
+            return copy.deepcopy(resource)
+
+    def get(self, kind, resource_id):
+        with self.lock:
+            try:
+                return copy.deepcopy(self.resources[kind][resource_id])
+            except KeyError:
+                raise NotFound(kind[:-1], resource_id)
+
+    def find(self, kind, name, domain_id=None):
+        """Return the resource with the given name."""
+        with self.lock:
+            for resource in self.resources[kind].values():
+                if resource.get('name') != name:
+                    continue
+                if domain_id is None or resource.get('domain_id') == domain_id:
+                    return copy.deepcopy(resource)
+            raise NotFound(kind[:-1], name)
+
+    def list(self, kind, **filters):
+        with self.lock:
+            return [
+                copy.deepcopy(r) for r in self.resources[kind].values()
+                if all(r.get(k) == v for k, v in filters.items())
+            ]
+
+    def update(self, kind, resource_id, attributes):
+        with self.lock:
+            resource = dict(self.resources[kind].get(resource_id) or {})
+            if not resource:
+                raise NotFound(kind[:-1], resource_id)
+            attributes = dict(attributes)
+            attributes.pop('id', None)
+            if kind == 'users' and 'password' in attributes:
+                self._set(
+                    self.passwords, resource_id, attributes.pop('password'))
+            resource.update(attributes)
+            self._check_unique(kind, resource)
+            self._set(self.resources[kind], resource_id, resource)
+            return copy.deepcopy(resource)
+
+    def delete(self, kind, resource_id):
+        with self.lock:
+            if resource_id not in self.resources[kind]:
+                raise NotFound(kind[:-1], resource_id)
+            self._pop(self.resources[kind], resource_id)
+            position = {'projects': 0, 'users': 1, 'roles': 2}.get(kind)
+            if position is not None:
+                for assignment in list(self.assignments):
+                    if assignment[position] == resource_id:
+                        self._pop(self.assignments, assignment)
+            if kind == 'users':
+                self._pop(self.passwords, resource_id)
+
+    def grant(self, project_id, user_id, role_id):
+        with self.lock:
+            self.get('projects', project_id)
+            self.get('users', user_id)
+            self.get('roles', role_id)
+            self._set(self.assignments, (project_id, user_id, role_id), True)
+
+    def revoke(self, project_id, user_id, role_id):
+        with self.lock:
+            assignment = (project_id, user_id, role_id)
+            if assignment not in self.assignments:
+                raise NotFound(
+                    'grant', '{}/{}/{}'.format(project_id, user_id, role_id))
+            self._pop(self.assignments, assignment)
+
+    def role_assignments(self, project_id=None, user_id=None, role_id=None):
+        with self.lock:
+            return sorted(
+                a for a in self.assignments
+                if project_id in (None, a[0]) and
+                user_id in (None, a[1]) and
+                role_id in (None, a[2])
+            )
+
+    def roles_of(self, user_id, project_id):
+        with self.lock:
+            return [
+                self.get('roles', role_id)
+                for _, _, role_id in self.role_assignments(project_id, user_id)
+            ]
+
+    def authenticate(self, user_id, password, project_id):
+        """Check a password and issue a project scoped token."""
+        with self.lock:
+            user = self.resources['users'].get(user_id)
+            if (user is None or not user['enabled'] or
+                    self.passwords.get(user_id) != password):
+                raise Unauthorized('The request you have made requires '
+                                   'authentication.')
+            return self.issue_token(user_id, project_id)
+
+    def issue_token(self, user_id, project_id):
+        with self.lock:
+            if not self.roles_of(user_id, project_id):
+                raise Unauthorized(
+                    'User {} has no access to project {}'.format(
+                        user_id, project_id))
+            now = datetime.datetime.utcnow()
+            token = {
+                'id': new_id(),
+                'user_id': user_id,
+                'project_id': project_id,
+                'issued_at': now,
+                'expires_at': now + TOKEN_LIFETIME,
+                'audit_id': new_id()[:22],
+            }
+            self.tokens[token['id']] = token
+            return dict(token)
+
+    def validate_token(self, token_id):
+        """Return a token, checking it still grants access like Keystone.
+
+        Roles are not frozen into the token: they are looked up on every
+        request, which matches Keystone revoking the tokens of a user
+        whose assignments changed.
+        """
+        with self.lock:
+            token = self.tokens.get(token_id)
+            if (token is None or
+                    token['expires_at'] < datetime.datetime.utcnow()):
+                self.tokens.pop(token_id, None)
+                raise Unauthorized('The request you have made requires '
+                                   'authentication.')
+            if not self.roles_of(token['user_id'], token['project_id']):
+                raise Unauthorized('The request you have made requires '
+                                   'authentication.')
+            return dict(token)
+
+    def _check_unique(self, kind, resource):
+        fields = self.UNIQUE[kind]
+        key = tuple(resource.get(f) for f in fields)
+        for other in self.resources[kind].values():
+            if other['id'] == resource['id']:
+                continue
+            if tuple(other.get(f) for f in fields) == key:
+                raise Conflict(
+                    'Duplicate entry found with name {}.'.format(
+                        resource.get('name')))
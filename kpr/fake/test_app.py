@@ -0,0 +1,106 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+from keystoneauth1.exceptions import http
+
+from kpr.fake import app
+from kpr.fake import server
+
+POLICY = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'policy.project-admin.json')
+
+
+class TestFakeKeystone(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestFakeKeystone, cls).setUpClass()
+        cls.server = server.start(app.Application(POLICY))
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestFakeKeystone, cls).tearDownClass()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def client(self, username='admin', project_name='admin'):
+        return server.client(self.server, username, project_name)
+
+    def setUp(self):
+        super(TestFakeKeystone, self).setUp()
+        self.admin = self.client()
+        roles = dict((r.name, r) for r in self.admin.roles.list())
+        self.project1 = self.admin.projects.create('project1', 'default')
+        self.project2 = self.admin.projects.create('project2', 'default')
+        self.addCleanup(self.admin.projects.delete, self.project1)
+        self.addCleanup(self.admin.projects.delete, self.project2)
+        self.project1_admin = self.create_user(
+            'project1_admin', self.project1, roles['project_admin'])
+        self.project1_user = self.create_user(
+            'project1_user', self.project1, roles['Member'])
+        self.project2_user = self.create_user(
+            'project2_user', self.project2, roles['Member'])
+
+    def create_user(self, name, project, role):
+        user = self.admin.users.create(
+            name, domain='default', default_project=project,
+            password='openstack')
+        self.addCleanup(self.admin.users.delete, user)
+        self.admin.roles.grant(role, user=user, project=project)
+        return user
+
+    def test_bad_password_is_rejected(self):
+        admin = server.client(self.server, password='wrong')
+        self.assertRaises(http.Unauthorized, admin.session.get_token)
+
+    # ポリシーで許可されていない操作は 403 になる。
+    def test_policy_is_enforced(self):
+        project_admin = self.client('project1_admin', 'project1')
+        self.assertEqual(
+            self.project1_user.id,
+            project_admin.users.get(self.project1_user.id).id,
+        )
+        self.assertRaises(
+            http.Forbidden, project_admin.users.get, self.project2_user.id)
+        self.assertRaises(http.Forbidden, project_admin.users.list)
+
+    def test_role_assignments(self):
+        assignments = self.admin.role_assignments.list(
+            project=self.project1.id)
+        self.assertEqual(
+            set([self.project1_admin.id, self.project1_user.id]),
+            set(a.user['id'] for a in assignments),
+        )
+
+    def test_role_assignments_with_names(self):
+        assignments = self.admin.role_assignments.list(
+            project=self.project2.id, include_names=True)
+        self.assertEqual(
+            [('project2', 'project2_user', 'Member')],
+            [(a.scope['project']['name'], a.user['name'], a.role['name'])
+             for a in assignments],
+        )
+
+    # ロールを失ったユーザのトークンは使えなくなる。
+    def test_revoked_user_loses_access(self):
+        user = self.client('project1_user', 'project1')
+        self.assertEqual(
+            self.project1_user.id, user.users.get(self.project1_user.id).id)
+        self.admin.roles.revoke(
+            self.admin.roles.find(name='Member'),
+            user=self.project1_user, project=self.project1)
+        self.assertRaises(
+            http.Unauthorized, user.users.get, self.project1_user.id)
@@ -0,0 +1,86 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import copy
+import unittest
+
+from kpr.fake import store
+
+
+class TestStoreSnapshot(unittest.TestCase):
+
+    def setUp(self):
+        super(TestStoreSnapshot, self).setUp()
+        self.store = store.Store()
+        self.store.bootstrap()
+        self.member = self.store.find('roles', 'Member')
+        self.project = self.store.create(
+            'projects', {'name': 'project1', 'domain_id': 'default'})
+        self.user = self.store.create('users', {
+            'name': 'user1',
+            'domain_id': 'default',
+            'password': 'secret',
+        })
+        self.store.grant(
+            self.project['id'], self.user['id'], self.member['id'])
+
+    def state(self):
+        return copy.deepcopy(
+            (self.store.resources, self.store.passwords,
+             self.store.assignments))
+
+    # ロールバックでスナップショット後の変更が全て取り消される。
+    def test_rollback_restores_snapshot(self):
+        expected = self.state()
+        mark = self.store.snapshot()
+
+        self.store.update('users', self.user['id'], {
+            'email': 'user1@example.com',
+            'password': 'changed',
+        })
+        self.store.create('users', {'name': 'user2', 'domain_id': 'default'})
+        self.store.delete('projects', self.project['id'])
+        self.store.rollback(mark)
+
+        self.assertEqual(expected, self.state())
+        token = self.store.authenticate(
+            self.user['id'], 'secret', self.project['id'])
+        self.assertEqual(self.user['id'], token['user_id'])
+
+    def test_nested_snapshots(self):
+        outer = self.store.snapshot()
+        self.store.revoke(
+            self.project['id'], self.user['id'], self.member['id'])
+        inner = self.store.snapshot()
+        self.store.delete('users', self.user['id'])
+
+        self.store.rollback(inner)
+        self.assertEqual([], self.store.role_assignments(
+            project_id=self.project['id']))
+        self.assertEqual('user1', self.store.get('users', self.user['id'])[
+            'name'])
+        self.store.rollback(outer)
+        self.assertEqual(1, len(self.store.role_assignments(
+            project_id=self.project['id'])))
+
+    # 削除されたユーザのトークンはロールバック後に再び使える。
+    def test_token_survives_rollback(self):
+        token = self.store.authenticate(
+            self.user['id'], 'secret', self.project['id'])
+        mark = self.store.snapshot()
+        self.store.delete('users', self.user['id'])
+        self.assertRaises(
+            store.Unauthorized, self.store.validate_token, token['id'])
+        self.store.rollback(mark)
+        self.assertEqual(
+            token['id'], self.store.validate_token(token['id'])['id'])
@@ -0,0 +1,173 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import ast
+
+
+class BaseCheck(object):
+    """A node of a parsed policy rule.
+
+    Calling a check with ``(target, creds, enforcer)`` returns whether it
+    passes. ``target`` is a flat dict keyed by dotted names such as
+    ``target.user.default_project_id``; ``creds`` is the credential dict
+    of the caller.
+    """
+
+    def __call__(self, target, creds, enforcer):
+        raise NotImplementedError()
+
+
+class TrueCheck(BaseCheck):
+
+    def __str__(self):
+        return '@'
+
+    def __call__(self, target, creds, enforcer):
+        return True
+
+
+class FalseCheck(BaseCheck):
+
+    def __str__(self):
+        return '!'
+
+    def __call__(self, target, creds, enforcer):
+        return False
+
+
+class Check(BaseCheck):
+    """A ``kind:match`` check."""
+
+    def __init__(self, kind, match):
+        self.kind = kind
+        self.match = match
+
+    def __str__(self):
+        return '{}:{}'.format(self.kind, self.match)
+
+    def expand(self, target):
+        """Return ``match`` with target substitutions, or None."""
+        try:
+            return self.match % target
+        except (KeyError, TypeError, ValueError):
+            return None
+
+
+class RuleCheck(Check):
+
+    def __call__(self, target, creds, enforcer):
+        rule = enforcer.rules.get(self.match)
+        if rule is None:
+            return False
+        return rule(target, creds, enforcer)
+
+
+class RoleCheck(Check):
+
+    def __call__(self, target, creds, enforcer):
+        match = self.expand(target)
+        if match is None:
+            return False
+        return match.lower() in [r.lower() for r in creds.get('roles', [])]
+
+
+class GenericCheck(Check):
+    """``key:%(target.attribute)s`` or ``'literal':%(target.attribute)s``.
+
+    The left side is either a Python literal or a (dotted) credential
+    name; the check passes when it equals the expanded right side.
+    """
+
+    def __init__(self, kind, match):
+        super(GenericCheck, self).__init__(kind, match)
+        try:
+            self.literal = (ast.literal_eval(kind),)
+        except (ValueError, SyntaxError):
+            self.literal = None
+
+    def __call__(self, target, creds, enforcer):
+        match = self.expand(target)
+        if match is None:
+            return False
+
+        if self.literal is not None:
+            value = self.literal[0]
+        else:
+            value = credential(creds, self.kind)
+            if value is None:
+                return False
+        if isinstance(value, (list, tuple)):
+            return match in [str(v) for v in value]
+        return match == str(value)
+
+
+class NotCheck(BaseCheck):
+
+    def __init__(self, rule):
+        self.rule = rule
+
+    def __str__(self):
+        return 'not {}'.format(self.rule)
+
+    def __call__(self, target, creds, enforcer):
+        return not self.rule(target, creds, enforcer)
+
+
+class AndCheck(BaseCheck):
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def __str__(self):
+        return '({})'.format(' and '.join(str(r) for r in self.rules))
+
+    def __call__(self, target, creds, enforcer):
+        for rule in self.rules:
+            if not rule(target, creds, enforcer):
+                return False
+        return True
+
+
+class OrCheck(BaseCheck):
+
+    def __init__(self, rules):
+        self.rules = rules
+
+    def __str__(self):
+        return '({})'.format(' or '.join(str(r) for r in self.rules))
+
+    def __call__(self, target, creds, enforcer):
+        for rule in self.rules:
+            if rule(target, creds, enforcer):
+                return True
+        return False
+
+
+def credential(creds, name):
+    """Look up ``name`` in ``creds``, following dots into nested dicts."""
+    if name in creds:
+        return creds[name]
+    value = creds
+    for part in name.split('.'):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    return value
+
+
+def get_check(kind, match):
+    if kind == 'rule':
+        return RuleCheck(kind, match)
+    if kind == 'role':
+        return RoleCheck(kind, match)
+    return GenericCheck(kind, match)
@@ -0,0 +1,294 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import itertools
+import json
+
+from kpr.policy import checks
+from kpr.policy import enforcer
+from kpr.policy import parser
+
+
+class CompileError(ValueError):
+    pass
+
+
+class Node(object):
+    """A node of the compiled evaluation DAG.
+
+    ``kind`` is 'true', 'false', 'check', 'and', 'or' or 'not'. Nodes are
+    interned by ``key``, their canonical form, so a subexpression shared
+    by several rules is a single node. ``target_free`` nodes only depend
+    on the credentials and are memoized per credential set.
+    """
+
+    __slots__ = ('serial', 'key', 'kind', 'children', 'check', 'target_free')
+
+    def __init__(self, serial, key, kind, children=(), check=None):
+        self.serial = serial
+        self.key = key
+        self.kind = kind
+        self.children = tuple(children)
+        self.check = check
+        if kind == 'check':
+            self.target_free = '%(' not in check.match
+        else:
+            self.target_free = all(c.target_free for c in self.children)
+
+    def __str__(self):
+        return self.key
+
+    def evaluate(self, target, creds, memo):
+        if self.target_free:
+            try:
+                return memo[self.serial]
+            except KeyError:
+                pass
+
+        kind = self.kind
+        if kind == 'check':
+            result = self.check(target, creds, None)
+        elif kind == 'and':
+            result = True
+            for child in self.children:
+                if not child.evaluate(target, creds, memo):
+                    result = False
+                    break
+        elif kind == 'or':
+            result = False
+            for child in self.children:
+                if child.evaluate(target, creds, memo):
+                    result = True
+                    break
+        elif kind == 'not':
+            result = not self.children[0].evaluate(target, creds, memo)
+        else:
+            result = kind == 'true'
+
+        if self.target_free:
+            memo[self.serial] = result
+        return result
+
+
+def _rule_references(check):
+    if isinstance(check, checks.RuleCheck):
+        return set([check.match])
+    references = set()
+    for child in getattr(check, 'rules', ()):
+        references |= _rule_references(child)
+    if isinstance(check, checks.NotCheck):
+        references |= _rule_references(check.rule)
+    return references
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return tuple(sorted(_freeze(v) for v in value))
+    return value
+
+
+class Decider(object):
+    """Decisions of a ``CompiledPolicy`` for one credential set.
+
+    Reusing a Decider for a persona skips computing its memo key, so a
+    credential-only decision made before costs a dict lookup.
+    """
+
+    def __init__(self, policy, creds, memo):
+        self.policy = policy
+        self.creds = creds
+        self.memo = memo
+
+    def enforce(self, rule, target):
+        policy = self.policy
+        node = policy.rules.get(rule)
+        if node is None:
+            node = policy.rules.get(policy.default_rule)
+            if node is None:
+                return False
+        if node.target_free:
+            return node.evaluate(target, self.creds, self.memo)
+        return node.evaluate(
+            enforcer.flatten(target), self.creds, self.memo)
+
+
+class CompiledPolicy(object):
+    """A policy file compiled once into a deduplicated evaluation DAG.
+
+    Named rules are inlined, identical subexpressions share one node and
+    the results of credential-only subexpressions (such as
+    ``rule:admin_required``) are cached per credential set, so deciding
+    the same thing twice for a persona costs one lookup. ``update``
+    recompiles only the rules whose text changed and the rules that
+    reference them.
+    """
+
+    def __init__(self, rules, default_rule=enforcer.DEFAULT_RULE):
+        self.default_rule = default_rule
+        self.texts = {}
+        self.parsed = {}
+        self.rules = {}
+        self._nodes = {}
+        self._serials = itertools.count()
+        self._memo = {}
+        self.update(rules)
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def update(self, rules):
+        """Replace the rule texts and recompile what changed.
+
+        Returns the names of the rules that were recompiled.
+        """
+        changed = set(
+            name for name in set(rules) | set(self.texts)
+            if rules.get(name) != self.texts.get(name)
+        )
+        for name in changed:
+            if name in rules:
+                self.texts[name] = rules[name]
+                self.parsed[name] = parser.parse_rule(rules[name])
+            else:
+                del self.texts[name]
+                del self.parsed[name]
+                self.rules.pop(name, None)
+
+        dirty = set(changed)
+        dependents = self._dependents()
+        pending = list(changed)
+        while pending:
+            for name in dependents.get(pending.pop(), ()):
+                if name not in dirty:
+                    dirty.add(name)
+                    pending.append(name)
+
+        for name in dirty:
+            self.rules.pop(name, None)
+        for name in sorted(dirty):
+            if name in self.parsed:
+                self._compile_rule(name, ())
+
+        self._credential_names = tuple(sorted(set(
+            node.check.kind for node in self._nodes.values()
+            if node.kind == 'check' and node.target_free and
+            isinstance(node.check, checks.GenericCheck) and
+            node.check.literal is None
+        )))
+        # Nodes no longer reachable keep their serials, so clearing the
+        # memo is enough to never serve a result of a replaced node.
+        self._memo.clear()
+        return dirty & set(self.parsed)
+
+    def enforce(self, rule, target, creds):
+        """Same contract as ``Enforcer.enforce``."""
+        return self.bind(creds).enforce(rule, target)
+
+    def bind(self, creds):
+        """Return a ``Decider`` for one credential set."""
+        # Memoized nodes only read the roles and the credentials named by
+        # credential-only generic checks (e.g. is_admin:1).
+        key = (
+            frozenset(r.lower() for r in creds.get('roles', ())),
+            tuple(
+                _freeze(checks.credential(creds, name))
+                for name in self._credential_names
+            ),
+        )
+        memo = self._memo.get(key)
+        if memo is None:
+            memo = self._memo[key] = {}
+        return Decider(self, creds, memo)
+
+    def node_count(self):
+        return len(self._nodes)
+
+    def _dependents(self):
+        dependents = {}
+        for name, check in self.parsed.items():
+            for reference in _rule_references(check):
+                dependents.setdefault(reference, set()).add(name)
+        return dependents
+
+    def _compile_rule(self, name, stack):
+        if name in self.rules:
+            return self.rules[name]
+        if name not in self.parsed:
+            # oslo.policy treats a reference to an unknown rule as false.
+            return self._intern('false', '!')
+        if name in stack:
+            raise CompileError('Rule {} references itself through {}'.format(
+                name, ' -> '.join(stack)))
+        node = self._compile(self.parsed[name], stack + (name,))
+        self.rules[name] = node
+        return node
+
+    def _compile(self, check, stack):
+        if isinstance(check, checks.TrueCheck):
+            return self._intern('true', '@')
+        if isinstance(check, checks.FalseCheck):
+            return self._intern('false', '!')
+        if isinstance(check, checks.RuleCheck):
+            return self._compile_rule(check.match, stack)
+        if isinstance(check, checks.NotCheck):
+            child = self._compile(check.rule, stack)
+            if child.kind == 'not':
+                return child.children[0]
+            if child.kind in ('true', 'false'):
+                return self._constant(child.kind == 'false')
+            return self._intern('not', 'not {}'.format(child.key), [child])
+        if isinstance(check, (checks.AndCheck, checks.OrCheck)):
+            kind = 'and' if isinstance(check, checks.AndCheck) else 'or'
+            return self._combine(
+                kind, [self._compile(c, stack) for c in check.rules])
+        return self._intern('check', str(check), check=check)
+
+    def _combine(self, kind, children):
+        # The absorbing constant decides the whole expression, the neutral
+        # one can be dropped.
+        absorbing = 'false' if kind == 'and' else 'true'
+        neutral = 'true' if kind == 'and' else 'false'
+        flat = []
+        seen = set()
+        for child in children:
+            grandchildren = child.children if child.kind == kind else [child]
+            for node in grandchildren:
+                if node.kind == absorbing:
+                    return node
+                if node.kind == neutral or node.key in seen:
+                    continue
+                seen.add(node.key)
+                flat.append(node)
+        if not flat:
+            return self._constant(kind == 'and')
+        if len(flat) == 1:
+            return flat[0]
+        key = '({})'.format(
+            ' {} '.format(kind).join(sorted(n.key for n in flat)))
+        return self._intern(kind, key, flat)
+
+    def _constant(self, value):
+        if value:
+            return self._intern('true', '@')
+        return self._intern('false', '!')
+
+    def _intern(self, kind, key, children=(), check=None):
+        node = self._nodes.get(key)
+        if node is None:
+            node = Node(next(self._serials), key, kind, children, check)
+            self._nodes[key] = node
+        return node
@@ -0,0 +1,227 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import collections
+import json
+import sys
+
+from kpr.policy import checks
+from kpr.policy import compiler
+from kpr.policy import matrix
+
+# Rules with more distinct checks than this are not tabulated; they are
+# reported whenever they are written differently, without a witness.
+MAX_ATOMS = 16
+
+# What _witness returns for rules too large to tabulate.
+_UNTABULATED = object()
+
+# What a policy without the rule nor a default rule decides.
+_DENY = compiler.Node(-1, '!', 'false')
+
+Change = collections.namedtuple(
+    'Change', ['action', 'old', 'new', 'gained', 'lost', 'witness'])
+
+
+def atom(check):
+    """Return the canonical name of a check used as a truth table input."""
+    if isinstance(check, checks.RoleCheck) and '%(' not in check.match:
+        # Role names are compared case-insensitively.
+        return 'role:{}'.format(check.match.lower())
+    return str(check)
+
+
+def _atoms(node, found):
+    if node.kind == 'check':
+        found.add(atom(node.check))
+    for child in node.children:
+        _atoms(child, found)
+    return found
+
+
+def _column(index, size):
+    # Row r of the table assigns bit ``index`` of r to atom ``index``.
+    block = 1 << index
+    column = ((1 << block) - 1) << block
+    width = block * 2
+    while width < size:
+        column |= column << width
+        width *= 2
+    return column & ((1 << size) - 1)
+
+
+def truth_table(node, columns, size, memo=None):
+    """Return the truth table of ``node`` as an integer bit set.
+
+    ``columns`` maps atom names to their input columns. Bit r of the
+    result is the value of the rule on row r.
+    """
+    memo = {} if memo is None else memo
+    if node.serial in memo:
+        return memo[node.serial]
+
+    full = (1 << size) - 1
+    if node.kind == 'check':
+        result = columns[atom(node.check)]
+    elif node.kind == 'and':
+        result = full
+        for child in node.children:
+            result &= truth_table(child, columns, size, memo)
+    elif node.kind == 'or':
+        result = 0
+        for child in node.children:
+            result |= truth_table(child, columns, size, memo)
+    elif node.kind == 'not':
+        result = full ^ truth_table(node.children[0], columns, size, memo)
+    else:
+        result = full if node.kind == 'true' else 0
+
+    memo[node.serial] = result
+    return result
+
+
+def _rule(policy, action):
+    node = policy.rules.get(action, policy.rules.get(policy.default_rule))
+    return _DENY if node is None else node
+
+
+def _witness(old, new):
+    """Return an atom assignment on which ``old`` and ``new`` differ.
+
+    Returns None when the rules are equivalent, and ``_UNTABULATED`` when
+    they have too many atoms to tabulate.
+    """
+    if old.key == new.key:
+        return None
+    names = sorted(_atoms(old, set()) | _atoms(new, set()))
+    if len(names) > MAX_ATOMS:
+        return _UNTABULATED
+    size = 1 << len(names)
+    columns = dict(
+        (name, _column(i, size)) for i, name in enumerate(names))
+    differ = truth_table(old, columns, size) ^ truth_table(new, columns, size)
+    if not differ:
+        return None
+    row = (differ & -differ).bit_length() - 1
+    return collections.OrderedDict(
+        (name, bool(row >> i & 1)) for i, name in enumerate(names))
+
+
+def compare(old, new, actions=None, personas=None, targets=None):
+    """Compare two ``CompiledPolicy`` objects by meaning.
+
+    Every action whose rules are not logically equivalent is returned as
+    a ``Change``: ``gained`` and ``lost`` list the (persona, target)
+    pairs of the matrix that the new policy allows or denies, and
+    ``witness`` is an assignment of the rule's checks on which the two
+    rules disagree. A change with no gained or lost cell only shows up
+    for credentials or targets outside ``personas`` and ``targets``.
+
+    Rules with more than ``MAX_ATOMS`` checks are not proven equivalent:
+    they are returned whenever they are written differently, with a
+    ``witness`` of None.
+    """
+    if actions is None:
+        actions = sorted(
+            name for name in set(old.rules) | set(new.rules)
+            if name.startswith('identity:'))
+
+    changed = []
+    witnesses = {}
+    for action in actions:
+        witness = _witness(_rule(old, action), _rule(new, action))
+        if witness is not None:
+            changed.append(action)
+            witnesses[action] = None if witness is _UNTABULATED else witness
+    if not changed:
+        return []
+
+    before = matrix.compute(old, changed, personas, targets)
+    after = matrix.compute(new, changed, personas, targets)
+    changes = []
+    for a, action in enumerate(changed):
+        cells = []
+        for mask in (after.allowed[a] & ~before.allowed[a],
+                     before.allowed[a] & ~after.allowed[a]):
+            cells.append([
+                (before.personas[p], before.targets[t])
+                for p, t in zip(*mask.nonzero())
+            ])
+        changes.append(Change(
+            action,
+            old.texts.get(action),
+            new.texts.get(action),
+            cells[0],
+            cells[1],
+            witnesses[action],
+        ))
+    return changes
+
+
+def format_text(changes):
+    lines = []
+    for change in changes:
+        lines.append(change.action)
+        lines.append('  - {}'.format(change.old))
+        lines.append('  + {}'.format(change.new))
+        for sign, cells in (('+', change.gained), ('-', change.lost)):
+            for persona_name, target_name in cells:
+                lines.append('  {} {} -> {}'.format(
+                    sign, persona_name, target_name))
+        if change.witness is None:
+            lines.append('  not tabulated: more than {} checks'.format(
+                MAX_ATOMS))
+        elif not change.gained and not change.lost:
+            lines.append('  differs when {}'.format(', '.join(
+                '{}={}'.format(k, v) for k, v in change.witness.items())))
+    return ''.join(line + '\n' for line in lines)
+
+
+def format_json(changes):
+    return json.dumps([
+        collections.OrderedDict([
+            ('action', c.action),
+            ('old', c.old),
+            ('new', c.new),
+            ('gained', [list(cell) for cell in c.gained]),
+            ('lost', [list(cell) for cell in c.lost]),
+            ('witness', c.witness),
+        ])
+        for c in changes
+    ], indent=2)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Show the access changes between two Keystone policies.')
+    arg_parser.add_argument('old', help='old policy.json file')
+    arg_parser.add_argument('new', help='new policy.json file')
+    arg_parser.add_argument(
+        '--format', choices=['text', 'json'], default='text')
+    args = arg_parser.parse_args(argv)
+
+    changes = compare(
+        compiler.CompiledPolicy.from_file(args.old),
+        compiler.CompiledPolicy.from_file(args.new),
+    )
+    if args.format == 'text':
+        sys.stdout.write(format_text(changes))
+    else:
+        sys.stdout.write(format_json(changes) + '\n')
+    # Like diff(1): 1 when the policies differ.
+    return 1 if changes else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import json
+import sys
+
+from kpr.policy import parser
+
+DEFAULT_RULE = 'default'
+
+
+def flatten(target, prefix=''):
+    """Flatten nested dicts into dotted keys, as Keystone does for targets.
+
+    ``{'target': {'user': {'id': 'u1'}}}`` also yields the key
+    ``target.user.id``. Nested dicts are kept too, so both forms can be
+    used in substitutions.
+    """
+    flat = {}
+    for key, value in target.items():
+        name = '{}{}'.format(prefix, key)
+        flat[name] = value
+        if isinstance(value, dict):
+            flat.update(flatten(value, prefix=name + '.'))
+    return flat
+
+
+def credentials(
+    user_id,
+    project_id,
+    roles,
+    user_domain_id='default',
+    project_domain_id='default',
+):
+    """Build the credential dict Keystone checks a project token with."""
+    return {
+        'user_id': user_id,
+        'user_domain_id': user_domain_id,
+        'project_id': project_id,
+        'project_domain_id': project_domain_id,
+        'roles': list(roles),
+        'token': {
+            'user': {'id': user_id, 'domain': {'id': user_domain_id}},
+            'project': {'id': project_id, 'domain': {'id': project_domain_id}},
+        },
+    }
+
+
+class Enforcer(object):
+    """Evaluates the rules of a Keystone policy file without a cloud."""
+
+    def __init__(self, rules, default_rule=DEFAULT_RULE):
+        self.default_rule = default_rule
+        self.rules = dict(
+            (name, parser.parse_rule(text)) for name, text in rules.items()
+        )
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        with open(path) as f:
+            return cls(json.load(f), **kwargs)
+
+    def enforce(self, rule, target, creds):
+        """Return whether ``creds`` may perform ``rule`` on ``target``.
+
+        Like oslo.policy, an unknown rule falls back to the default rule.
+        """
+        check = self.rules.get(rule)
+        if check is None:
+            check = self.rules.get(self.default_rule)
+            if check is None:
+                return False
+        return check(flatten(target), creds, self)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Evaluate a Keystone policy rule offline.')
+    arg_parser.add_argument('policy', help='policy.json file')
+    arg_parser.add_argument('rule', help='e.g. identity:get_user')
+    arg_parser.add_argument(
+        '--creds', default='{}', help='credentials as JSON')
+    arg_parser.add_argument(
+        '--target', default='{}', help='target as JSON')
+    args = arg_parser.parse_args(argv)
+
+    enforcer = Enforcer.from_file(args.policy)
+    allowed = enforcer.enforce(
+        args.rule, json.loads(args.target), json.loads(args.creds))
+    print('allow' if allowed else 'deny')
+    return 0 if allowed else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,254 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import collections
+import csv
+import io
+import json
+import sys
+
+import numpy
+
+from kpr.policy import checks
+from kpr.policy import compiler
+from kpr.policy import enforcer
+
+
+def persona(user_id, project_id, roles):
+    return enforcer.credentials(user_id, project_id, roles)
+
+
+def target(user_id, project_id, role='Member', new_project_id=None):
+    """Build the target of an API call on ``user_id`` in ``project_id``.
+
+    It carries every attribute the identity rules substitute, so the same
+    target can be checked against any action. ``role`` is the role being
+    granted and ``new_project_id`` the default project requested for the
+    user (as in ``user create`` or ``user set --project``).
+    """
+    new_project_id = new_project_id or project_id
+    return {
+        'user_id': user_id,
+        'user': {
+            'default_project_id': new_project_id,
+            'domain_id': 'default',
+        },
+        'scope': {'project': {'id': project_id}},
+        'target': {
+            'user': {
+                'id': user_id,
+                'default_project_id': project_id,
+                'domain_id': 'default',
+            },
+            'project': {'id': project_id, 'domain_id': 'default'},
+            'role': {'name': role},
+            'domain': {'id': 'default'},
+            'token': {'user_id': user_id},
+            'credential': {'user_id': user_id},
+        },
+    }
+
+
+# The personas the functional suite provisions.
+PERSONAS = collections.OrderedDict([
+    ('cloud_admin', persona('admin', 'admin', ['admin'])),
+    ('admin_auditor', persona('admin_auditor', 'admin', ['admin_auditor'])),
+    ('project1_admin',
+     persona('project1_admin', 'project1', ['project_admin'])),
+    ('project1_auditor',
+     persona('project1_auditor', 'project1', ['project_auditor'])),
+    ('project1_user0', persona('project1_user0', 'project1', ['Member'])),
+    ('project1_admin_as_project2_member',
+     persona('project1_admin', 'project2', ['Member'])),
+    ('project1_auditor_as_project2_member',
+     persona('project1_auditor', 'project2', ['Member'])),
+    ('project2_admin',
+     persona('project2_admin', 'project2', ['project_admin'])),
+])
+
+TARGETS = collections.OrderedDict([
+    ('project1_admin', target('project1_admin', 'project1', 'project_admin')),
+    ('project1_user0', target('project1_user0', 'project1')),
+    ('project1_user0_to_project2',
+     target('project1_user0', 'project1', new_project_id='project2')),
+    ('project1_user0_as_admin',
+     target('project1_user0', 'project1', 'admin')),
+    ('project2_admin', target('project2_admin', 'project2', 'project_admin')),
+    ('project2_user0', target('project2_user0', 'project2')),
+])
+
+
+class PermissionMatrix(object):
+    """Allow/deny decisions of every action for every persona and target.
+
+    ``allowed`` is a boolean array indexed by (action, persona, target).
+    """
+
+    def __init__(self, actions, personas, targets, allowed):
+        self.actions = list(actions)
+        self.personas = list(personas)
+        self.targets = list(targets)
+        self.allowed = allowed
+
+    def rows(self):
+        for a, action in enumerate(self.actions):
+            for p, persona_name in enumerate(self.personas):
+                for t, target_name in enumerate(self.targets):
+                    yield (action, persona_name, target_name,
+                           bool(self.allowed[a, p, t]))
+
+    def to_csv(self):
+        output = io.StringIO()
+        writer = csv.writer(output, lineterminator='\n')
+        writer.writerow(['action', 'persona', 'target', 'allowed'])
+        for action, persona_name, target_name, allowed in self.rows():
+            writer.writerow([
+                action, persona_name, target_name,
+                'allow' if allowed else 'deny',
+            ])
+        return output.getvalue()
+
+    def to_dict(self):
+        table = collections.OrderedDict()
+        for action, persona_name, target_name, allowed in self.rows():
+            table.setdefault(action, collections.OrderedDict()).setdefault(
+                persona_name, collections.OrderedDict())[target_name] = allowed
+        return table
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class _Evaluator(object):
+    """Evaluates compiled nodes for all (persona, target) cells at once.
+
+    Every node becomes a (personas x targets) boolean array: role checks
+    are per-persona masks broadcast over the targets and attribute
+    checks compare integer-coded persona and target values.
+    """
+
+    def __init__(self, creds, targets):
+        self.creds = creds
+        self.targets = [enforcer.flatten(t) for t in targets]
+        self.shape = (len(creds), len(targets))
+        self.roles = [
+            set(r.lower() for r in c.get('roles', ())) for c in creds
+        ]
+        self.memo = {}
+
+    def evaluate(self, node):
+        result = self.memo.get(node.serial)
+        if result is not None:
+            return result
+
+        if node.kind == 'check':
+            result = self.check(node.check)
+        elif node.kind == 'and':
+            result = numpy.ones(self.shape, dtype=bool)
+            for child in node.children:
+                result = result & self.evaluate(child)
+        elif node.kind == 'or':
+            result = numpy.zeros(self.shape, dtype=bool)
+            for child in node.children:
+                result = result | self.evaluate(child)
+        elif node.kind == 'not':
+            result = ~self.evaluate(node.children[0])
+        else:
+            result = numpy.full(self.shape, node.kind == 'true', dtype=bool)
+
+        self.memo[node.serial] = result
+        return result
+
+    def check(self, check):
+        matches = [check.expand(t) for t in self.targets]
+
+        if isinstance(check, checks.RoleCheck):
+            result = numpy.zeros(self.shape, dtype=bool)
+            for match in set(m for m in matches if m is not None):
+                rows = numpy.array([match.lower() in r for r in self.roles])
+                columns = numpy.array([m == match for m in matches])
+                result |= numpy.outer(rows, columns)
+            return result
+
+        if check.literal is not None:
+            columns = numpy.array(
+                [m == str(check.literal[0]) for m in matches])
+            return numpy.broadcast_to(columns, self.shape).copy()
+
+        values = [checks.credential(c, check.kind) for c in self.creds]
+        if any(isinstance(v, (list, tuple)) for v in values):
+            # A credential holding several values matches any of them.
+            result = numpy.zeros(self.shape, dtype=bool)
+            for p, value in enumerate(values):
+                if value is None:
+                    continue
+                if not isinstance(value, (list, tuple)):
+                    value = [value]
+                items = set(str(v) for v in value)
+                result[p] = [m in items for m in matches]
+            return result
+
+        codes = {}
+        rows = numpy.array([
+            -1 if v is None else codes.setdefault(str(v), len(codes))
+            for v in values
+        ])
+        columns = numpy.array([
+            -2 if m is None else codes.get(m, -3) for m in matches
+        ])
+        return rows[:, None] == columns[None, :]
+
+
+def compute(policy, actions=None, personas=None, targets=None):
+    """Compute the permission matrix of a ``CompiledPolicy``.
+
+    ``actions`` defaults to every ``identity:*`` rule, ``personas`` and
+    ``targets`` (ordered name -> dict mappings) to ``PERSONAS`` and
+    ``TARGETS``.
+    """
+    personas = personas if personas is not None else PERSONAS
+    targets = targets if targets is not None else TARGETS
+    if actions is None:
+        actions = sorted(
+            name for name in policy.rules if name.startswith('identity:'))
+
+    evaluator = _Evaluator(list(personas.values()), list(targets.values()))
+    default = policy.rules.get(policy.default_rule)
+    allowed = numpy.zeros(
+        (len(actions), len(personas), len(targets)), dtype=bool)
+    for a, action in enumerate(actions):
+        node = policy.rules.get(action, default)
+        if node is not None:
+            allowed[a] = evaluator.evaluate(node)
+    return PermissionMatrix(actions, personas, targets, allowed)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Print the allow/deny matrix of a Keystone policy.')
+    arg_parser.add_argument('policy', help='policy.json file')
+    arg_parser.add_argument(
+        '--format', choices=['csv', 'json'], default='csv')
+    args = arg_parser.parse_args(argv)
+
+    matrix = compute(compiler.CompiledPolicy.from_file(args.policy))
+    if args.format == 'csv':
+        sys.stdout.write(matrix.to_csv())
+    else:
+        sys.stdout.write(matrix.to_json() + '\n')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
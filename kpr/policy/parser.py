@@ -0,0 +1,116 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from kpr.policy import checks
+
+_KEYWORDS = ('and', 'or', 'not')
+
+
+class ParseError(ValueError):
+    pass
+
+
+def tokenize(rule):
+    """Split a rule into '(', ')', 'and', 'or', 'not' and check tokens."""
+    tokens = []
+    for word in rule.split():
+        opening = len(word) - len(word.lstrip('('))
+        tokens.extend(['('] * opening)
+        word = word[opening:]
+
+        # A check such as %(target.user.id)s ends with 's', so only the
+        # parentheses closing groups are stripped here.
+        stripped = word.rstrip(')')
+        closing = len(word) - len(stripped)
+        if stripped:
+            if stripped.lower() in _KEYWORDS:
+                tokens.append(stripped.lower())
+            else:
+                tokens.append(stripped)
+        tokens.extend([')'] * closing)
+    return tokens
+
+
+def parse_rule(rule):
+    """Parse an oslo.policy rule string into a tree of checks.
+
+    Supports ``@``/``!``, ``rule:``, ``role:``, generic ``kind:match``
+    checks (including quoted literals) and ``and``/``or``/``not`` with
+    parentheses. An empty rule always passes.
+    """
+    tokens = tokenize(rule)
+    if not tokens:
+        return checks.TrueCheck()
+    parser = _Parser(tokens)
+    check = parser.parse_or()
+    if parser.position != len(tokens):
+        raise ParseError('Unexpected {!r} in rule {!r}'.format(
+            tokens[parser.position], rule))
+    return check
+
+
+class _Parser(object):
+
+    def __init__(self, tokens):
+        self.tokens = tokens
+        self.position = 0
+
+    def peek(self):
+        if self.position < len(self.tokens):
+            return self.tokens[self.position]
+        return None
+
+    def next(self):
+        token = self.peek()
+        if token is None:
+            raise ParseError('Unexpected end of rule')
+        self.position += 1
+        return token
+
+    def parse_or(self):
+        rules = [self.parse_and()]
+        while self.peek() == 'or':
+            self.next()
+            rules.append(self.parse_and())
+        return rules[0] if len(rules) == 1 else checks.OrCheck(rules)
+
+    def parse_and(self):
+        rules = [self.parse_not()]
+        while self.peek() == 'and':
+            self.next()
+            rules.append(self.parse_not())
+        return rules[0] if len(rules) == 1 else checks.AndCheck(rules)
+
+    def parse_not(self):
+        if self.peek() == 'not':
+            self.next()
+            return checks.NotCheck(self.parse_not())
+        return self.parse_atom()
+
+    def parse_atom(self):
+        token = self.next()
+        if token == '(':
+            check = self.parse_or()
+            if self.next() != ')':
+                raise ParseError('Missing closing parenthesis')
+            return check
+        if token in (')', 'and', 'or'):
+            raise ParseError('Unexpected {!r}'.format(token))
+        if token == '@':
+            return checks.TrueCheck()
+        if token == '!':
+            return checks.FalseCheck()
+        if ':' not in token:
+            raise ParseError('Invalid check {!r}'.format(token))
+        kind, match = token.split(':', 1)
+        return checks.get_check(kind, match)
@@ -0,0 +1,89 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import unittest
+
+from kpr.policy import compiler
+from kpr.policy import enforcer
+
+POLICY_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+class TestCompiledPolicy(unittest.TestCase):
+
+    def load(self, name):
+        with open(os.path.join(POLICY_DIR, name)) as f:
+            return json.load(f)
+
+    # コンパイル済みポリシーはインタプリタと同じ判定をする。
+    def test_same_decisions_as_enforcer(self):
+        for name in ('policy.json', 'policy.project-admin.json'):
+            rules = self.load(name)
+            expected = enforcer.Enforcer(rules)
+            compiled = compiler.CompiledPolicy(rules)
+            for roles in (['admin'], ['admin_auditor'], ['project_admin'],
+                          ['project_auditor'], ['Member']):
+                creds = enforcer.credentials('u1', 'p1', roles)
+                for project in ('p1', 'p2'):
+                    target = {
+                        'target': {
+                            'user': {'default_project_id': project},
+                            'project': {'id': project},
+                            'role': {'name': 'admin'},
+                        },
+                        'user': {'default_project_id': project},
+                    }
+                    for rule in rules:
+                        self.assertEqual(
+                            expected.enforce(rule, target, creds),
+                            compiled.enforce(rule, target, creds),
+                            '{} {} {}'.format(name, rule, roles),
+                        )
+
+    # 同じ意味の部分式は一つのノードを共有する。
+    def test_shared_subexpressions(self):
+        compiled = compiler.CompiledPolicy(
+            self.load('policy.project-admin.json'))
+        self.assertIs(
+            compiled.rules['identity:get_role'],
+            compiled.rules['identity:list_roles'],
+        )
+        self.assertIs(
+            compiled.rules['identity:get_domain_config'],
+            compiled.rules['admin_required'],
+        )
+
+    # 変更されたルールとそれを参照するルールだけが再コンパイルされる。
+    def test_update_recompiles_changed_rules_only(self):
+        rules = {
+            'admin_required': 'role:admin',
+            'identity:a': 'rule:admin_required',
+            'identity:b': 'role:reader',
+        }
+        compiled = compiler.CompiledPolicy(rules)
+        b = compiled.rules['identity:b']
+        rules = dict(rules, admin_required='role:admin or role:root')
+        self.assertEqual(
+            set(['admin_required', 'identity:a']), compiled.update(rules))
+        self.assertIs(b, compiled.rules['identity:b'])
+        self.assertTrue(compiled.enforce(
+            'identity:a', {}, enforcer.credentials('u1', 'p1', ['root'])))
+
+    def test_recursive_rule_is_rejected(self):
+        self.assertRaises(
+            compiler.CompileError,
+            compiler.CompiledPolicy,
+            {'a': 'rule:b', 'b': 'rule:a'},
+        )
@@ -0,0 +1,86 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+from kpr.policy import compiler
+from kpr.policy import diff
+
+POLICY_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+class TestPolicyDiff(unittest.TestCase):
+
+    def compare(self, old, new):
+        return diff.compare(
+            compiler.CompiledPolicy(old), compiler.CompiledPolicy(new))
+
+    # 書き方が違うだけで意味が同じルールは差分にならない。
+    def test_equivalent_rules_are_not_reported(self):
+        old = {
+            'admin_required': 'role:admin',
+            'identity:a': 'rule:admin_required or role:reader',
+            'identity:b': 'role:admin and (role:x or role:y)',
+            'identity:c': 'not (role:x and role:y)',
+        }
+        new = {
+            'identity:a': 'role:Reader or role:admin',
+            'identity:b': '(role:admin and role:y) or (role:x and role:admin)',
+            'identity:c': 'not role:x or not role:y',
+        }
+        self.assertEqual([], self.compare(old, new))
+
+    def test_gained_access(self):
+        changes = self.compare(
+            {'identity:list_users': 'role:admin'},
+            {'identity:list_users': 'role:admin or role:admin_auditor'},
+        )
+        self.assertEqual(['identity:list_users'], [c.action for c in changes])
+        self.assertEqual([], changes[0].lost)
+        self.assertEqual(
+            set(['admin_auditor']), set(p for p, _ in changes[0].gained))
+
+    # ペルソナに現れない違いは、違いが出る条件とともに報告される。
+    def test_difference_outside_personas(self):
+        changes = self.compare(
+            {'identity:a': 'role:admin'},
+            {'identity:a': 'role:admin or role:root'},
+        )
+        self.assertEqual([], changes[0].gained + changes[0].lost)
+        self.assertEqual(
+            {'role:admin': False, 'role:root': True}, changes[0].witness)
+
+    # 表にできないほどチェックの多いルールも、変更があれば必ず報告される。
+    def test_untabulated_change_is_reported(self):
+        roles = ' or '.join(
+            'role:r{}'.format(i) for i in range(diff.MAX_ATOMS + 1))
+        changes = self.compare(
+            {'identity:a': roles},
+            {'identity:a': roles + ' or role:r99'},
+        )
+        self.assertEqual(['identity:a'], [c.action for c in changes])
+        self.assertIsNone(changes[0].witness)
+        self.assertIn('not tabulated', diff.format_text(changes))
+
+    # 同梱のポリシーの違いは意味が変わったルールだけ報告される。
+    def test_shipped_policies(self):
+        changes = diff.compare(
+            compiler.CompiledPolicy.from_file(
+                os.path.join(POLICY_DIR, 'policy.json')),
+            compiler.CompiledPolicy.from_file(
+                os.path.join(POLICY_DIR, 'policy.project-admin.json')),
+        )
+        self.assertEqual(12, len(changes))
+        for change in changes:
+            self.assertEqual([], change.lost)
@@ -0,0 +1,123 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+from kpr.policy import enforcer
+from kpr.policy import parser
+
+POLICY_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+def user_target(project_id, domain_id='default'):
+    return {
+        'target': {
+            'user': {
+                'id': 'target-user',
+                'default_project_id': project_id,
+                'domain_id': domain_id,
+            },
+        },
+    }
+
+
+class TestParser(unittest.TestCase):
+
+    def test_tokenize_parentheses(self):
+        self.assertEqual(
+            ['(', 'not', "'admin':%(target.role.name)s", ')', ')'],
+            parser.tokenize("(not 'admin':%(target.role.name)s))"),
+        )
+
+    def test_and_binds_tighter_than_or(self):
+        self.assertEqual(
+            '(role:a or (role:b and role:c))',
+            str(parser.parse_rule('role:a or role:b and role:c')),
+        )
+
+    def test_empty_rule_always_passes(self):
+        self.assertTrue(parser.parse_rule('')({}, {}, None))
+
+    def test_unbalanced_rule_is_rejected(self):
+        self.assertRaises(parser.ParseError, parser.parse_rule, '(role:a')
+
+
+class TestProjectAdminPolicy(unittest.TestCase):
+
+    def setUp(self):
+        super(TestProjectAdminPolicy, self).setUp()
+        self.enforcer = enforcer.Enforcer.from_file(
+            os.path.join(POLICY_DIR, 'policy.project-admin.json'))
+        self.cloud_admin = enforcer.credentials('admin', 'admin', ['admin'])
+        self.cloud_admin_auditor = enforcer.credentials(
+            'auditor', 'admin', ['admin_auditor'])
+        self.project1_admin = enforcer.credentials(
+            'p1-admin', 'project1', ['project_admin'])
+        self.project1_user = enforcer.credentials(
+            'p1-user', 'project1', ['Member'])
+
+    # クラウド監査役は全てのユーザリストを表示することができる。
+    def test_list_users(self):
+        rule = 'identity:list_users'
+        self.assertTrue(self.enforcer.enforce(rule, {}, self.cloud_admin))
+        self.assertTrue(
+            self.enforcer.enforce(rule, {}, self.cloud_admin_auditor))
+        self.assertFalse(self.enforcer.enforce(rule, {}, self.project1_admin))
+        self.assertFalse(self.enforcer.enforce(rule, {}, self.project1_user))
+
+    # プロジェクト1管理者はプロジェクト1のユーザだけを表示することができる。
+    def test_get_user_by_project_admin(self):
+        rule = 'identity:get_user'
+        self.assertTrue(self.enforcer.enforce(
+            rule, user_target('project1'), self.project1_admin))
+        self.assertFalse(self.enforcer.enforce(
+            rule, user_target('project2'), self.project1_admin))
+        self.assertFalse(self.enforcer.enforce(
+            rule, user_target('project1'), self.project1_user))
+
+    # プロジェクト1管理者はプロジェクト1のユーザのプロジェクトを変更することができない。
+    def test_update_user_default_project(self):
+        rule = 'identity:update_user'
+        target = user_target('project1')
+        target['user'] = {'default_project_id': 'project1'}
+        self.assertTrue(
+            self.enforcer.enforce(rule, target, self.project1_admin))
+        target['user'] = {'default_project_id': 'project2'}
+        self.assertFalse(
+            self.enforcer.enforce(rule, target, self.project1_admin))
+
+    # プロジェクト1管理者はクラウド管理者ロールを付与することができない。
+    def test_create_grant_of_admin_role(self):
+        rule = 'identity:create_grant'
+        target = user_target('project1')
+        target['target']['project'] = {'id': 'project1'}
+        target['target']['role'] = {'name': 'project_admin'}
+        self.assertTrue(
+            self.enforcer.enforce(rule, target, self.project1_admin))
+        target['target']['role'] = {'name': 'admin'}
+        self.assertFalse(
+            self.enforcer.enforce(rule, target, self.project1_admin))
+        self.assertTrue(self.enforcer.enforce(rule, target, self.cloud_admin))
+
+    # 自分自身の情報は誰でも表示することができる。
+    def test_get_self(self):
+        target = {'target': {'user': {'id': 'p1-user'}}, 'user_id': 'p1-user'}
+        self.assertTrue(self.enforcer.enforce(
+            'identity:get_user', target, self.project1_user))
+
+    # 存在しないルールは default ルールで判定される。
+    def test_unknown_rule_uses_default(self):
+        rule = 'identity:no_such_rule'
+        self.assertTrue(self.enforcer.enforce(rule, {}, self.cloud_admin))
+        self.assertFalse(self.enforcer.enforce(rule, {}, self.project1_admin))
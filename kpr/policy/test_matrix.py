@@ -0,0 +1,71 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import unittest
+
+from kpr.policy import compiler
+from kpr.policy import matrix
+
+POLICY_DIR = os.path.join(os.path.dirname(__file__), '..', '..')
+
+
+class TestPermissionMatrix(unittest.TestCase):
+
+    def setUp(self):
+        self.policy = compiler.CompiledPolicy.from_file(
+            os.path.join(POLICY_DIR, 'policy.project-admin.json'))
+
+    # 行列の全セルが一件ずつの判定と一致する。
+    def test_same_decisions_as_compiled_policy(self):
+        for name in ('policy.json', 'policy.project-admin.json'):
+            policy = compiler.CompiledPolicy.from_file(
+                os.path.join(POLICY_DIR, name))
+            result = matrix.compute(policy)
+            for action, persona, target, allowed in result.rows():
+                self.assertEqual(
+                    policy.enforce(
+                        action,
+                        matrix.TARGETS[target],
+                        matrix.PERSONAS[persona],
+                    ),
+                    allowed,
+                    '{} {} {} {}'.format(name, action, persona, target),
+                )
+
+    # ユーザ一覧はクラウド管理者と監査者だけが取得できる。
+    def test_list_users(self):
+        result = matrix.compute(self.policy, actions=['identity:list_users'])
+        allowed = result.allowed[0].any(axis=1)
+        self.assertEqual(
+            ['cloud_admin', 'admin_auditor'],
+            [p for p, a in zip(result.personas, allowed) if a],
+        )
+
+    # プロジェクト管理者は自分のプロジェクトのユーザだけを参照できる。
+    def test_get_user_by_project_admin(self):
+        table = matrix.compute(
+            self.policy, actions=['identity:get_user']).to_dict()
+        row = table['identity:get_user']['project1_admin']
+        self.assertTrue(row['project1_user0'])
+        self.assertFalse(row['project2_user0'])
+
+    def test_output_formats(self):
+        result = matrix.compute(
+            self.policy, actions=['identity:get_user', 'identity:list_users'])
+        lines = result.to_csv().splitlines()
+        self.assertEqual('action,persona,target,allowed', lines[0])
+        self.assertEqual(
+            1 + 2 * len(matrix.PERSONAS) * len(matrix.TARGETS), len(lines))
+        self.assertEqual(result.to_dict(), json.loads(result.to_json()))
@@ -20,15 +20,12 @@ from kpr.utils import clients
 
 class TestProjectList(base.TestCase):
 
-    def setUp(self):
-        super(TestProjectList, self).setUp()
-        self.setup_project('project1', auditor=True, user=1)
-        self.setup_project('project2', admin=False, user=0)
+    fixture_scope = 'class'
 
-    def tearDown(self):
-        super(TestProjectList, self).tearDown()
-        self.teardown_project('project1', auditor=True, user=1)
-        self.teardown_project('project2', admin=False, user=0)
+    fixture_projects = (
+        {'project': 'project1', 'auditor': True, 'user': 1},
+        {'project': 'project2', 'admin': False, 'user': 0},
+    )
 
     def _list_all_projects(self, username, project_name):
         return self.os_run(
@@ -20,15 +20,12 @@ from kpr.utils import clients
 
 class TestRoleList(base.TestCase):
 
-    def setUp(self):
-        super(TestRoleList, self).setUp()
-        self.setup_project('project1', auditor=True, user=1)
-        self.setup_project('project2', admin=False, auditor=False, user=0)
+    fixture_scope = 'class'
 
-    def tearDown(self):
-        super(TestRoleList, self).tearDown()
-        self.teardown_project('project1', auditor=True, user=1)
-        self.teardown_project('project2', admin=False, auditor=False, user=0)
+    fixture_projects = (
+        {'project': 'project1', 'auditor': True, 'user': 1},
+        {'project': 'project2', 'admin': False, 'auditor': False, 'user': 0},
+    )
 
     # クラウド管理者は全てのロールを一覧表示することができる。
     def test_list_all_roles_by_cloud_admin(self):
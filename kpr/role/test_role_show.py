@@ -20,13 +20,11 @@ from kpr.utils import clients
 
 class TestRoleShow(base.TestCase):
 
-    def setUp(self):
-        super(TestRoleShow, self).setUp()
-        self.setup_project('project1', auditor=True, user=1)
+    fixture_scope = 'class'
 
-    def tearDown(self):
-        super(TestRoleShow, self).tearDown()
-        self.teardown_project('project1', auditor=True, user=1)
+    fixture_projects = (
+        {'project': 'project1', 'auditor': True, 'user': 1},
+    )
 
     def all_roles(self):
         return [
@@ -0,0 +1,125 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import subprocess
+
+import testscenarios
+
+from kpr import base
+from kpr.utils import clients
+
+ALLOW = 'allow'
+DENY = 'deny'
+
+# One line of a policy table: ``persona`` runs the CLI ``action`` on the
+# fixture attribute ``target`` (None for none) and is expected to be
+# allowed or denied. A persona is 'cloud_admin', 'admin_auditor' or a
+# project user attribute such as 'project1_admin'; 'project1_admin@project2'
+# authenticates on project2, where the user is made a member for the row.
+Row = collections.namedtuple(
+    'Row', ['persona', 'action', 'target', 'expected'])
+
+# Modules defining table driven classes set ``load_tests = load_tests`` so
+# that unittest discovery expands the rows into tests.
+load_tests = testscenarios.load_tests_apply_scenarios
+
+
+def scenarios(table):
+    """Return the testscenarios ``scenarios`` of a table of ``Row``s."""
+    result = []
+    for row in table:
+        row = Row(*row)
+        name = '{},{},{}'.format(
+            row.persona, row.action.replace(' ', '_'), row.target or '-')
+        result.append((name, {'row': row}))
+    return result
+
+
+class TestCase(base.TestCase):
+    """Checks every row of ``scenarios`` against one fixture world.
+
+    All the rows of a class need the world of its ``fixture_projects``,
+    so it is provisioned once for the whole table. ``load_tests`` makes
+    one test per row; runners that ignore it (pytest) check the whole
+    table in a single test, one subtest per row.
+    """
+
+    fixture_scope = 'class'
+
+    scenarios = ()
+
+    row = None
+
+    def persona(self, name):
+        """Return the (username, project name) a persona runs as."""
+        name, _, other_project = name.partition('@')
+        if name == 'cloud_admin':
+            username = clients.OS_ADMIN_USERNAME
+            project_name = clients.OS_ADMIN_PROJECT_NAME
+        elif name == 'admin_auditor':
+            username = self.admin_auditor.name
+            project_name = clients.OS_ADMIN_PROJECT_NAME
+        else:
+            username = getattr(self, name).name
+            project_name = getattr(self, name.split('_')[0]).name
+        if other_project:
+            project_name = getattr(self, other_project).name
+        return username, project_name
+
+    def command(self, action, target):
+        command = action.split()
+        if target is not None:
+            command.append(getattr(self, target).id)
+        return command
+
+    def test_policy(self):
+        if self.row is not None:
+            self.check_row(self.row)
+            return
+        for name, parameters in self.scenarios:
+            with self.subTest(name):
+                self.check_row(parameters['row'])
+
+    def check_row(self, row):
+        persona, _, project = row.persona.partition('@')
+        if not project:
+            self.check(row)
+            return
+
+        # Authenticate on another project, where the user only is a member.
+        user = getattr(self, persona)
+        project = getattr(self, project)
+        self.grant_role(self.project_member_role, user, project)
+        try:
+            self.check(row)
+        finally:
+            self.revoke_role(self.project_member_role, user, project)
+
+    def check(self, row):
+        username, project_name = self.persona(row.persona)
+        command = self.command(row.action, row.target)
+        if row.expected == ALLOW:
+            output = self.os_run(
+                command=command, project=project_name, username=username)
+            if isinstance(output, dict) and row.target is not None:
+                self.assertEqual(getattr(self, row.target).id, output['id'])
+            return
+
+        try:
+            self.os_run(
+                command=command, project=project_name, username=username)
+            self.fail('{} must not be permitted to {} {}'.format(
+                row.persona, row.action, row.target))
+        except subprocess.CalledProcessError as e:
+            self.assertRegex(e.output.decode('utf-8'), 'HTTP 403')
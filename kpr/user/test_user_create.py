@@ -20,15 +20,10 @@ from kpr.utils import clients
 
 class TestUserCreate(base.TestCase):
 
-    def setUp(self):
-        super(TestUserCreate, self).setUp()
-        self.setup_project('project1', user=1)
-        self.setup_project('project2', admin=False, user=0)
-
-    def tearDown(self):
-        super(TestUserCreate, self).tearDown()
-        self.teardown_project('project1', user=1)
-        self.teardown_project('project2', admin=False, user=0)
+    fixture_projects = (
+        {'project': 'project1', 'user': 1},
+        {'project': 'project2', 'admin': False, 'user': 0},
+    )
 
     @contextlib.contextmanager
     def create_user_by_cli(
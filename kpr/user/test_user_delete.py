@@ -19,15 +19,10 @@ from kpr.utils import clients
 
 class TestUserDelete(base.TestCase):
 
-    def setUp(self):
-        super(TestUserDelete, self).setUp()
-        self.setup_project('project1', user=1)
-        self.setup_project('project2', admin=False, user=0)
-
-    def tearDown(self):
-        super(TestUserDelete, self).tearDown()
-        self.teardown_project('project1', user=1)
-        self.teardown_project('project2', admin=False, user=0)
+    fixture_projects = (
+        {'project': 'project1', 'user': 1},
+        {'project': 'project2', 'admin': False, 'user': 0},
+    )
 
     def delete_user_by_cli(
         self,
@@ -14,20 +14,18 @@
 import subprocess
 
 from kpr import base
+from kpr.utils import assignments
 from kpr.utils import clients
 
 
 class TestUserList(base.TestCase):
 
-    def setUp(self):
-        super(TestUserList, self).setUp()
-        self.setup_project('project1', auditor=True)
-        self.setup_project('project2', admin=False, user=0)
+    fixture_scope = 'class'
 
-    def tearDown(self):
-        super(TestUserList, self).tearDown()
-        self.teardown_project('project1', auditor=True)
-        self.teardown_project('project2', admin=False, user=0)
+    fixture_projects = (
+        {'project': 'project1', 'auditor': True},
+        {'project': 'project2', 'admin': False, 'user': 0},
+    )
 
     def _list_all_or_project_user(self, target_project=None, username=None, project_name=None):
         command = ['user', 'list']
@@ -53,10 +51,15 @@ class TestUserList(base.TestCase):
             self.assertRegex(e.output.decode('utf-8'), 'HTTP 403')
 
     def assertListProjectUser(self, target_project, username, project_name):
-        expected_users = self.admin.role_assignments.list(project=target_project.id)
         self.assertEqual(
-            len(expected_users),
-            len(self._list_all_or_project_user(target_project=target_project, username=username, project_name=project_name))
+            assignments.snapshot.users(target_project),
+            set(
+                u['ID'] for u in self._list_all_or_project_user(
+                    target_project=target_project,
+                    username=username,
+                    project_name=project_name,
+                )
+            )
         )
 
     def assertNotListProjectUser(self, target_project, username, project_name):
@@ -11,127 +11,51 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-from keystoneauth1.exceptions import http
-import subprocess
-
-from kpr import base
-from kpr.utils import clients
-
-
-class TestUserShow(base.TestCase):
-
-    def setUp(self):
-        super(TestUserShow, self).setUp()
-        self.setup_project('project1', auditor=True, user=1)
-        self.setup_project('project2', user=1)
-
-    def tearDown(self):
-        super(TestUserShow, self).tearDown()
-        self.teardown_project('project1', auditor=True, user=1)
-        self.teardown_project('project2', user=1)
-
-    def _show_user_id(self, target_user, user, project):
-        return self.os_run(
-            command=['user', 'show', target_user.id],
-            username=user,
-            project=project,
-        )['id']
-
-    def assertShowUser(self, target_user, user, project):
-        self.assertEqual(
-            target_user.id,
-            self._show_user_id(target_user, user, project)
-        )
-
-    def assertNotShowUser(self, target_user, user, project):
-        try:
-            self._show_user_id(target_user, user, project)
-            self.self.fail('{} must not be able to show {}'.format(user, target_user.name))
-        except subprocess.CalledProcessError as e:
-            self.assertRegex(e.output.decode('utf-8'), 'HTTP 403')
-
-
-    # クラウド管理者は全てのユーザを表示することができる。
-    def test_get_all_users_by_cloud_admin(self):
-        user = clients.OS_ADMIN_USERNAME
-        project = clients.OS_ADMIN_PROJECT_NAME
-        self.assertShowUser(self.project1_admin, user, project)
-        self.assertShowUser(self.project2_admin, user, project)
-        self.assertShowUser(self.project1_user0, user, project)
-        self.assertShowUser(self.project2_user0, user, project)
-
-    # クラウド監査役は全てのユーザを表示することができる。
-    def test_get_all_users_by_cloud_auditor(self):
-        user = self.admin_auditor.name
-        project = clients.OS_ADMIN_PROJECT_NAME
-        self.assertShowUser(self.project1_admin, user, project)
-        self.assertShowUser(self.project2_admin, user, project)
-        self.assertShowUser(self.project1_user0, user, project)
-        self.assertShowUser(self.project2_user0, user, project)
-
-    # プロジェクト1管理者は自分を表示することができる。
-    def test_get_self_by_project_admin(self):
-        user = self.project1_admin.name
-        project = self.project1.name
-        self.assertShowUser(self.project1_admin, user, project)
-
-    # プロジェクト1管理者はプロジェクト1のユーザを表示することができる。
-    def test_get_same_project_user_by_project_admin(self):
-        user = self.project1_admin.name
-        project = self.project1.name
-        self.assertShowUser(self.project1_user0, user, project)
-
-    # プロジェクト1管理者はプロジェクト2のプロジェクト管理者を表示できない。
-    def test_get_different_project_admin_by_project_admin(self):
-        user = self.project1_admin.name
-        project = self.project1.name
-        self.assertNotShowUser(self.project2_admin, user, project)
-
-    # プロジェクト1管理者はプロジェクト2のユーザを表示できない。
-    def test_get_different_project_user_by_project_admin(self):
-        user = self.project1_admin.name
-        project = self.project1.name
-        self.assertNotShowUser(self.project2_user0, user, project)
-
-    # プロジェクト2のユーザ権限で認証されたプロジェクト1管理者はプロジェクト1のユーザを表示できない。
-    def test_get_different_project_user_by_project_admin_user(self):
-        with self.grant_role_temporary(self.project_member_role, self.project1_admin, self.project2):
-            user = self.project1_admin.name
-            project = self.project2.name
-            # project2 で認証していても、自分を表示することは可能。
-            self.assertShowUser(self.project1_admin, user, project)
-            self.assertNotShowUser(self.project1_user0, user, project)
-
-    # プロジェクト1監査役は自分を表示することができる。
-    def test_get_self_by_project1_auditor(self):
-        user = self.project1_auditor.name
-        project = self.project1.name
-        self.assertShowUser(self.project1_auditor, user, project)
-
-    # プロジェクト1監査役はプロジェクト1のユーザを表示することができる。
-    def test_get_project1_user_by_project1_auditor(self):
-        user = self.project1_auditor.name
-        project = self.project1.name
-        self.assertShowUser(self.project1_admin, user, project)
-        self.assertShowUser(self.project1_user0, user, project)
-
-    # プロジェクト1監査役はプロジェクト2のプロジェクト管理者を表示できない。
-    def test_get_project2_admin_by_project1_auditor(self):
-        user = self.project1_auditor.name
-        project = self.project1.name
-        self.assertNotShowUser(self.project2_admin, user, project)
-
-    # プロジェクト1監査役はプロジェクト2のユーザを表示できない。
-    def test_get_project2_user_by_project1_auditor(self):
-        user = self.project1_auditor.name
-        project = self.project1.name
-        self.assertNotShowUser(self.project2_user0, user, project)
-
-    # プロジェクト2のユーザ権限で認証されたプロジェクト1監査役はプロジェクト1のユーザを表示できない。
-    def test_get_project1_user_by_project1_auditor_with_project2(self):
-        with self.grant_role_temporary(self.project_member_role, self.project1_auditor, self.project2):
-            user = self.project1_auditor.name
-            project = self.project2.name
-            # project2 で認証していても、自分を表示することは可能。
-            self.assertShowUser(self.project1_auditor, user, project)
-            self.assertNotShowUser(self.project1_user0, user, project)
+from kpr import scenario
+
+load_tests = scenario.load_tests
+
+ALLOW = scenario.ALLOW
+DENY = scenario.DENY
+
+
+class TestUserShow(scenario.TestCase):
+
+    fixture_projects = (
+        {'project': 'project1', 'auditor': True, 'user': 1},
+        {'project': 'project2', 'user': 1},
+    )
+
+    scenarios = scenario.scenarios([
+        # クラウド管理者は全てのユーザを表示することができる。
+        ('cloud_admin', 'user show', 'project1_admin', ALLOW),
+        ('cloud_admin', 'user show', 'project2_admin', ALLOW),
+        ('cloud_admin', 'user show', 'project1_user0', ALLOW),
+        ('cloud_admin', 'user show', 'project2_user0', ALLOW),
+        # クラウド監査役は全てのユーザを表示することができる。
+        ('admin_auditor', 'user show', 'project1_admin', ALLOW),
+        ('admin_auditor', 'user show', 'project2_admin', ALLOW),
+        ('admin_auditor', 'user show', 'project1_user0', ALLOW),
+        ('admin_auditor', 'user show', 'project2_user0', ALLOW),
+        # プロジェクト1管理者は自分とプロジェクト1のユーザを表示することができる。
+        ('project1_admin', 'user show', 'project1_admin', ALLOW),
+        ('project1_admin', 'user show', 'project1_user0', ALLOW),
+        # プロジェクト1管理者はプロジェクト2の管理者とユーザを表示できない。
+        ('project1_admin', 'user show', 'project2_admin', DENY),
+        ('project1_admin', 'user show', 'project2_user0', DENY),
+        # プロジェクト2のユーザ権限で認証されたプロジェクト1管理者は、
+        # 自分を表示することはできるが、プロジェクト1のユーザを表示できない。
+        ('project1_admin@project2', 'user show', 'project1_admin', ALLOW),
+        ('project1_admin@project2', 'user show', 'project1_user0', DENY),
+        # プロジェクト1監査役は自分とプロジェクト1のユーザを表示することができる。
+        ('project1_auditor', 'user show', 'project1_auditor', ALLOW),
+        ('project1_auditor', 'user show', 'project1_admin', ALLOW),
+        ('project1_auditor', 'user show', 'project1_user0', ALLOW),
+        # プロジェクト1監査役はプロジェクト2の管理者とユーザを表示できない。
+        ('project1_auditor', 'user show', 'project2_admin', DENY),
+        ('project1_auditor', 'user show', 'project2_user0', DENY),
+        # プロジェクト2のユーザ権限で認証されたプロジェクト1監査役は、
+        # 自分を表示することはできるが、プロジェクト1のユーザを表示できない。
+        ('project1_auditor@project2', 'user show', 'project1_auditor', ALLOW),
+        ('project1_auditor@project2', 'user show', 'project1_user0', DENY),
+    ])
@@ -19,15 +19,10 @@ from kpr.utils import clients
 
 class TestUserUpdate(base.TestCase):
 
-    def setUp(self):
-        super(TestUserUpdate, self).setUp()
-        self.setup_project('project1', user=1)
-        self.setup_project('project2', admin=False, user=0)
-
-    def tearDown(self):
-        super(TestUserUpdate, self).tearDown()
-        self.teardown_project('project1', user=1)
-        self.teardown_project('project2', admin=False, user=0)
+    fixture_projects = (
+        {'project': 'project1', 'user': 1},
+        {'project': 'project2', 'admin': False, 'user': 0},
+    )
 
     def update_user(
         self,
@@ -0,0 +1,156 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import threading
+
+from kpr.utils import clients
+
+
+def _nested():
+    return collections.defaultdict(set)
+
+
+class Snapshot(object):
+    """Project role assignments fetched once and indexed.
+
+    The assignments of a project are listed the first time it is asked
+    about (or all at once with ``load()``) and kept indexed by project
+    and by user, so membership queries cost a dict lookup. The harness
+    reports the grants and revocations it makes through ``granted``,
+    ``revoked`` and ``forget_user`` instead of listing again. Call
+    ``invalidate`` after changes made behind its back, such as a CLI
+    ``role add`` or a rollback of the fake Keystone.
+
+    ``effective`` lists assignments the way Keystone enforces them, with
+    group memberships expanded into users. ``include_names`` also records
+    the names of the users, projects and roles in ``names``.
+    """
+
+    def __init__(self, include_names=False, effective=False):
+        self.include_names = include_names
+        self.effective = effective
+        self.names = {}
+        self._lock = threading.RLock()
+        self._all = False
+        self._loaded = set()
+        self._by_project = collections.defaultdict(_nested)
+        self._by_user = collections.defaultdict(_nested)
+
+    def load(self, project=None):
+        """Fetch the assignments of ``project``, or of every project."""
+        project_id = getattr(project, 'id', project)
+        kwargs = {
+            'include_names': self.include_names,
+            'effective': self.effective,
+        }
+        if project_id is not None:
+            kwargs['project'] = project_id
+        admin = clients.get_admin_client()
+        fetched = admin.role_assignments.list(**kwargs)
+        with self._lock:
+            if project_id is None:
+                self._clear()
+                self._all = True
+            else:
+                self._forget_project(project_id)
+                self._loaded.add(project_id)
+            for assignment in fetched:
+                self._add(assignment)
+
+    def users(self, project):
+        """Return the ids of the users with a role on ``project``."""
+        project_id = self._ensure(project)
+        with self._lock:
+            return frozenset(
+                user_id
+                for user_id, roles in self._by_project[project_id].items()
+                if roles
+            )
+
+    def roles(self, project, user):
+        """Return the ids of the roles ``user`` has on ``project``."""
+        project_id = self._ensure(project)
+        with self._lock:
+            return frozenset(
+                self._by_project[project_id].get(_id(user), ()))
+
+    def has(self, project, user, role=None):
+        roles = self.roles(project, user)
+        if role is None:
+            return bool(roles)
+        return _id(role) in roles
+
+    def granted(self, project, user, role):
+        with self._lock:
+            self._index(_id(project), _id(user), _id(role))
+
+    def revoked(self, project, user, role):
+        with self._lock:
+            project_id, user_id = _id(project), _id(user)
+            self._by_project[project_id][user_id].discard(_id(role))
+            self._by_user[user_id][project_id].discard(_id(role))
+
+    def forget_user(self, user):
+        """Drop the assignments of a deleted user."""
+        with self._lock:
+            user_id = _id(user)
+            for project_id in self._by_user.pop(user_id, {}):
+                self._by_project[project_id].pop(user_id, None)
+
+    def invalidate(self):
+        with self._lock:
+            self._clear()
+
+    def _ensure(self, project):
+        project_id = _id(project)
+        with self._lock:
+            loaded = self._all or project_id in self._loaded
+        if not loaded:
+            self.load(project_id)
+        return project_id
+
+    def _add(self, assignment):
+        user = getattr(assignment, 'user', None)
+        project = getattr(assignment, 'scope', {}).get('project')
+        if user is None or project is None:
+            # Group and domain assignments; groups are expanded into user
+            # assignments when ``effective`` is set.
+            return
+        role = assignment.role
+        self._index(project['id'], user['id'], role['id'])
+        for resource in (user, project, role):
+            if 'name' in resource:
+                self.names[resource['id']] = resource['name']
+
+    def _index(self, project_id, user_id, role_id):
+        self._by_project[project_id][user_id].add(role_id)
+        self._by_user[user_id][project_id].add(role_id)
+
+    def _forget_project(self, project_id):
+        for user_id in self._by_project.pop(project_id, {}):
+            self._by_user[user_id].pop(project_id, None)
+
+    def _clear(self):
+        self._all = False
+        self._loaded.clear()
+        self._by_project.clear()
+        self._by_user.clear()
+        self.names.clear()
+
+
+def _id(resource):
+    return getattr(resource, 'id', resource)
+
+
+snapshot = Snapshot()
@@ -0,0 +1,248 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import datetime
+import json
+import os
+import re
+import threading
+from urllib import parse
+
+import mock
+import requests
+from requests import adapters
+from requests import structures
+
+from kpr.utils import assignments
+from kpr.utils import clients
+from kpr.utils import registry
+from kpr.utils import tokens
+
+# Placeholder of the random names in normalized requests.
+RANDOM = '{random}'
+
+# Response headers worth keeping; the others only make cassettes larger.
+HEADERS = ('Content-Type', 'Location', 'X-Subject-Token')
+
+# The random names of this process and, when replaying, the recorded
+# name each of them replaces. They outlive a cassette because names made
+# in setUpClass are used by the tests.
+_lock = threading.Lock()
+_names = []
+_mapping = {}
+
+
+class CassetteMiss(Exception):
+    """A replayed test made a request its cassette does not contain."""
+
+
+def _pattern(names):
+    if not names:
+        return None
+    return re.compile('|'.join(
+        re.escape(n) for n in sorted(set(names), key=len, reverse=True)))
+
+
+def _template(text, pattern):
+    if pattern is None:
+        return text
+    return pattern.sub(RANDOM, text)
+
+
+def _occurrences(text, pattern):
+    if pattern is None:
+        return []
+    return pattern.findall(text)
+
+
+def _relative(path):
+    # Cassettes do not depend on where the identity service is mounted.
+    path = re.sub('/+', '/', path)
+    prefix = parse.urlsplit(clients.OS_AUTH_URL).path
+    prefix = re.sub('/+', '/', prefix).rstrip('/')
+    if prefix.endswith('/v3'):
+        prefix = prefix[:-len('/v3')]
+    if prefix and path.startswith(prefix):
+        path = path[len(prefix):]
+    return path or '/'
+
+
+class Cassette(object):
+    """The HTTP exchanges of one test, or of a setUpClass/tearDownClass.
+
+    Requests are matched by method, path, query and JSON body. The names
+    made by ``base.id_generator`` differ between runs, so they are
+    replaced by a placeholder before matching. While replaying, the
+    recorded names of a matched request are mapped to the names the
+    current run used in the same places, and the responses are rewritten
+    with that mapping. Identical requests are answered in the order they
+    were recorded. Replaying needs the settings of the recording run
+    (KPR_OS_RUN_MODE, KPR_FAKE_KEYSTONE, ...), since they change which
+    requests are made.
+    """
+
+    def __init__(self, path, mode, send=None):
+        self.path = path
+        self.mode = mode
+        self._send = send or adapters.HTTPAdapter.send
+        self.interactions = []
+        self.queues = collections.defaultdict(collections.deque)
+        if mode == 'replay':
+            with open(path) as f:
+                for interaction in json.load(f)['interactions']:
+                    self.queues[self._key(interaction['request'])].append(
+                        interaction)
+
+    def send(self, adapter, request, kwargs):
+        with _lock:
+            pattern = _pattern(_names)
+            normalized, names = self._normalize(request, pattern)
+            if self.mode == 'replay':
+                try:
+                    interaction = self.queues[self._key(normalized)].popleft()
+                except IndexError:
+                    raise CassetteMiss('{} has no response to {} {}'.format(
+                        self.path, request.method, request.url))
+                _mapping.update(zip(interaction['request']['names'], names))
+                return self._response(request, interaction['response'])
+
+        response = self._send(adapter, request, **kwargs)
+        normalized['names'] = names
+        with _lock:
+            self.interactions.append({
+                'request': normalized,
+                'response': {
+                    'status': response.status_code,
+                    'headers': dict(
+                        (h, response.headers[h]) for h in HEADERS
+                        if h in response.headers),
+                    'body': response.content.decode('utf-8'),
+                },
+            })
+        return response
+
+    def save(self):
+        if self.mode != 'record':
+            return
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(
+                {'interactions': self.interactions}, f,
+                sort_keys=True, indent=1)
+        os.rename(self.path + '.tmp', self.path)
+
+    def _key(self, request):
+        return tuple(
+            request[k] for k in ('method', 'path', 'query', 'body'))
+
+    def _normalize(self, request, pattern):
+        url = parse.urlsplit(request.url)
+        query = parse.unquote(
+            '&'.join(sorted(url.query.split('&'))) if url.query else '')
+        body = request.body or ''
+        if isinstance(body, bytes):
+            body = body.decode('utf-8')
+        try:
+            body = json.dumps(json.loads(body), sort_keys=True)
+        except ValueError:
+            pass
+        path = _relative(parse.unquote(url.path))
+        names = _occurrences(path + '?' + query + body, pattern)
+        return {
+            'method': request.method,
+            'path': _template(path, pattern),
+            'query': _template(query, pattern),
+            'body': _template(body, pattern),
+        }, names
+
+    def _response(self, request, recorded):
+        body = recorded['body']
+        pattern = _pattern(_mapping)
+        if pattern is not None:
+            body = pattern.sub(lambda m: _mapping[m.group(0)], body)
+        try:
+            data = json.loads(body)
+        except ValueError:
+            data = None
+        if isinstance(data, dict) and 'expires_at' in data.get('token', {}):
+            # The recorded token has expired by now; keystoneauth would
+            # authenticate again before every request.
+            expires = datetime.datetime.utcnow() + datetime.timedelta(hours=1)
+            data['token']['expires_at'] = expires.strftime(
+                '%Y-%m-%dT%H:%M:%S.000000Z')
+            body = json.dumps(data)
+
+        response = requests.Response()
+        response.status_code = recorded['status']
+        response.headers = structures.CaseInsensitiveDict(
+            recorded['headers'])
+        response._content = body.encode('utf-8')
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.reason = ''
+        response.elapsed = datetime.timedelta(0)
+        return response
+
+
+def remember(name):
+    """Note a random name to template out of requests; returns ``name``."""
+    if clients.KPR_CASSETTE_MODE:
+        with _lock:
+            _names.append(name)
+    return name
+
+
+def start(name, mode=None, directory=None):
+    """Record or replay every HTTP request made by this process.
+
+    ``name`` identifies the cassette file in ``directory`` (default
+    ``KPR_CASSETTE_DIR``). Returns a function that stops the cassette
+    and, when recording, saves it. Only requests made from this process
+    go through the cassette, so the CLI must run with
+    ``KPR_OS_RUN_MODE=inprocess`` or ``rest``.
+    """
+    if clients.KPR_OS_RUN_MODE not in ('inprocess', 'rest'):
+        raise ValueError(
+            'Cassettes need KPR_OS_RUN_MODE=inprocess or rest, not {}: the '
+            'requests of a forked openstack command cannot be recorded'
+            .format(clients.KPR_OS_RUN_MODE))
+    mode = mode or clients.KPR_CASSETTE_MODE
+    directory = directory or clients.KPR_CASSETTE_DIR
+    cassette = Cassette(
+        os.path.join(directory, '{}.json'.format(name)), mode,
+        adapters.HTTPAdapter.send)
+
+    def send(adapter, request, **kwargs):
+        return cassette.send(adapter, request, kwargs)
+
+    # Start every cassette with cold clients, so that it holds all the
+    # requests (authentication, discovery, role lookups) its test needs
+    # whatever ran before it.
+    clients.reset_admin_client()
+    clients.reset_sessions()
+    registry.registry.invalidate()
+    assignments.snapshot.invalidate()
+    tokens.token_cache.clear()
+
+    patch = mock.patch.object(adapters.HTTPAdapter, 'send', send)
+    patch.start()
+
+    def stop():
+        patch.stop()
+        cassette.save()
+
+    return stop
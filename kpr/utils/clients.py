@@ -12,6 +12,7 @@
 #    under the License.
 
 import os
+import threading
 
 from keystoneauth1.identity import v3
 from keystoneauth1 import session
@@ -33,14 +34,147 @@ OS_ADMIN_PASSWORD = OS_PASSWORD
 OS_ADMIN_USERNAME = OS_USERNAME
 OS_ADMIN_PROJECT_NAME = OS_PROJECT_NAME
 
+# How TestCase.os_run executes the CLI: 'subprocess' forks `openstack` for
+# every call, 'pool' sends it to a warm `openstack` process of the persona
+# (see kpr.utils.clipool), 'inprocess' drives the openstackclient shell in
+# this process and 'rest' issues the identity API calls directly (see
+# kpr.utils.rest).
+KPR_OS_RUN_MODE = os.environ.get('KPR_OS_RUN_MODE', 'subprocess')
+
+# Idle `openstack` processes kept by the 'pool' mode, and the number of
+# commands after which one is replaced.
+KPR_CLI_POOL_SIZE = int(os.environ.get('KPR_CLI_POOL_SIZE', '8'))
+KPR_CLI_WORKER_COMMANDS = int(
+    os.environ.get('KPR_CLI_WORKER_COMMANDS', '100'))
+
+# Reuse one scoped token per (username, project) instead of authenticating
+# with the password on every CLI call.
+KPR_TOKEN_CACHE = os.environ.get('KPR_TOKEN_CACHE', '0') == '1'
+
+# Number of fixture API calls (user creation, grants, deletion) that may
+# run at once per test process. 1 runs them one after another. The
+# 'inprocess' mode replaces os.environ while a command runs, which calls
+# made by other threads would see, so it always runs them one at a time.
+KPR_FIXTURE_WORKERS = int(os.environ.get('KPR_FIXTURE_WORKERS', '4'))
+if KPR_OS_RUN_MODE == 'inprocess':
+    KPR_FIXTURE_WORKERS = 1
+
+# Number of pre-provisioned worlds kept per fixture shape and shared by
+# the test workers (see kpr.utils.pool). 0 disables the pool.
+KPR_FIXTURE_POOL_SIZE = int(os.environ.get('KPR_FIXTURE_POOL_SIZE', '0'))
+KPR_FIXTURE_POOL_DIR = os.environ.get('KPR_FIXTURE_POOL_DIR', '.kpr/pool')
+
+# Policy file enforced by a private fake Keystone (see kpr.fake) that
+# every test process serves itself. When set, OS_AUTH_URL is ignored and
+# fixtures are reset by rolling the fake back instead of API calls.
+KPR_FAKE_KEYSTONE = os.environ.get('KPR_FAKE_KEYSTONE', '')
+
+# 'record' saves the HTTP exchanges of every test into a cassette under
+# KPR_CASSETTE_DIR, 'replay' answers them from the cassettes without any
+# network (see kpr.utils.cassette).
+KPR_CASSETTE_MODE = os.environ.get('KPR_CASSETTE_MODE', '')
+KPR_CASSETTE_DIR = os.environ.get('KPR_CASSETTE_DIR', '.kpr/cassettes')
+
+# Limits on the identity API calls of every test worker that shares
+# KPR_THROTTLE_DIR (see kpr.utils.throttle). The number of calls in
+# flight adapts between 1 and KPR_MAX_INFLIGHT_CALLS to the latency and
+# errors of the service, API calls slower than KPR_THROTTLE_LATENCY seconds
+# counting as overload (forked CLI runs only count when refused).
+# KPR_MAX_CALL_RATE caps the calls per second.
+# With both at 0, calls are neither limited nor retried.
+KPR_MAX_INFLIGHT_CALLS = int(os.environ.get('KPR_MAX_INFLIGHT_CALLS', '0'))
+KPR_MAX_CALL_RATE = float(os.environ.get('KPR_MAX_CALL_RATE', '0'))
+KPR_THROTTLE_LATENCY = float(os.environ.get('KPR_THROTTLE_LATENCY', '1.0'))
+KPR_THROTTLE_DIR = os.environ.get('KPR_THROTTLE_DIR', '.kpr/throttle')
+
+# Record the duration of every identity API call and CLI run, tagged by
+# test, phase and persona, under KPR_STATS_DIR (see kpr.utils.stats).
+KPR_STATS = os.environ.get('KPR_STATS', '0') == '1'
+KPR_STATS_DIR = os.environ.get('KPR_STATS_DIR', '.kpr/stats')
+
+# Delete the fixture users and projects leaked by dead local test
+# processes when a test process starts and exits (see kpr.utils.sweeper).
+# `python -m kpr.utils.sweeper --unclaimed` also sweeps those no local
+# process recorded once seen for KPR_SWEEP_AGE seconds; deletions are
+# spaced to KPR_SWEEP_RATE calls per second.
+KPR_SWEEP = os.environ.get('KPR_SWEEP', '1') == '1'
+KPR_SWEEP_DIR = os.environ.get('KPR_SWEEP_DIR', '.kpr/sweep')
+KPR_SWEEP_AGE = float(os.environ.get('KPR_SWEEP_AGE', '3600'))
+KPR_SWEEP_RATE = float(os.environ.get('KPR_SWEEP_RATE', '5'))
+
+_admin_client = None
+_admin_client_lock = threading.Lock()
+
+
 def get_admin_client():
-    auth = v3.Password(
-        auth_url=OS_AUTH_URL,
-        username=OS_USERNAME,
-        project_name=OS_PROJECT_NAME,
-        password=OS_PASSWORD,
-        user_domain_id=OS_USER_DOMAIN_ID,
-        project_domain_id=OS_PROJECT_DOMAIN_ID,
-    )
-    sess = session.Session(auth=auth)
-    return client.Client(session=sess)
+    """Return the cloud admin client shared by the whole test process.
+
+    The Session behind it authenticates again by itself once its token
+    is about to expire.
+    """
+    global _admin_client
+    with _admin_client_lock:
+        if _admin_client is None:
+            auth = v3.Password(
+                auth_url=OS_AUTH_URL,
+                username=OS_USERNAME,
+                project_name=OS_PROJECT_NAME,
+                password=OS_PASSWORD,
+                user_domain_id=OS_USER_DOMAIN_ID,
+                project_domain_id=OS_PROJECT_DOMAIN_ID,
+            )
+            sess = session.Session(auth=auth)
+            _admin_client = client.Client(session=sess)
+        return _admin_client
+
+
+def reset_admin_client():
+    global _admin_client
+    with _admin_client_lock:
+        _admin_client = None
+
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+
+
+def get_session(
+    username=OS_USERNAME,
+    project_name=OS_PROJECT_NAME,
+    password=OS_PASSWORD,
+):
+    """Return the Session of a persona, creating it on first use.
+
+    Every Session owns its own keep-alive connection pool and caches its
+    token, so later calls as the same persona skip both the connection
+    setup and the password authentication.
+    """
+    key = (username, project_name)
+    with _sessions_lock:
+        sess = _sessions.get(key)
+        if sess is None:
+            auth = v3.Password(
+                auth_url=OS_AUTH_URL,
+                username=username,
+                project_name=project_name,
+                password=password,
+                user_domain_id=OS_USER_DOMAIN_ID,
+                project_domain_id=OS_PROJECT_DOMAIN_ID,
+            )
+            sess = _sessions[key] = session.Session(auth=auth)
+        return sess
+
+
+def reset_sessions():
+    with _sessions_lock:
+        _sessions.clear()
+
+
+def forget_sessions(user):
+    """Drop the Sessions of ``user`` (a user resource, id or name)."""
+    keys = set([getattr(user, 'id', user), getattr(user, 'name', user)])
+    with _sessions_lock:
+        for key, sess in list(_sessions.items()):
+            user_id = getattr(sess.auth.auth_ref, 'user_id', None)
+            if key[0] in keys or user_id in keys:
+                del _sessions[key]
@@ -0,0 +1,221 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import atexit
+import collections
+import json
+import os
+import struct
+import subprocess
+import sys
+import threading
+
+from kpr.utils import clients
+
+# A request is the JSON encoded argument list; a response is the exit
+# status followed by the combined output of the command. Both are
+# prefixed with their length.
+_LENGTH = struct.Struct('>I')
+_STATUS = struct.Struct('>i')
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))))
+
+
+class WorkerError(Exception):
+    """A worker died or broke the protocol."""
+
+
+def _read(stream, size):
+    data = b''
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise EOFError()
+        data += chunk
+    return data
+
+
+def _write_frame(stream, data):
+    stream.write(_LENGTH.pack(len(data)) + data)
+    stream.flush()
+
+
+def _read_frame(stream):
+    size, = _LENGTH.unpack(_read(stream, _LENGTH.size))
+    return _read(stream, size)
+
+
+class Worker(object):
+    """A long-lived ``openstack`` process bound to one environment.
+
+    The process runs ``serve`` with ``env`` as its whole environment, so
+    it authenticates as one persona, and executes the commands it is
+    sent one after another.
+    """
+
+    def __init__(self, env):
+        self.env = env
+        self.commands = 0
+        worker_env = dict(env)
+        worker_env['PYTHONPATH'] = os.pathsep.join(
+            p for p in (_ROOT, os.environ.get('PYTHONPATH')) if p)
+        self.process = subprocess.Popen(
+            [sys.executable, '-m', 'kpr.utils.clipool'],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            env=worker_env,
+        )
+
+    def check_output(self, args):
+        """Run ``args`` like ``subprocess.check_output`` would."""
+        self.commands += 1
+        try:
+            _write_frame(
+                self.process.stdin, json.dumps(list(args)).encode('utf-8'))
+            returncode, = _STATUS.unpack(
+                _read(self.process.stdout, _STATUS.size))
+            output = _read_frame(self.process.stdout)
+        except (EOFError, IOError, OSError, struct.error) as e:
+            self.close()
+            raise WorkerError('openstack worker failed: {!r}'.format(e))
+        if returncode:
+            raise subprocess.CalledProcessError(
+                returncode, args, output=output)
+        return output
+
+    def alive(self):
+        return self.process.poll() is None
+
+    def close(self):
+        if self.process.poll() is None:
+            try:
+                self.process.stdin.close()
+                self.process.wait(timeout=5)
+            except (IOError, OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+        self.process.stdout.close()
+
+
+class Pool(object):
+    """Idle ``Worker``s kept by environment for reuse.
+
+    A command takes an idle worker of its environment or starts one, and
+    gives it back afterwards, so concurrent commands of one persona run
+    in separate processes. A worker is replaced after ``commands``
+    commands or when it fails, and the least recently used idle workers
+    are stopped beyond ``size``.
+    """
+
+    def __init__(self, size, commands):
+        self.size = size
+        self.commands = commands
+        self._lock = threading.Lock()
+        self._idle = collections.OrderedDict()
+
+    def check_output(self, args, env):
+        key = tuple(sorted(env.items()))
+        worker = self._take(key, env)
+        try:
+            output = worker.check_output(args)
+        except subprocess.CalledProcessError:
+            self._give(key, worker)
+            raise
+        self._give(key, worker)
+        return output
+
+    def close(self):
+        with self._lock:
+            workers = list(self._idle.values())
+            self._idle.clear()
+        for idle in workers:
+            for worker in idle:
+                worker.close()
+
+    def _take(self, key, env):
+        with self._lock:
+            idle = self._idle.get(key)
+            while idle:
+                worker = idle.pop()
+                if worker.alive():
+                    return worker
+                worker.close()
+        return Worker(env)
+
+    def _give(self, key, worker):
+        if not worker.alive() or worker.commands >= self.commands:
+            worker.close()
+            return
+        stopped = []
+        with self._lock:
+            self._idle.setdefault(key, []).append(worker)
+            self._idle.move_to_end(key)
+            while sum(len(idle) for idle in self._idle.values()) > self.size:
+                oldest = next(iter(self._idle))
+                stopped.append(self._idle[oldest].pop(0))
+                if not self._idle[oldest]:
+                    del self._idle[oldest]
+        for worker in stopped:
+            worker.close()
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = Pool(
+                clients.KPR_CLI_POOL_SIZE, clients.KPR_CLI_WORKER_COMMANDS)
+            atexit.register(_pool.close)
+        return _pool
+
+
+def check_output(args, env):
+    """Run an ``openstack`` command line in a warm worker for ``env``.
+
+    Behaves like ``subprocess.check_output(args, stderr=STDOUT, env=env)``.
+    """
+    return get_pool().check_output(args, env)
+
+
+def serve():
+    """Run commands read from stdin until it is closed."""
+    from kpr.utils import shell
+
+    # Only frames go to the real stdout; stray writes of libraries go to
+    # stderr instead.
+    stdin = os.fdopen(os.dup(0), 'rb')
+    stdout = os.fdopen(os.dup(1), 'wb')
+    os.dup2(2, 1)
+    env = dict(os.environ)
+    while True:
+        try:
+            args = json.loads(_read_frame(stdin).decode('utf-8'))
+        except EOFError:
+            return
+        try:
+            output = shell.run_in_process(args, env)
+            returncode = 0
+        except subprocess.CalledProcessError as e:
+            output = e.output
+            returncode = e.returncode
+        stdout.write(_STATUS.pack(returncode))
+        _write_frame(stdout, output)
+
+
+if __name__ == '__main__':
+    serve()
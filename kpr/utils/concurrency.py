@@ -0,0 +1,88 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from concurrent import futures
+
+from kpr.utils import clients
+
+
+class FixtureError(Exception):
+    """One or more fixture operations failed.
+
+    ``errors`` holds every exception raised by the failed operations.
+    """
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        super(FixtureError, self).__init__(
+            '{} fixture operation(s) failed: {}'.format(
+                len(self.errors),
+                '; '.join(repr(e) for e in self.errors),
+            )
+        )
+
+
+def run_all(calls, workers=None):
+    """Run independent callables side by side and return their results.
+
+    At most ``workers`` (default ``KPR_FIXTURE_WORKERS``) calls run at
+    once. Every call is run even if others fail; the failures are then
+    raised together as a single ``FixtureError``. Callers express
+    dependencies by running the dependent stage in a later ``run_all``.
+    """
+    calls = list(calls)
+    if workers is None:
+        workers = clients.KPR_FIXTURE_WORKERS
+    if workers <= 1 or len(calls) <= 1:
+        outcomes = [_call(c) for c in calls]
+    else:
+        with futures.ThreadPoolExecutor(
+            max_workers=min(workers, len(calls))
+        ) as executor:
+            outcomes = list(executor.map(_call, calls))
+
+    errors = []
+    for _, error in outcomes:
+        if isinstance(error, FixtureError):
+            errors.extend(error.errors)
+        elif error is not None:
+            errors.append(error)
+    if errors:
+        raise FixtureError(errors)
+    return [result for result, _ in outcomes]
+
+
+def run_stages(stages, workers=None):
+    """Run each stage with ``run_all``, one stage after another.
+
+    Later stages run even if an earlier one failed, which suits cleanup
+    where every step should be attempted. All failures are raised
+    together at the end.
+    """
+    errors = []
+    results = []
+    for stage in stages:
+        try:
+            results.append(run_all(stage, workers=workers))
+        except FixtureError as e:
+            errors.extend(e.errors)
+    if errors:
+        raise FixtureError(errors)
+    return results
+
+
+def _call(call):
+    try:
+        return call(), None
+    except Exception as e:
+        return None, e
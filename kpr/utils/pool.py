@@ -0,0 +1,291 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import errno
+import fcntl
+import functools
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+
+from keystoneauth1.exceptions import http
+
+from kpr.utils import assignments
+from kpr.utils import clients
+from kpr.utils import concurrency
+from kpr.utils import sweeper
+
+# Seconds to wait before trying again when every world is leased.
+LEASE_RETRY_INTERVAL = 1
+
+
+def shape_key(fixture_projects):
+    """Return a short key identifying a fixture_projects shape."""
+    shape = []
+    for spec in fixture_projects:
+        # Same defaults as TestCase.setup_project.
+        normalized = {
+            'project': 'project1',
+            'admin': True,
+            'auditor': False,
+            'user': 2,
+        }
+        normalized.update(spec)
+        shape.append(normalized)
+    shape = json.dumps(shape, sort_keys=True)
+    return hashlib.sha1(shape.encode('utf-8')).hexdigest()[:12]
+
+
+class Lease(object):
+    """Exclusive use of one pre-provisioned world.
+
+    ``attributes`` maps fixture attribute names (``admin_auditor``,
+    ``project1``, ``project1_admin``, ...) to keystoneclient resources.
+    The world stays locked for this process until ``release`` is called.
+    """
+
+    def __init__(self, path, lock_file, attributes):
+        self.path = path
+        self.lock_file = lock_file
+        self.attributes = attributes
+
+    def release(self):
+        fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+        self.lock_file.close()
+
+
+def lease(fixtures, fixture_projects, size=None, directory=None):
+    """Lease a world of the given shape, building it if needed.
+
+    ``fixtures`` is a bootstrapped ``kpr.base.TestCase`` used to create
+    the world. Up to ``size`` worlds of each shape are kept in
+    ``directory``; each one is guarded by a file lock, so concurrent test
+    workers never share a world. Worlds outlive the run until ``drain``.
+    A leased world is checked against the role assignments recorded when
+    it was built with a single listing; grants a test added or removed
+    are reverted, and the world is only rebuilt when one of its
+    users or projects is gone.
+    """
+    size = size or clients.KPR_FIXTURE_POOL_SIZE
+    directory = directory or clients.KPR_FIXTURE_POOL_DIR
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    key = shape_key(fixture_projects)
+    while True:
+        for slot in range(size):
+            path = os.path.join(directory, '{}-{}.json'.format(key, slot))
+            lock_file = _try_lock(path + '.lock')
+            if lock_file is None:
+                continue
+            try:
+                world = _load(path)
+                if world is not None and not _repair(fixtures, world):
+                    _destroy(fixtures.admin, world)
+                    os.remove(path)
+                    world = None
+                if world is None:
+                    world = _build(fixtures, fixture_projects)
+                    _save(path, world)
+            except Exception:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+                lock_file.close()
+                raise
+            return Lease(path, lock_file, _resources(fixtures.admin, world))
+        time.sleep(LEASE_RETRY_INTERVAL)
+
+
+def drain(directory=None):
+    """Delete every pooled world. Run it once the whole suite finished."""
+    directory = directory or clients.KPR_FIXTURE_POOL_DIR
+    admin = clients.get_admin_client()
+    for path in sorted(glob.glob(os.path.join(directory, '*.json'))):
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            world = _load(path)
+            if world is not None:
+                _destroy(admin, world)
+                os.remove(path)
+        os.remove(path + '.lock')
+
+
+def _try_lock(path):
+    lock_file = open(path, 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except IOError as e:
+        lock_file.close()
+        if e.errno in (errno.EAGAIN, errno.EACCES):
+            return None
+        raise
+    return lock_file
+
+
+def _load(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except IOError:
+        return None
+
+
+def _save(path, world):
+    with open(path + '.tmp', 'w') as f:
+        json.dump(world, f, sort_keys=True, indent=2)
+    os.rename(path + '.tmp', path)
+
+
+def _build(fixtures, fixture_projects):
+    # Worlds outlive this process, so the sweeper must never take them
+    # for leaked fixtures.
+    fixtures.fixture_marker = sweeper.POOL_MARKER
+    try:
+        fixtures.admin_auditor = fixtures.create_admin_auditor()
+        for spec in fixture_projects:
+            fixtures.setup_project(**spec)
+    except Exception:
+        for spec in fixture_projects:
+            try:
+                fixtures.teardown_project(**spec)
+            except Exception as e:
+                pass
+        if hasattr(fixtures, 'admin_auditor'):
+            fixtures.delete_admin_auditor(fixtures.admin_auditor)
+        raise
+    finally:
+        del fixtures.fixture_marker
+
+    world = {'attributes': {}, 'assignments': []}
+    _record(world, 'users', 'admin_auditor', fixtures.admin_auditor)
+    world['assignments'].append([
+        fixtures.admin_auditor.default_project_id,
+        fixtures.admin_auditor.id,
+        fixtures.cloud_admin_auditor_role.id,
+    ])
+    for spec in fixture_projects:
+        project = getattr(fixtures, spec.get('project', 'project1'))
+        _record(world, 'projects', spec.get('project', 'project1'), project)
+        for attribute, role in fixtures.get_project_users(**spec):
+            user = getattr(fixtures, attribute)
+            _record(world, 'users', attribute, user)
+            world['assignments'].append([project.id, user.id, role.id])
+    return world
+
+
+def _record(world, kind, attribute, resource):
+    world['attributes'][attribute] = {
+        'kind': kind,
+        'info': resource.to_dict(),
+    }
+
+
+def _resources(admin, world):
+    resources = {}
+    for attribute, record in world['attributes'].items():
+        manager = getattr(admin, record['kind'])
+        resources[attribute] = manager.resource_class(
+            manager, record['info'], loaded=True)
+    return resources
+
+
+def _drift(fixtures, world):
+    """Return the (missing, extra) role assignments of ``world``.
+
+    The identity API filters role assignments by one user or one project
+    only, so a single listing of the whole cloud, filtered here, covers
+    every user and project of the world in one call per lease. Its size
+    (and the lease check) grows with the assignments of the cloud; grants
+    of the world's users on projects outside the world are seen too.
+    """
+    expected = set(tuple(a) for a in world['assignments'])
+    project_ids = set(project_id for project_id, _, _ in expected)
+    project_ids.update(
+        r['info']['id'] for r in world['attributes'].values()
+        if r['kind'] == 'projects'
+    )
+    user_ids = set(user_id for _, user_id, _ in expected)
+    # Only the admin project is shared with the rest of the cloud, so only
+    # the assignments of this world's users count there.
+    auditor = world['attributes']['admin_auditor']['info']
+    shared = auditor['default_project_id']
+
+    actual = set()
+    for assignment in fixtures.admin.role_assignments.list():
+        user = getattr(assignment, 'user', None)
+        project = getattr(assignment, 'scope', {}).get('project')
+        if user is None or project is None:
+            continue
+        if user['id'] in user_ids or (project['id'] in project_ids and
+                                      project['id'] != shared):
+            actual.add((project['id'], user['id'], assignment.role['id']))
+    return expected - actual, actual - expected
+
+
+def _repair(fixtures, world):
+    """Revert the grant changes of ``world``; False if it must be rebuilt."""
+    missing, extra = _drift(fixtures, world)
+    if not missing and not extra:
+        return True
+    admin = fixtures.admin
+    try:
+        concurrency.run_stages([
+            [
+                functools.partial(
+                    admin.roles.revoke, role, user=user, project=project)
+                for project, user, role in extra
+            ],
+            [
+                functools.partial(
+                    admin.roles.grant, role, user=user, project=project)
+                for project, user, role in missing
+            ],
+        ])
+    except concurrency.FixtureError as e:
+        if any(isinstance(error, http.NotFound) for error in e.errors):
+            # A user or project of the world was deleted.
+            return False
+        raise
+    finally:
+        assignments.snapshot.invalidate()
+        for _, user, _ in missing | extra:
+            fixtures.invalidate_credentials(user)
+    return True
+
+
+def _destroy(admin, world):
+    def delete(manager, resource_id):
+        try:
+            manager.delete(resource_id)
+        except http.NotFound:
+            pass
+
+    records = world['attributes'].values()
+    concurrency.run_stages([
+        [
+            functools.partial(delete, admin.users, r['info']['id'])
+            for r in records if r['kind'] == 'users'
+        ],
+        [
+            functools.partial(delete, admin.projects, r['info']['id'])
+            for r in records if r['kind'] == 'projects'
+        ],
+    ])
+
+
+if __name__ == '__main__':
+    if sys.argv[1:] != ['drain']:
+        sys.exit('usage: python -m kpr.utils.pool drain')
+    drain()
@@ -0,0 +1,57 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import threading
+
+from keystoneauth1.exceptions import http
+
+from kpr.utils import clients
+
+
+class Registry(object):
+    """Roles and projects resolved by name once per test process.
+
+    All roles are fetched with a single list call the first time any of
+    them is needed. Call ``invalidate`` after creating, renaming or
+    deleting roles or shared projects.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._roles = None
+        self._projects = {}
+
+    def find_role(self, name):
+        with self._lock:
+            if self._roles is None:
+                admin = clients.get_admin_client()
+                self._roles = dict((r.name, r) for r in admin.roles.list())
+            try:
+                return self._roles[name]
+            except KeyError:
+                raise http.NotFound('No role with a name of {}'.format(name))
+
+    def find_project(self, name):
+        with self._lock:
+            if name not in self._projects:
+                admin = clients.get_admin_client()
+                self._projects[name] = admin.projects.find(name=name)
+            return self._projects[name]
+
+    def invalidate(self):
+        with self._lock:
+            self._roles = None
+            self._projects.clear()
+
+
+registry = Registry()
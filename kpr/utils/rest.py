@@ -0,0 +1,257 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import subprocess
+
+from keystoneauth1.exceptions import http
+
+from kpr.utils import clients
+
+_VALUE_OPTIONS = (
+    '--description',
+    '--domain',
+    '--email',
+    '--name',
+    '--password',
+    '--project',
+    '--user',
+)
+
+
+class RestError(subprocess.CalledProcessError):
+    """An identity API call made by the REST backend failed.
+
+    ``status_code`` holds the HTTP status. It subclasses
+    ``CalledProcessError`` and keeps the Keystone error message (which
+    contains e.g. ``HTTP 403``) in ``output``, so assertions written for
+    the CLI keep working.
+    """
+
+    def __init__(self, status_code, command, message):
+        super(RestError, self).__init__(
+            1, command, output=message.encode('utf-8'))
+        self.status_code = status_code
+
+    def __str__(self):
+        return self.output.decode('utf-8')
+
+
+def _parse(args):
+    positionals = []
+    options = {}
+    args = list(args)
+    while args:
+        arg = args.pop(0)
+        if arg in _VALUE_OPTIONS:
+            options[arg[2:]] = args.pop(0)
+        elif arg.startswith('--'):
+            options[arg[2:]] = True
+        else:
+            positionals.append(arg)
+    return positionals, options
+
+
+def _url(path):
+    return '{}{}'.format(clients.OS_AUTH_URL, path)
+
+
+def _get(sess, path, **params):
+    return sess.get(_url(path), params=params).json()
+
+
+def _strip_links(resource):
+    return dict((k, v) for k, v in resource.items() if k != 'links')
+
+
+def _id_name(resources):
+    return [{'ID': r['id'], 'Name': r['name']} for r in resources]
+
+
+def _find(sess, collection, key, name_or_id):
+    try:
+        return _get(sess, '/{}/{}'.format(collection, name_or_id))[key]
+    except http.NotFound:
+        found = _get(sess, '/{}'.format(collection), name=name_or_id)
+        if len(found[collection]) != 1:
+            raise
+        return found[collection][0]
+
+
+def _user_body(options):
+    body = {}
+    if 'name' in options:
+        body['name'] = options['name']
+    if 'domain' in options:
+        body['domain_id'] = options['domain']
+    if 'project' in options:
+        body['default_project_id'] = options['project']
+    if 'password' in options:
+        body['password'] = options['password']
+    if 'email' in options:
+        body['email'] = options['email']
+    if 'description' in options:
+        body['description'] = options['description']
+    if 'enable' in options:
+        body['enabled'] = True
+    if 'disable' in options:
+        body['enabled'] = False
+    return body
+
+
+def user_list(sess, positionals, options):
+    if 'project' not in options:
+        return _id_name(_get(sess, '/users')['users'])
+
+    # Same calls as `openstack user list --project`.
+    assignments = _get(
+        sess,
+        '/role_assignments',
+        **{'scope.project.id': options['project']}
+    )['role_assignments']
+    user_ids = sorted(set(
+        a['user']['id'] for a in assignments if 'user' in a
+    ))
+    return _id_name(
+        _get(sess, '/users/{}'.format(user_id))['user']
+        for user_id in user_ids
+    )
+
+
+def user_show(sess, positionals, options):
+    return _strip_links(_find(sess, 'users', 'user', positionals[0]))
+
+
+def user_create(sess, positionals, options):
+    body = _user_body(options)
+    body['name'] = positionals[0]
+    user = sess.post(_url('/users'), json={'user': body}).json()['user']
+    return _strip_links(user)
+
+
+def user_set(sess, positionals, options):
+    sess.patch(
+        _url('/users/{}'.format(positionals[0])),
+        json={'user': _user_body(options)},
+    )
+
+
+def user_delete(sess, positionals, options):
+    for user_id in positionals:
+        sess.delete(_url('/users/{}'.format(user_id)))
+
+
+def role_list(sess, positionals, options):
+    return _id_name(_get(sess, '/roles')['roles'])
+
+
+def role_show(sess, positionals, options):
+    return _strip_links(_find(sess, 'roles', 'role', positionals[0]))
+
+
+def _grant_path(sess, positionals, options):
+    role = _find(sess, 'roles', 'role', positionals[0])
+    return _url('/projects/{}/users/{}/roles/{}'.format(
+        options['project'], options['user'], role['id']))
+
+
+def role_add(sess, positionals, options):
+    sess.put(_grant_path(sess, positionals, options))
+
+
+def role_remove(sess, positionals, options):
+    sess.delete(_grant_path(sess, positionals, options))
+
+
+def role_assignment_list(sess, positionals, options):
+    params = {}
+    if 'project' in options:
+        params['scope.project.id'] = options['project']
+    if 'user' in options:
+        params['user.id'] = options['user']
+    if 'names' in options:
+        params['include_names'] = True
+    assignments = _get(sess, '/role_assignments', **params)
+
+    def ref(assignment, key):
+        resource = assignment.get(key)
+        if resource is None:
+            return ''
+        if 'names' in options:
+            return resource['name']
+        return resource['id']
+
+    return [
+        {
+            'Role': ref(a, 'role'),
+            'User': ref(a, 'user'),
+            'Group': ref(a, 'group'),
+            'Project': ref(a.get('scope', {}), 'project'),
+            'Domain': ref(a.get('scope', {}), 'domain'),
+            'Inherited': False,
+        }
+        for a in assignments['role_assignments']
+    ]
+
+
+def project_list(sess, positionals, options):
+    try:
+        projects = _get(sess, '/projects')['projects']
+    except http.Forbidden:
+        # Same fallback as `openstack project list` for non-admin users.
+        user_id = sess.get_user_id()
+        projects = _get(
+            sess, '/users/{}/projects'.format(user_id))['projects']
+    return _id_name(projects)
+
+
+def project_show(sess, positionals, options):
+    return _strip_links(_find(sess, 'projects', 'project', positionals[0]))
+
+
+COMMANDS = {
+    ('project', 'list'): project_list,
+    ('project', 'show'): project_show,
+    ('role', 'add'): role_add,
+    ('role', 'assignment'): role_assignment_list,
+    ('role', 'list'): role_list,
+    ('role', 'remove'): role_remove,
+    ('role', 'show'): role_show,
+    ('user', 'create'): user_create,
+    ('user', 'delete'): user_delete,
+    ('user', 'list'): user_list,
+    ('user', 'set'): user_set,
+    ('user', 'show'): user_show,
+}
+
+
+def run(command, project='admin', username='admin'):
+    """Run an ``openstack`` command as identity API calls.
+
+    ``command`` uses the same form as ``TestCase.os_run``, for example
+    ``['user', 'show', user_id]``. The result has the same shape as the
+    JSON the CLI prints (``None`` for commands without output). Failed
+    API calls raise ``RestError``; commands the backend does not know
+    raise ``ValueError``.
+    """
+    try:
+        action = COMMANDS[tuple(command[:2])]
+    except KeyError:
+        raise ValueError(
+            "REST backend does not support '{}'".format(' '.join(command)))
+
+    positionals, options = _parse(command[2:])
+    sess = clients.get_session(username=username, project_name=project)
+    try:
+        return action(sess, positionals, options)
+    except http.HttpError as e:
+        raise RestError(e.http_status, ['openstack'] + command, str(e))
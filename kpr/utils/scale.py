@@ -0,0 +1,312 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import collections
+import csv
+import functools
+import io
+import json
+import os
+import sys
+import threading
+import time
+
+from keystoneauth1.exceptions import http
+from requests import adapters
+
+from kpr.utils import clients
+from kpr.utils import concurrency
+from kpr.utils import rest
+from kpr.utils import seed
+from kpr.utils import stats
+from kpr.utils import throttle
+
+DIRECTORY = '.kpr/scale'
+
+COLUMNS = [
+    'projects', 'users_per_project', 'total_users', 'persona', 'operation',
+    'status', 'calls', 'bytes', 'p50_ms', 'p95_ms', 'max_ms',
+]
+
+_counter = threading.local()
+_installed = False
+_lock = threading.Lock()
+
+
+class World(object):
+    """The projects and users seeded for scale runs.
+
+    Every project has a project admin, a project auditor and
+    ``members``; an admin auditor lives in the admin project. The ids of
+    what was seeded are kept in ``path`` for the measurements.
+    """
+
+    def __init__(self, path, prefix):
+        self.path = path
+        self.prefix = prefix
+        self.data = {'prefix': prefix, 'auditor': None, 'projects': []}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.data = json.load(f)
+
+    @property
+    def projects(self):
+        return self.data['projects']
+
+    def save(self):
+        directory = os.path.dirname(self.path)
+        if directory and not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path + '.tmp', 'w') as f:
+            json.dump(self.data, f)
+        os.rename(self.path + '.tmp', self.path)
+
+    def user_count(self):
+        return sum(2 + len(p['members']) for p in self.projects)
+
+
+def describe(prefix, projects, members):
+    """Return the seed description of ``projects`` projects of ``members``."""
+    description = {
+        'users': [{
+            'name': '{}-admin-auditor'.format(prefix),
+            'project': clients.OS_ADMIN_PROJECT_NAME,
+        }],
+        'projects': [],
+        'grants': [{
+            'user': '{}-admin-auditor'.format(prefix),
+            'project': clients.OS_ADMIN_PROJECT_NAME,
+            'role': 'admin_auditor',
+        }],
+    }
+    for index in range(projects):
+        project = '{}-p{}'.format(prefix, index)
+        description['projects'].append({'name': project})
+        users = [
+            ('{}-admin'.format(project), 'project_admin'),
+            ('{}-auditor'.format(project), 'project_auditor'),
+        ] + [
+            ('{}-u{}'.format(project, i), 'Member') for i in range(members)
+        ]
+        for name, role in users:
+            description['users'].append({'name': name, 'project': project})
+            description['grants'].append(
+                {'user': name, 'project': project, 'role': role})
+    return description
+
+
+def grow(world, projects, members, workers=None):
+    """Seed ``world`` until it has ``projects`` projects with ``members``.
+
+    Only the missing projects, users and grants are created (see
+    kpr.utils.seed), so an interrupted seeding simply resumes.
+    """
+    result = seed.apply(
+        describe(world.prefix, projects, members), workers=workers)
+    ids = result['users']
+
+    def user(name):
+        return {'id': ids[name], 'name': name}
+
+    world.data['auditor'] = user('{}-admin-auditor'.format(world.prefix))
+    for index in range(projects):
+        name = '{}-p{}'.format(world.prefix, index)
+        if index == len(world.projects):
+            world.projects.append({'name': name, 'members': []})
+        project = world.projects[index]
+        project['id'] = result['projects'][name]
+        project['admin'] = user('{}-admin'.format(name))
+        project['auditor'] = user('{}-auditor'.format(name))
+        for i in range(len(project['members']), members):
+            project['members'].append(user('{}-u{}'.format(name, i)))
+    world.save()
+
+
+def destroy(world, workers=None):
+    """Delete every user and project named after the world's prefix."""
+    admin = clients.get_admin_client()
+
+    def delete(manager, resource_id):
+        try:
+            manager.delete(resource_id)
+        except http.NotFound:
+            pass
+
+    def owned(resources):
+        return [
+            r.id for r in resources
+            if r.name.startswith(world.prefix + '-')
+        ]
+
+    concurrency.run_stages([
+        [
+            functools.partial(delete, admin.users, user_id)
+            for user_id in owned(admin.users.list(
+                domain=clients.OS_USER_DOMAIN_ID))
+        ],
+        [
+            functools.partial(delete, admin.projects, project_id)
+            for project_id in owned(admin.projects.list(
+                domain=clients.OS_PROJECT_DOMAIN_ID))
+        ],
+    ], workers=workers)
+    if os.path.exists(world.path):
+        os.remove(world.path)
+
+
+def _install_counter():
+    global _installed
+    with _lock:
+        if _installed:
+            return
+        send = adapters.HTTPAdapter.send
+
+        def counted_send(adapter, request, **kwargs):
+            response = send(adapter, request, **kwargs)
+            if getattr(_counter, 'calls', None) is not None:
+                _counter.calls += 1
+                _counter.bytes += len(response.content)
+            return response
+
+        adapters.HTTPAdapter.send = counted_send
+        _installed = True
+
+
+def personas(world, project):
+    """Return {persona tier: (username, project name)} for ``project``."""
+    result = collections.OrderedDict([
+        ('cloud_admin', (clients.OS_ADMIN_USERNAME,
+                         clients.OS_ADMIN_PROJECT_NAME)),
+        ('admin_auditor', (world.data['auditor']['name'],
+                           clients.OS_ADMIN_PROJECT_NAME)),
+        ('project_admin', (project['admin']['name'], project['name'])),
+        ('project_auditor', (project['auditor']['name'], project['name'])),
+    ])
+    if project['members']:
+        result['member'] = (project['members'][0]['name'], project['name'])
+    return result
+
+
+def operations(project):
+    return collections.OrderedDict([
+        ('user list', ['user', 'list']),
+        ('user list --project', ['user', 'list', '--project', project['id']]),
+        ('role assignment list --project',
+         ['role', 'assignment', 'list', '--project', project['id']]),
+        ('project show', ['project', 'show', project['id']]),
+    ])
+
+
+def measure(world, repeat=5):
+    """Time each operation as each persona tier on the first project.
+
+    Returns one row (a dict of ``COLUMNS``) per persona and operation.
+    Every operation runs ``repeat`` times after a warm-up that
+    authenticates the persona.
+    """
+    _install_counter()
+    project = world.projects[0]
+    rows = []
+    for persona, (username, project_name) in personas(
+            world, project).items():
+        for operation, command in operations(project).items():
+            durations = []
+            status = 'ok'
+            for attempt in range(repeat + 1):
+                _counter.calls = 0
+                _counter.bytes = 0
+                started = time.time()
+                try:
+                    rest.run(command, project=project_name, username=username)
+                except rest.RestError as e:
+                    status = str(e.status_code)
+                if attempt:
+                    durations.append(time.time() - started)
+            calls, size = _counter.calls, _counter.bytes
+            _counter.calls = None
+            durations.sort()
+            rows.append(collections.OrderedDict([
+                ('projects', len(world.projects)),
+                ('users_per_project', len(project['members'])),
+                ('total_users', world.user_count()),
+                ('persona', persona),
+                ('operation', operation),
+                ('status', status),
+                ('calls', calls),
+                ('bytes', size),
+                ('p50_ms', stats.percentile(durations, 50) * 1000),
+                ('p95_ms', stats.percentile(durations, 95) * 1000),
+                ('max_ms', durations[-1] * 1000),
+            ]))
+    return rows
+
+
+def format_csv(rows):
+    output = io.StringIO()
+    writer = csv.DictWriter(output, COLUMNS, lineterminator='\n')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(dict(
+            (k, '{:.1f}'.format(v) if isinstance(v, float) else v)
+            for k, v in row.items()))
+    return output.getvalue()
+
+
+def _sizes(text):
+    return sorted(set(int(size) for size in text.split(',')))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Seed a large identity world and time the policy '
+                    'sensitive listings on it.')
+    arg_parser.add_argument(
+        'command', choices=['run', 'destroy'],
+        help='seed and measure every size, or delete the seeded world')
+    arg_parser.add_argument(
+        '--projects', type=_sizes, default=[1, 10, 100],
+        help='comma separated numbers of projects (N)')
+    arg_parser.add_argument(
+        '--users', type=_sizes, default=[10],
+        help='comma separated numbers of members per project (M)')
+    arg_parser.add_argument('--repeat', type=int, default=5)
+    arg_parser.add_argument('--prefix', default='kpr-scale')
+    arg_parser.add_argument(
+        '--workers', type=int, default=clients.KPR_FIXTURE_WORKERS)
+    args = arg_parser.parse_args(argv)
+
+    stats.install()
+    throttle.install()
+    world = World(
+        os.path.join(DIRECTORY, '{}.json'.format(args.prefix)), args.prefix)
+    if args.command == 'destroy':
+        destroy(world, args.workers)
+        return 0
+
+    # The world only grows. With M ascending in the outer loop every point
+    # measures a first project of exactly M members, while the totals
+    # reported are what the cloud actually holds.
+    rows = []
+    for members in args.users:
+        for projects in args.projects:
+            grow(world, projects, members, args.workers)
+            rows.extend(measure(world, args.repeat))
+            sys.stderr.write('measured {} projects, {} members\n'.format(
+                len(world.projects), members))
+    sys.stdout.write(format_csv(rows))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,323 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import collections
+import dbm
+import json
+import multiprocessing
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from kpr import base
+from kpr.utils import clients
+from kpr.utils import pool
+from kpr.utils import stats
+
+# Per-test durations recorded by `testr load` / `testr run`.
+TIMES = '.testrepository/times.dbm'
+
+# Per-test API call counts of a previous KPR_STATS=1 run.
+CALLS = os.path.join(clients.KPR_STATS_DIR, stats.REPORT)
+
+# Used while there is no history to measure them.
+DEFAULT_SECONDS_PER_CALL = 0.2
+BODY_CALLS = 3
+MIN_COST = 0.01
+
+# A group of tests that must run on the same worker. ``setup`` is the
+# part of ``cost`` a worker does not pay again when it already ran a unit
+# with the same ``key`` (a pooled fixture shape).
+Unit = collections.namedtuple('Unit', ['key', 'tests', 'setup', 'cost'])
+
+
+def discover(test_path='./kpr', top_level_dir='./'):
+    """Return the test cases found like `.testr.conf` finds them."""
+    suite = unittest.TestLoader().discover(
+        test_path, top_level_dir=top_level_dir)
+    tests = []
+    _flatten(suite, tests)
+    return tests
+
+
+def _flatten(suite, tests):
+    for test in suite:
+        if isinstance(test, unittest.TestSuite):
+            _flatten(test, tests)
+        else:
+            tests.append(test)
+
+
+def load_times(path=TIMES):
+    """Return {test id: seconds} recorded by testrepository."""
+    try:
+        db = dbm.open(path, 'r')
+    except dbm.error:
+        return {}
+    try:
+        return dict(
+            (key.decode('utf-8'), float(db[key])) for key in db.keys())
+    finally:
+        db.close()
+
+
+def load_calls(path=CALLS):
+    """Return {test id: API calls} measured by a previous run."""
+    try:
+        with open(path) as f:
+            data = json.load(f)
+    except IOError:
+        return {}
+    return dict(
+        (test_id, record['calls'])
+        for test_id, record in data.get('tests', {}).items())
+
+
+def seconds_per_call(times, calls):
+    """Return the median duration of an API call over the known tests."""
+    ratios = sorted(
+        times[t] / calls[t] for t in set(times) & set(calls) if calls[t])
+    if not ratios:
+        return DEFAULT_SECONDS_PER_CALL
+    return ratios[len(ratios) // 2]
+
+
+def fixture_calls(cls):
+    """Estimate the API calls of one setup and teardown of ``cls``."""
+    # Create and grant, then revoke and delete, the admin auditor.
+    total = 4
+    for spec in cls.fixture_projects:
+        users = (int(spec.get('admin', True)) +
+                 int(spec.get('auditor', False)) +
+                 spec.get('user', 2))
+        # Project creation and deletion, and the same four per user.
+        total += 2 + 4 * users
+    return total
+
+
+def _shares_fixtures(cls):
+    # With the fake Keystone every class builds its fixtures once.
+    return cls.fixture_scope == 'class' or bool(clients.KPR_FAKE_KEYSTONE)
+
+
+def _pooled(cls):
+    return (cls.fixture_scope == 'class' and bool(cls.fixture_projects) and
+            clients.KPR_FIXTURE_POOL_SIZE > 0 and
+            not clients.KPR_FAKE_KEYSTONE)
+
+
+def units(tests, times=None, calls=None):
+    """Group ``tests`` into the ``Unit``s the scheduler places."""
+    times = times or {}
+    calls = calls or {}
+    per_call = seconds_per_call(times, calls)
+    by_class = collections.OrderedDict()
+    for test in tests:
+        by_class.setdefault(type(test), []).append(test.id())
+
+    result = []
+    for cls, test_ids in by_class.items():
+        if not issubclass(cls, base.TestCase):
+            result.extend(
+                Unit(None, [t], 0, times.get(t, MIN_COST)) for t in test_ids)
+            continue
+
+        fixtures = fixture_calls(cls) * per_call
+        if not _shares_fixtures(cls):
+            # Every test pays for its own fixtures; its recorded time
+            # already includes them.
+            result.extend(
+                Unit(None, [t], 0, times.get(
+                    t, calls[t] * per_call if t in calls else
+                    BODY_CALLS * per_call + fixtures))
+                for t in test_ids)
+            continue
+
+        cost = fixtures + sum(
+            times.get(t, calls.get(t, BODY_CALLS) * per_call)
+            for t in test_ids)
+        if _pooled(cls):
+            # A world leased from the pool is only built once per worker.
+            result.append(Unit(
+                pool.shape_key(cls.fixture_projects), test_ids, fixtures,
+                cost))
+        else:
+            result.append(Unit(None, test_ids, 0, cost))
+    return result
+
+
+class Plan(object):
+    """Test ids assigned to each worker, with their estimated seconds."""
+
+    def __init__(self, concurrency):
+        self.tests = [[] for _ in range(concurrency)]
+        self.loads = [0.0] * concurrency
+        self.keys = [set() for _ in range(concurrency)]
+
+    @property
+    def makespan(self):
+        return max(self.loads)
+
+    def cost(self, worker, unit):
+        if unit.key is not None and unit.key in self.keys[worker]:
+            return unit.cost - unit.setup
+        return unit.cost
+
+    def add(self, unit):
+        worker = min(
+            range(len(self.loads)),
+            key=lambda w: (self.loads[w] + self.cost(w, unit), w))
+        self.loads[worker] += self.cost(worker, unit)
+        self.tests[worker].extend(unit.tests)
+        if unit.key is not None:
+            self.keys[worker].add(unit.key)
+
+    def format(self):
+        lines = []
+        for worker, tests in enumerate(self.tests):
+            lines.append('worker {}: {:.1f}s, {} tests'.format(
+                worker, self.loads[worker], len(tests)))
+        lines.append('makespan: {:.1f}s'.format(self.makespan))
+        return ''.join(line + '\n' for line in lines)
+
+
+def partition(all_units, concurrency):
+    """Bin-pack ``all_units`` onto ``concurrency`` workers.
+
+    Units are placed longest first on the worker where they would finish
+    earliest (LPT), counting the fixtures a worker can reuse. Units of the
+    same pooled shape are first placed together; a shape is only spread
+    over several workers when it alone would be longer than an even share
+    of the run.
+    """
+    shapes = collections.OrderedDict()
+    singles = []
+    for unit in all_units:
+        if unit.key is None:
+            singles.append(unit)
+        else:
+            shapes.setdefault(unit.key, []).append(unit)
+
+    total = sum(u.cost for u in all_units)
+    share = total / concurrency
+    placed = list(singles)
+    for key, members in shapes.items():
+        setup = max(u.setup for u in members)
+        bundle = Unit(
+            key,
+            [t for u in members for t in u.tests],
+            setup,
+            setup + sum(u.cost - u.setup for u in members),
+        )
+        if bundle.cost > share and len(members) > 1:
+            placed.extend(members)
+        else:
+            placed.append(bundle)
+
+    plan = Plan(concurrency)
+    for unit in sorted(placed, key=lambda u: -u.cost):
+        plan.add(unit)
+    return plan
+
+
+def worker_command(load_list, test_path='./kpr'):
+    return [
+        sys.executable, '-m', 'subunit.run', 'discover', '-t', './',
+        test_path, '--load-list', load_list,
+    ]
+
+
+def run(plan, max_inflight=0, test_path='./kpr', output=None):
+    """Run every worker of ``plan`` and write their subunit streams.
+
+    The streams are written to ``output`` (default stdout) one after
+    another once all workers finished, ready for `testr load`. Returns
+    the first non-zero exit status of the workers. With KPR_STATS=1 the
+    API call report of the run is printed to stderr at the end.
+    """
+    output = output or getattr(sys.stdout, 'buffer', sys.stdout)
+    directory = tempfile.mkdtemp(prefix='kpr-schedule-')
+    env = dict(os.environ)
+    if max_inflight:
+        env['KPR_MAX_INFLIGHT_CALLS'] = str(max_inflight)
+
+    if clients.KPR_STATS:
+        stats.clear()
+    try:
+        workers = []
+        for worker, tests in enumerate(plan.tests):
+            if not tests:
+                continue
+            load_list = os.path.join(directory, '{}.list'.format(worker))
+            with open(load_list, 'w') as f:
+                f.write(''.join(t + '\n' for t in tests))
+            stream_path = os.path.join(
+                directory, '{}.subunit'.format(worker))
+            stream = open(stream_path, 'wb')
+            process = subprocess.Popen(
+                worker_command(load_list, test_path), stdout=stream, env=env)
+            workers.append((process, stream, stream_path))
+
+        status = 0
+        for process, stream, _ in workers:
+            returncode = process.wait()
+            status = status or returncode
+            stream.close()
+        for _, _, stream_path in workers:
+            with open(stream_path, 'rb') as f:
+                shutil.copyfileobj(f, output)
+        output.flush()
+        if clients.KPR_STATS:
+            stats.report(output=sys.stderr)
+        return status
+    finally:
+        shutil.rmtree(directory)
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Schedule the tests on workers by their past cost.')
+    arg_parser.add_argument(
+        'command', choices=['plan', 'run'],
+        help='print the partition, or run it and write subunit to stdout')
+    arg_parser.add_argument(
+        '--concurrency', type=int, default=multiprocessing.cpu_count())
+    arg_parser.add_argument(
+        '--max-inflight', type=int, default=clients.KPR_MAX_INFLIGHT_CALLS,
+        help='cap on the API calls in flight across all workers')
+    arg_parser.add_argument('--times', default=TIMES)
+    arg_parser.add_argument('--calls', default=CALLS)
+    arg_parser.add_argument('--test-path', default='./kpr')
+    args = arg_parser.parse_args(argv)
+
+    plan = partition(
+        units(
+            discover(args.test_path),
+            load_times(args.times),
+            load_calls(args.calls),
+        ),
+        args.concurrency,
+    )
+    if args.command == 'plan':
+        sys.stdout.write(plan.format())
+        return 0
+    sys.stderr.write(plan.format())
+    return run(plan, args.max_inflight, args.test_path)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
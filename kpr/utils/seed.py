@@ -0,0 +1,198 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import functools
+import json
+import sys
+
+from kpr.utils import clients
+from kpr.utils import concurrency
+
+
+class SeedError(Exception):
+    """The description refers to something it does not define."""
+
+
+def load(path):
+    """Read a seed description.
+
+    A description is a JSON object with optional ``roles`` (names),
+    ``projects`` (objects with ``name`` and optional ``description``),
+    ``users`` (objects with ``name`` and optional ``project``,
+    ``password`` and ``description``) and ``grants`` (objects with
+    ``user``, ``project`` and ``role`` names). Projects are created in
+    ``OS_PROJECT_DOMAIN_ID`` and users in ``OS_USER_DOMAIN_ID``, unless
+    an optional ``domain`` names the domain of both.
+    """
+    with open(path) as f:
+        return json.load(f)
+
+
+class State(object):
+    """The roles, projects and users that already exist, by name."""
+
+    def __init__(self, admin, project_domain, user_domain):
+        self.roles = dict((r.name, r.id) for r in admin.roles.list())
+        self.projects = dict(
+            (p.name, p.id)
+            for p in admin.projects.list(domain=project_domain))
+        self.users = dict(
+            (u.name, u.id) for u in admin.users.list(domain=user_domain))
+        self._grants = None
+        self._admin = admin
+
+    def grants(self):
+        """Return the (project id, user id, role id) assignments."""
+        if self._grants is None:
+            self._grants = set()
+            for assignment in self._admin.role_assignments.list():
+                user = getattr(assignment, 'user', None)
+                project = getattr(assignment, 'scope', {}).get('project')
+                if user is not None and project is not None:
+                    self._grants.add(
+                        (project['id'], user['id'], assignment.role['id']))
+        return self._grants
+
+
+def _find(names, kind, name):
+    try:
+        return names[name]
+    except KeyError:
+        raise SeedError('unknown {} {!r}'.format(kind, name))
+
+
+def apply(description, workers=None, dry_run=False, admin=None):
+    """Create what ``description`` defines and Keystone lacks.
+
+    Existing roles, projects, users and grants are found by name with a
+    handful of list calls and left untouched, so applying a description
+    again only creates what is missing. Roles and projects, then users,
+    then grants are created side by side through one admin session.
+    Returns a dict with the ``roles``, ``projects`` and ``users`` ids by
+    name and, in ``created``, the names of what was (or, with
+    ``dry_run``, would be) created.
+    """
+    admin = admin or clients.get_admin_client()
+    project_domain = description.get(
+        'domain', clients.OS_PROJECT_DOMAIN_ID)
+    user_domain = description.get('domain', clients.OS_USER_DOMAIN_ID)
+    state = State(admin, project_domain, user_domain)
+    created = {'roles': [], 'projects': [], 'users': [], 'grants': []}
+
+    def create(kind, names, name, call):
+        created[kind].append(name)
+        if not dry_run:
+            names[name] = call().id
+
+    roles = [
+        functools.partial(
+            create, 'roles', state.roles, name,
+            functools.partial(admin.roles.create, name))
+        for name in description.get('roles', ())
+        if name not in state.roles
+    ]
+    projects = [
+        functools.partial(
+            create, 'projects', state.projects, project['name'],
+            functools.partial(
+                admin.projects.create, project['name'], project_domain,
+                description=project.get('description')))
+        for project in description.get('projects', ())
+        if project['name'] not in state.projects
+    ]
+    concurrency.run_all(roles + projects, workers=workers)
+
+    def user_call(user):
+        project = user.get('project')
+        return functools.partial(
+            admin.users.create, user['name'],
+            domain=user_domain,
+            default_project=(
+                _find(state.projects, 'project', project)
+                if project and not dry_run else None),
+            password=user.get('password', clients.OS_PASSWORD),
+            description=user.get('description'),
+        )
+
+    concurrency.run_all(
+        (
+            functools.partial(
+                create, 'users', state.users, user['name'], user_call(user))
+            for user in description.get('users', ())
+            if user['name'] not in state.users
+        ),
+        workers=workers,
+    )
+
+    grants = []
+    for grant in description.get('grants', ()):
+        names = (grant['project'], grant['user'], grant['role'])
+        if dry_run and (
+                grant['project'] in created['projects'] or
+                grant['user'] in created['users'] or
+                grant['role'] in created['roles']):
+            created['grants'].append(names)
+            continue
+        key = (
+            _find(state.projects, 'project', grant['project']),
+            _find(state.users, 'user', grant['user']),
+            _find(state.roles, 'role', grant['role']),
+        )
+        # Assignments are only listed when a grant could already exist.
+        if (grant['project'] in created['projects'] or
+                grant['user'] in created['users'] or
+                key not in state.grants()):
+            grants.append((names, key))
+
+    def grant_call(names, key):
+        created['grants'].append(names)
+        if not dry_run:
+            project, user, role = key
+            admin.roles.grant(role, user=user, project=project)
+
+    concurrency.run_all(
+        (functools.partial(grant_call, names, key) for names, key in grants),
+        workers=workers,
+    )
+    return {
+        'roles': state.roles,
+        'projects': state.projects,
+        'users': state.users,
+        'created': created,
+    }
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Create the roles, projects, users and grants of a '
+                    'JSON description that Keystone lacks.')
+    arg_parser.add_argument('description', help='path of the description')
+    arg_parser.add_argument(
+        '--workers', type=int, default=clients.KPR_FIXTURE_WORKERS,
+        help='calls made at once')
+    arg_parser.add_argument('--dry-run', action='store_true')
+    args = arg_parser.parse_args(argv)
+
+    result = apply(
+        load(args.description), workers=args.workers, dry_run=args.dry_run)
+    for kind in ('roles', 'projects', 'users', 'grants'):
+        for name in result['created'][kind]:
+            if kind == 'grants':
+                name = '{2} to {1} on {0}'.format(*name)
+            print('{} {}'.format(kind[:-1], name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import io
+import logging
+import mock
+import os
+import subprocess
+import threading
+
+from openstackclient import shell
+
+_lock = threading.Lock()
+
+
+@contextlib.contextmanager
+def _preserve_root_logger():
+    # osc-lib attaches a console handler to the root logger on every run.
+    root_logger = logging.getLogger('')
+    handlers = list(root_logger.handlers)
+    level = root_logger.level
+    try:
+        yield
+    finally:
+        root_logger.handlers[:] = handlers
+        root_logger.setLevel(level)
+
+
+def run_in_process(args, env):
+    """Run an ``openstack`` command line inside the current interpreter.
+
+    Behaves like ``subprocess.check_output(args, stderr=STDOUT, env=env)``:
+    returns the combined output as bytes, or raises
+    ``subprocess.CalledProcessError`` carrying it when the command fails.
+    Command plugins stay imported between calls, so only the first call
+    pays the openstackclient startup cost.
+
+    The whole process environment is replaced by ``env`` while the
+    command runs, so no other thread may make HTTP calls meanwhile;
+    ``KPR_FIXTURE_WORKERS`` is forced to 1 in this mode.
+    """
+    output = io.StringIO()
+    with _lock, \
+            _preserve_root_logger(), \
+            mock.patch.dict(os.environ, env, clear=True), \
+            contextlib.redirect_stdout(output), \
+            contextlib.redirect_stderr(output):
+        app = shell.OpenStackShell()
+        app.stdout = output
+        app.stderr = output
+        try:
+            returncode = app.run(list(args[1:]))
+        except SystemExit as e:
+            # argparse exits on invalid arguments.
+            returncode = e.code if isinstance(e.code, int) else 2
+
+    output = output.getvalue().encode('utf-8')
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, args, output=output)
+    return output
@@ -0,0 +1,302 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import atexit
+import collections
+import contextlib
+import glob
+import json
+import math
+import os
+import re
+import sys
+import threading
+import time
+from urllib import parse
+
+from requests import adapters
+
+from kpr.utils import clients
+
+# Phases spent managing fixtures rather than checking the policy.
+FIXTURE_PHASES = ('setUpClass', 'setUp', 'tearDown', 'tearDownClass')
+
+REPORT = 'report.json'
+
+# Path segments that are resource ids: Keystone's uuid4 hex ids.
+_ID = re.compile('^[0-9a-f]{32}$')
+
+_lock = threading.Lock()
+_local = threading.local()
+_calls = []
+_phases = collections.defaultdict(float)
+_current = {'test': None, 'phase': None, 'started': None}
+_installed = False
+
+
+def _path(directory, pid=None):
+    return os.path.join(
+        directory, 'run-{}.json'.format(os.getpid() if pid is None else pid))
+
+
+def http_operation(method, url):
+    """Return e.g. 'GET /v3/users/{id}' for a request to ``url``."""
+    path = re.sub('/+', '/', parse.urlsplit(url).path)
+    if '/v3' in path:
+        path = path[path.index('/v3'):]
+    return '{} {}'.format(method, '/'.join(
+        '{id}' if _ID.match(segment) else segment
+        for segment in path.split('/')))
+
+
+def cli_operation(args):
+    """Return e.g. 'openstack user show' for a forked command line."""
+    words = [a for a in args[1:] if not a.startswith('-')][:2]
+    return ' '.join([args[0]] + words)
+
+
+@contextlib.contextmanager
+def as_persona(username, project):
+    """Tag the calls this thread makes in the block with a persona."""
+    previous = getattr(_local, 'persona', None)
+    _local.persona = '{}@{}'.format(username, project)
+    try:
+        yield
+    finally:
+        _local.persona = previous
+
+
+def record(kind, operation, seconds, status):
+    if not clients.KPR_STATS:
+        return
+    persona = getattr(_local, 'persona', None) or '{}@{}'.format(
+        clients.OS_USERNAME, clients.OS_PROJECT_NAME)
+    with _lock:
+        _calls.append([
+            _current['test'], _current['phase'], persona, kind, operation,
+            seconds, status,
+        ])
+
+
+@contextlib.contextmanager
+def timed(kind, operation):
+    """Record the call made in the block; yields a dict for its status."""
+    outcome = {'status': None}
+    started = time.time()
+    try:
+        yield outcome
+    finally:
+        record(kind, operation, time.time() - started, outcome['status'])
+
+
+def enter(test, phase):
+    """Start timing ``phase`` of ``test``, ending the current phase."""
+    if not clients.KPR_STATS:
+        return
+    with _lock:
+        now = time.time()
+        if _current['phase'] is not None:
+            _phases[(_current['test'], _current['phase'])] += (
+                now - _current['started'])
+        _current.update(test=test, phase=phase, started=now)
+
+
+def leave():
+    enter(None, None)
+
+
+def install():
+    """Record every HTTP request made by this process."""
+    global _installed
+    with _lock:
+        if _installed or not clients.KPR_STATS:
+            return
+        send = adapters.HTTPAdapter.send
+
+        def recorded_send(adapter, request, **kwargs):
+            with timed('http', http_operation(
+                    request.method, request.url)) as outcome:
+                response = send(adapter, request, **kwargs)
+                outcome['status'] = response.status_code
+                return response
+
+        adapters.HTTPAdapter.send = recorded_send
+        atexit.register(dump)
+        _installed = True
+
+
+def dump(directory=None):
+    """Write what this process recorded to ``directory``."""
+    directory = directory or clients.KPR_STATS_DIR
+    leave()
+    with _lock:
+        if not _calls and not _phases:
+            return
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        data = {
+            'calls': _calls,
+            'phases': [[t, p, s] for (t, p), s in _phases.items()],
+        }
+        with open(_path(directory) + '.tmp', 'w') as f:
+            json.dump(data, f)
+        os.rename(_path(directory) + '.tmp', _path(directory))
+
+
+def clear(directory=None):
+    """Remove the recordings of earlier runs."""
+    directory = directory or clients.KPR_STATS_DIR
+    for path in glob.glob(_path(directory, '*')):
+        os.remove(path)
+
+
+def percentile(values, q):
+    """Return the ``q``th percentile of sorted ``values``.
+
+    Interpolates linearly between the two closest ranks, like numpy's
+    default, so that a p95 of a few samples is not simply their maximum.
+    """
+    if not values:
+        raise ValueError('no values to take a percentile of')
+    position = (len(values) - 1) * q / 100.0
+    lower = int(math.floor(position))
+    upper = min(lower + 1, len(values) - 1)
+    return values[lower] + (values[upper] - values[lower]) * (
+        position - lower)
+
+
+def aggregate(directory=None):
+    """Summarize the recordings of every test process in ``directory``."""
+    directory = directory or clients.KPR_STATS_DIR
+    calls = []
+    phases = []
+    for path in sorted(glob.glob(_path(directory, '*'))):
+        with open(path) as f:
+            data = json.load(f)
+        calls.extend(data['calls'])
+        phases.extend(data['phases'])
+
+    durations = collections.defaultdict(list)
+    tests = collections.OrderedDict()
+    personas = collections.Counter()
+    api_time = collections.defaultdict(float)
+
+    def test_record(test_id):
+        return tests.setdefault(test_id, collections.OrderedDict([
+            ('calls', 0),
+            ('api_seconds', 0.0),
+            ('seconds', 0.0),
+            ('fixture_seconds', 0.0),
+        ]))
+
+    for test_id, phase, persona, kind, operation, seconds, status in calls:
+        durations[operation].append(seconds)
+        personas[persona] += 1
+        api_time['fixture' if phase in FIXTURE_PHASES else 'body'] += seconds
+        if test_id is not None:
+            record = test_record(test_id)
+            record['calls'] += 1
+            record['api_seconds'] += seconds
+
+    wall = collections.defaultdict(float)
+    for test_id, phase, seconds in phases:
+        part = 'fixture' if phase in FIXTURE_PHASES else 'body'
+        wall[part] += seconds
+        record = test_record(test_id)
+        record['seconds'] += seconds
+        if part == 'fixture':
+            record['fixture_seconds'] += seconds
+
+    operations = collections.OrderedDict()
+    for operation in sorted(durations):
+        values = sorted(durations[operation])
+        operations[operation] = collections.OrderedDict([
+            ('calls', len(values)),
+            ('p50', percentile(values, 50)),
+            ('p95', percentile(values, 95)),
+            ('p99', percentile(values, 99)),
+        ])
+
+    def share(totals):
+        total = totals['fixture'] + totals['body']
+        return collections.OrderedDict([
+            ('fixture', totals['fixture'] / total if total else 0.0),
+            ('body', totals['body'] / total if total else 0.0),
+        ])
+
+    return collections.OrderedDict([
+        ('operations', operations),
+        ('tests', tests),
+        ('personas', collections.OrderedDict(personas.most_common())),
+        ('share', collections.OrderedDict([
+            ('wall', share(wall)),
+            ('api', share(api_time)),
+        ])),
+    ])
+
+
+def format_text(report):
+    width = max([9] + [len(o) for o in report['operations']])
+    lines = ['{:<{}} {:>6} {:>8} {:>8} {:>8}'.format(
+        'operation', width, 'calls', 'p50 ms', 'p95 ms', 'p99 ms')]
+    for operation, s in report['operations'].items():
+        lines.append('{:<{}} {:>6} {:>8.1f} {:>8.1f} {:>8.1f}'.format(
+            operation, width, s['calls'],
+            s['p50'] * 1000, s['p95'] * 1000, s['p99'] * 1000))
+    lines.append('')
+    width = max([4] + [len(t) for t in report['tests']])
+    lines.append('{:<{}} {:>6} {:>8} {:>8}'.format(
+        'test', width, 'calls', 'seconds', 'fixture'))
+    tests = sorted(
+        report['tests'].items(), key=lambda item: -item[1]['calls'])
+    for test_id, s in tests:
+        lines.append('{:<{}} {:>6} {:>8.2f} {:>7.0f}%'.format(
+            test_id, width, s['calls'], s['seconds'],
+            100 * s['fixture_seconds'] / s['seconds'] if s['seconds'] else 0))
+    lines.append('')
+    for name, label in (('wall', 'wall time'), ('api', 'API time')):
+        share = report['share'][name]
+        lines.append('{}: {:.0f}% fixtures, {:.0f}% assertions'.format(
+            label, 100 * share['fixture'], 100 * share['body']))
+    return ''.join(line + '\n' for line in lines)
+
+
+def report(directory=None, output=None):
+    """Write the report of the recorded run and print it."""
+    directory = directory or clients.KPR_STATS_DIR
+    output = output or sys.stdout
+    summary = aggregate(directory)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(os.path.join(directory, REPORT), 'w') as f:
+        json.dump(summary, f, indent=2)
+    output.write(format_text(summary))
+    return summary
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Report the API calls recorded with KPR_STATS=1.')
+    arg_parser.add_argument('command', choices=['report', 'clear'])
+    arg_parser.add_argument('--dir', default=clients.KPR_STATS_DIR)
+    args = arg_parser.parse_args(argv)
+    if args.command == 'clear':
+        clear(args.dir)
+    else:
+        report(args.dir)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
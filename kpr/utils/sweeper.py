@@ -0,0 +1,360 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import argparse
+import atexit
+import errno
+import fcntl
+import functools
+import glob
+import json
+import os
+import re
+import sys
+import threading
+import time
+
+from keystoneauth1.exceptions import http
+
+from kpr.utils import clients
+from kpr.utils import concurrency
+
+# Description of every user and project the harness creates.
+MARKER = 'kpr fixture'
+
+# Description of the users and projects of kpr.utils.pool worlds, which
+# outlive the process that built them and are never swept.
+POOL_MARKER = 'kpr pool'
+
+# Names given by TestCase.setup_project, create_admin_auditor and the
+# tests' own temporary users, followed by id_generator().
+PROJECT_NAME = re.compile(r'^project\d+-[A-Za-z0-9]{8}$')
+USER_NAME = re.compile(
+    r'^(admin-auditor|project\d+_(admin|auditor|user\d+)|testuser)'
+    r'-[A-Za-z0-9]{8}$')
+
+SEEN = 'seen.json'
+
+_lock = threading.Lock()
+_started = False
+
+
+def _ledger(directory, pid):
+    return os.path.join(directory, '{}.ids'.format(pid))
+
+
+def created(resource, directory=None):
+    """Record that this process created ``resource``.
+
+    Resources recorded by a running process are never swept, whatever
+    their name, so concurrent test workers keep their fixtures. Only
+    resources carrying MARKER are recorded.
+    """
+    if not _enabled() or getattr(resource, 'description', None) != MARKER:
+        return
+    with _lock:
+        _record(directory or clients.KPR_SWEEP_DIR, os.getpid(), resource)
+
+
+def _record(directory, pid, resource):
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    with open(_ledger(directory, pid), 'a') as f:
+        # e.g. "users 0123abcd", so it can be looked up without listing.
+        f.write('{} {}\n'.format(resource.manager.collection_key,
+                                  resource.id))
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except OSError as e:
+        return e.errno == errno.EPERM
+    return True
+
+
+def _ledgers(directory):
+    """Return {pid: {id: kind}} of every process which created fixtures."""
+    ledgers = {}
+    for path in glob.glob(os.path.join(directory, '*.ids')):
+        pid = int(os.path.basename(path)[:-len('.ids')])
+        ids = ledgers[pid] = {}
+        with open(path) as f:
+            for line in f:
+                fields = line.split()
+                if len(fields) == 2:
+                    kind, resource_id = fields
+                    ids[resource_id] = kind
+    return ledgers
+
+
+class Pace(object):
+    """Spaces calls made from any thread to ``rate`` per second."""
+
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate > 0 else 0
+        self._lock = threading.Lock()
+        self._next = 0
+
+    def wait(self):
+        with self._lock:
+            now = time.time()
+            at = max(now, self._next)
+            self._next = at + self.interval
+        if at > now:
+            time.sleep(at - now)
+
+
+def _harness(resource, pattern, unmarked):
+    if not pattern.match(resource.name):
+        return False
+    description = getattr(resource, 'description', None)
+    if description == POOL_MARKER:
+        return False
+    return unmarked or description == MARKER
+
+
+def candidates(admin, unmarked=False):
+    """Return the (users, projects) which look created by the harness.
+
+    Pool worlds are never candidates, even with ``unmarked``.
+    """
+    users = [
+        u for u in admin.users.list() if _harness(u, USER_NAME, unmarked)]
+    projects = [
+        p for p in admin.projects.list()
+        if _harness(p, PROJECT_NAME, unmarked)]
+    return users, projects
+
+
+def recorded(admin, ids, workers=None):
+    """Return the (users, projects) of ``ids`` ({id: kind}) still there.
+
+    Each one is fetched by id, so the cost follows the number of ids and
+    not the size of the cloud.
+    """
+    def get(kind, resource_id):
+        try:
+            return getattr(admin, kind).get(resource_id)
+        except http.NotFound:
+            return None
+
+    found = concurrency.run_all(
+        (functools.partial(get, kind, resource_id)
+         for resource_id, kind in sorted(ids.items())),
+        workers=workers,
+    )
+    users = [
+        r for r in found
+        if r is not None and r.manager.collection_key == 'users' and
+        _harness(r, USER_NAME, False)]
+    projects = [
+        r for r in found
+        if r is not None and r.manager.collection_key == 'projects' and
+        _harness(r, PROJECT_NAME, False)]
+    return users, projects
+
+
+def sweep(directory=None, age=None, rate=None, unclaimed=False,
+          unmarked=False, dry_run=False, workers=None, admin=None):
+    """Delete leaked harness users and projects.
+
+    A candidate is swept when the process on this machine which recorded
+    it is gone (or is this one). With ``unclaimed``, a candidate no
+    process recorded, e.g. one created on another machine, is also swept
+    once it was first seen more than ``age`` seconds ago. Recorded ids are
+    fetched one by one; only ``unclaimed`` lists every user and project
+    of the cloud. Grants of swept users on kept projects are revoked
+    first, then users and projects are deleted, concurrently but at most
+    ``rate`` calls per second. Returns the swept (users, projects).
+    """
+    directory = directory or clients.KPR_SWEEP_DIR
+    age = clients.KPR_SWEEP_AGE if age is None else age
+    pace = Pace(clients.KPR_SWEEP_RATE if rate is None else rate)
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+
+    with open(os.path.join(directory, SEEN + '.lock'), 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        ledgers = _ledgers(directory)
+        live = set()
+        dead = {}
+        for pid, ids in ledgers.items():
+            if pid != os.getpid() and _alive(pid):
+                live.update(ids)
+            else:
+                dead.update(ids)
+        if not dead and not unclaimed:
+            return [], []
+
+        admin = admin or clients.get_admin_client()
+        if unclaimed:
+            users, projects = candidates(admin, unmarked)
+        else:
+            users, projects = recorded(
+                admin,
+                dict((k, v) for k, v in dead.items() if k not in live),
+                workers=workers)
+        existing = set(r.id for r in users + projects)
+
+        if unclaimed:
+            path = os.path.join(directory, SEEN)
+            try:
+                with open(path) as f:
+                    seen = json.load(f)
+            except (IOError, ValueError):
+                seen = {}
+            now = time.time()
+            seen = dict((k, v) for k, v in seen.items() if k in existing)
+
+        def swept(resource):
+            if resource.id in live:
+                return False
+            if resource.id in dead:
+                return True
+            if not unclaimed:
+                return False
+            first_seen = seen.setdefault(resource.id, now)
+            return now - first_seen >= age
+
+        users = [u for u in users if swept(u)]
+        projects = [p for p in projects if swept(p)]
+        if unclaimed:
+            if not dry_run:
+                for resource in users + projects:
+                    seen.pop(resource.id, None)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(seen, f)
+            os.rename(path + '.tmp', path)
+
+        if dry_run or not (users or projects):
+            _forget_dead(directory, ledgers, existing)
+            return users, projects
+
+        user_ids = set(u.id for u in users)
+        project_ids = set(p.id for p in projects)
+        # The grants of the swept users only, one listing per user.
+        listings = concurrency.run_all(
+            (functools.partial(admin.role_assignments.list, user=user_id)
+             for user_id in sorted(user_ids)),
+            workers=workers,
+        )
+        grants = []
+        for listing in listings:
+            for assignment in listing:
+                user = getattr(assignment, 'user', None)
+                project = getattr(assignment, 'scope', {}).get('project')
+                if (user is not None and project is not None and
+                        project['id'] not in project_ids):
+                    grants.append((assignment.role['id'], user['id'],
+                                   project['id']))
+
+        def paced(function, *args, **kwargs):
+            pace.wait()
+            try:
+                function(*args, **kwargs)
+            except http.NotFound:
+                pass
+
+        concurrency.run_stages([
+            [
+                functools.partial(
+                    paced, admin.roles.revoke, role, user=user,
+                    project=project)
+                for role, user, project in grants
+            ],
+            [functools.partial(paced, admin.users.delete, u) for u in users],
+            [
+                functools.partial(paced, admin.projects.delete, p)
+                for p in projects
+            ],
+        ], workers=workers)
+        _forget_dead(directory, ledgers, existing - user_ids - project_ids)
+    return users, projects
+
+
+def _forget_dead(directory, ledgers, existing):
+    # A ledger is dropped once its process is gone (or exiting) and none
+    # of what it recorded is left.
+    for pid, ids in ledgers.items():
+        if pid != os.getpid() and _alive(pid):
+            continue
+        if not set(ids) & existing:
+            try:
+                os.remove(_ledger(directory, pid))
+            except OSError:
+                pass
+
+
+def start():
+    """Sweep now and when this process exits, once per process.
+
+    Only what dead local processes (and, on exit, this one) recorded is
+    swept; unclaimed resources are left to ``sweep(unclaimed=True)``.
+    Does nothing unless KPR_SWEEP is set, nor against the private fake
+    Keystone or cassettes being replayed, where nothing leaks.
+    """
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    if not _enabled():
+        return
+    _sweep_quietly()
+    atexit.register(_sweep_quietly)
+
+
+def _enabled():
+    return (clients.KPR_SWEEP and not clients.KPR_FAKE_KEYSTONE and
+            clients.KPR_CASSETTE_MODE != 'replay')
+
+
+def _sweep_quietly():
+    # A sweep failing must not fail the tests; the next one retries.
+    try:
+        sweep()
+    except Exception as e:
+        sys.stderr.write('kpr sweeper: {!r}\n'.format(e))
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(
+        description='Delete users and projects leaked by the tests.')
+    arg_parser.add_argument(
+        '--unclaimed', action='store_true',
+        help='also sweep resources no local process recorded, once seen '
+             'for --age seconds')
+    arg_parser.add_argument(
+        '--age', type=float, default=clients.KPR_SWEEP_AGE,
+        help='seconds an unclaimed resource is kept')
+    arg_parser.add_argument(
+        '--rate', type=float, default=clients.KPR_SWEEP_RATE,
+        help='API calls per second')
+    arg_parser.add_argument(
+        '--unmarked', action='store_true',
+        help='also sweep matching names without the creation marker')
+    arg_parser.add_argument('--dry-run', action='store_true')
+    args = arg_parser.parse_args(argv)
+
+    users, projects = sweep(
+        age=args.age, rate=args.rate, unclaimed=args.unclaimed,
+        unmarked=args.unmarked, dry_run=args.dry_run)
+    for kind, resources in (('user', users), ('project', projects)):
+        for resource in resources:
+            print('{} {} {}'.format(kind, resource.id, resource.name))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
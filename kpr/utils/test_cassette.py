@@ -0,0 +1,39 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+import mock
+
+from kpr.utils import cassette
+from kpr.utils import clients
+
+
+class TestCassetteStart(unittest.TestCase):
+
+    def setUp(self):
+        super(TestCassetteStart, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    # CLI をフォークするモードでは通信を記録できないため開始できない。
+    def test_forking_modes_are_rejected(self):
+        for mode in ('subprocess', 'pool'):
+            with mock.patch.object(clients, 'KPR_OS_RUN_MODE', mode):
+                self.assertRaises(
+                    ValueError, cassette.start, 'x', 'record',
+                    self.directory)
+        self.assertEqual([], os.listdir(self.directory))
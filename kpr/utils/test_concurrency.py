@@ -0,0 +1,115 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import functools
+import threading
+import time
+import unittest
+
+from kpr.utils import concurrency
+
+
+def fail(error):
+    raise error
+
+
+def later(seconds, value):
+    time.sleep(seconds)
+    return value
+
+
+class TestRunAll(unittest.TestCase):
+
+    # 後の呼び出しが先に終わっても、結果は呼び出しの順に並ぶ。
+    def test_results_keep_the_order_of_calls(self):
+        calls = [
+            functools.partial(later, 0.03 - i * 0.01, i) for i in range(3)]
+        self.assertEqual([0, 1, 2], concurrency.run_all(calls, workers=3))
+
+    # workers 個までの呼び出しが同時に実行される。
+    def test_calls_run_side_by_side(self):
+        barrier = threading.Barrier(3, timeout=5)
+        results = concurrency.run_all([barrier.wait] * 3, workers=3)
+        self.assertEqual([0, 1, 2], sorted(results))
+
+    # 失敗があっても全ての呼び出しを実行し、失敗をまとめて送出する。
+    def test_errors_are_aggregated(self):
+        done = []
+        first = ValueError('first')
+        second = KeyError('second')
+        nested = concurrency.FixtureError([IOError('nested')])
+
+        for workers in (1, 4):
+            del done[:]
+            with self.assertRaises(concurrency.FixtureError) as raised:
+                concurrency.run_all([
+                    functools.partial(fail, first),
+                    functools.partial(done.append, 1),
+                    functools.partial(fail, second),
+                    functools.partial(fail, nested),
+                    functools.partial(done.append, 2),
+                ], workers=workers)
+
+            self.assertEqual([1, 2], sorted(done))
+            self.assertEqual(
+                [first, second, nested.errors[0]], raised.exception.errors)
+            self.assertIn('3 fixture operation(s) failed',
+                          str(raised.exception))
+
+    def test_no_calls(self):
+        self.assertEqual([], concurrency.run_all([]))
+
+
+class TestRunStages(unittest.TestCase):
+
+    # 次のステージは前のステージが全て終わってから始まる。
+    def test_stages_run_in_order(self):
+        events = []
+        lock = threading.Lock()
+
+        def step(stage, i):
+            with lock:
+                events.append(('start', stage))
+            later(0.01 * (3 - i), None)
+            with lock:
+                events.append(('end', stage))
+            return (stage, i)
+
+        results = concurrency.run_stages([
+            [functools.partial(step, 0, i) for i in range(3)],
+            [functools.partial(step, 1, i) for i in range(3)],
+        ], workers=3)
+
+        self.assertEqual(
+            [[(0, 0), (0, 1), (0, 2)], [(1, 0), (1, 1), (1, 2)]], results)
+        last_end = max(
+            i for i, event in enumerate(events) if event == ('end', 0))
+        first_start = min(
+            i for i, event in enumerate(events) if event == ('start', 1))
+        self.assertLess(last_end, first_start)
+
+    # 前のステージが失敗しても後のステージを実行し、全ての失敗を送出する。
+    def test_later_stages_run_after_a_failure(self):
+        done = []
+        first = ValueError('first')
+        second = ValueError('second')
+
+        with self.assertRaises(concurrency.FixtureError) as raised:
+            concurrency.run_stages([
+                [functools.partial(fail, first)],
+                [functools.partial(done.append, 'cleanup'),
+                 functools.partial(fail, second)],
+            ], workers=2)
+
+        self.assertEqual(['cleanup'], done)
+        self.assertEqual([first, second], raised.exception.errors)
@@ -0,0 +1,154 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+import mock
+
+from kpr.fake import app
+from kpr.fake import server
+from kpr.utils import pool
+
+POLICY = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'policy.project-admin.json')
+
+
+class Fixtures(object):
+    """The part of kpr.base.TestCase _drift and _repair use."""
+
+    def __init__(self, admin):
+        self.admin = admin
+        self.invalidated = set()
+
+    def invalidate_credentials(self, user):
+        self.invalidated.add(user)
+
+
+class TestPoolRepair(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestPoolRepair, cls).setUpClass()
+        cls.server = server.start(app.Application(POLICY))
+        cls.admin = server.client(cls.server)
+        cls.roles = dict((r.name, r) for r in cls.admin.roles.list())
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestPoolRepair, cls).tearDownClass()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        super(TestPoolRepair, self).setUp()
+        self.fixtures = Fixtures(self.admin)
+        shared = self.admin.projects.list(name='admin')[0]
+        self.project1 = self.admin.projects.create('project1', 'default')
+        self.addCleanup(self.admin.projects.delete, self.project1)
+        self.admin_auditor = self.create_user(
+            'admin-auditor', shared, self.roles['admin_auditor'])
+        self.project1_admin = self.create_user(
+            'project1_admin', self.project1, self.roles['project_admin'])
+
+        # Same records as pool._build.
+        self.world = {'attributes': {}, 'assignments': []}
+        pool._record(
+            self.world, 'users', 'admin_auditor', self.admin_auditor)
+        pool._record(self.world, 'projects', 'project1', self.project1)
+        pool._record(
+            self.world, 'users', 'project1_admin', self.project1_admin)
+        self.world['assignments'] = [
+            [shared.id, self.admin_auditor.id,
+             self.roles['admin_auditor'].id],
+            [self.project1.id, self.project1_admin.id,
+             self.roles['project_admin'].id],
+        ]
+
+    def create_user(self, name, project, role):
+        user = self.admin.users.create(
+            name, domain='default', default_project=project,
+            password='openstack')
+        self.addCleanup(self.delete_user, user)
+        self.admin.roles.grant(role, user=user, project=project)
+        return user
+
+    def delete_user(self, user):
+        if user.id in set(u.id for u in self.admin.users.list()):
+            self.admin.users.delete(user)
+
+    def grants(self, user):
+        return set(
+            (a.scope['project']['id'], a.role['id'])
+            for a in self.admin.role_assignments.list(user=user))
+
+    # 管理プロジェクトにある他のユーザの付与はワールドの差分に含めない。
+    def test_unchanged_world_has_no_drift(self):
+        self.assertEqual(
+            (set(), set()), pool._drift(self.fixtures, self.world))
+        self.assertTrue(pool._repair(self.fixtures, self.world))
+        self.assertEqual(set(), self.fixtures.invalidated)
+
+    # テストが追加した付与は取り消される。
+    def test_extra_grant_is_revoked(self):
+        expected = self.grants(self.project1_admin)
+        self.admin.roles.grant(
+            self.roles['Member'], user=self.project1_admin,
+            project=self.project1)
+
+        self.assertTrue(pool._repair(self.fixtures, self.world))
+
+        self.assertEqual(expected, self.grants(self.project1_admin))
+        self.assertEqual(
+            set([self.project1_admin.id]), self.fixtures.invalidated)
+
+    # ワールドの外のプロジェクトへの付与も、一度の一覧取得で見つけて取り消す。
+    def test_grant_outside_world_is_revoked_with_one_listing(self):
+        other = self.admin.projects.create('project2', 'default')
+        self.addCleanup(self.admin.projects.delete, other)
+        self.admin.roles.grant(
+            self.roles['Member'], user=self.project1_admin, project=other)
+
+        listing = self.admin.role_assignments.list
+        with mock.patch.object(
+                self.admin.role_assignments, 'list',
+                side_effect=listing) as role_assignments:
+            missing, extra = pool._drift(self.fixtures, self.world)
+        self.assertEqual(1, role_assignments.call_count)
+        self.assertEqual(set(), missing)
+        self.assertEqual(
+            set([(other.id, self.project1_admin.id,
+                  self.roles['Member'].id)]),
+            extra)
+
+        self.assertTrue(pool._repair(self.fixtures, self.world))
+        self.assertEqual([], self.admin.role_assignments.list(project=other))
+
+    # テストが取り消した付与は元に戻される。
+    def test_missing_grant_is_restored(self):
+        expected = self.grants(self.project1_admin)
+        self.admin.roles.revoke(
+            self.roles['project_admin'], user=self.project1_admin,
+            project=self.project1)
+
+        self.assertTrue(pool._repair(self.fixtures, self.world))
+
+        self.assertEqual(expected, self.grants(self.project1_admin))
+        self.assertEqual(
+            set([self.project1_admin.id]), self.fixtures.invalidated)
+
+    # ユーザが削除されていれば修復せず、作り直しを求める。
+    def test_deleted_user_needs_rebuild(self):
+        self.admin.users.delete(self.project1_admin)
+
+        self.assertFalse(pool._repair(self.fixtures, self.world))
@@ -0,0 +1,127 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import json
+import os
+import subprocess
+import unittest
+
+import mock
+
+from kpr.fake import app
+from kpr.fake import server
+from kpr.fake import store
+from kpr.utils import clients
+from kpr.utils import rest
+from kpr.utils import shell
+
+POLICY = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'policy.project-admin.json')
+
+
+class TestRest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestRest, cls).setUpClass()
+        data = store.Store()
+        data.bootstrap(
+            username=clients.OS_USERNAME,
+            password=clients.OS_PASSWORD,
+            project_name=clients.OS_PROJECT_NAME,
+        )
+        cls.server = server.start(app.Application(POLICY, data))
+        cls.admin = server.client(
+            cls.server, clients.OS_USERNAME, clients.OS_PROJECT_NAME,
+            clients.OS_PASSWORD)
+        roles = dict((r.name, r) for r in cls.admin.roles.list())
+        cls.project1 = cls.admin.projects.create('project1', 'default')
+        cls.project1_admin = cls.create_user(
+            'project1_admin', roles['project_admin'])
+        cls.project1_user = cls.create_user('project1_user', roles['Member'])
+
+    @classmethod
+    def create_user(cls, name, role):
+        user = cls.admin.users.create(
+            name, domain='default', default_project=cls.project1,
+            password=clients.OS_PASSWORD)
+        cls.admin.roles.grant(role, user=user, project=cls.project1)
+        return user
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestRest, cls).tearDownClass()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        super(TestRest, self).setUp()
+        patch = mock.patch.object(
+            clients, 'OS_AUTH_URL', server.url(self.server) + '/v3')
+        patch.start()
+        self.addCleanup(patch.stop)
+        clients.reset_sessions()
+        self.addCleanup(clients.reset_sessions)
+
+    def cli(self, command, username):
+        env = {
+            'OS_AUTH_URL': clients.OS_AUTH_URL,
+            'OS_IDENTITY_API_VERSION': '3',
+            'OS_NO_CACHE': '1',
+            'OS_PASSWORD': clients.OS_PASSWORD,
+            'OS_PROJECT_DOMAIN_ID': 'default',
+            'OS_PROJECT_NAME': 'project1',
+            'OS_USERNAME': username,
+            'OS_USER_DOMAIN_ID': 'default',
+            'PATH': os.environ['PATH'],
+        }
+        output = shell.run_in_process(
+            ['openstack'] + command + ['-f', 'json'], env)
+        return json.loads(output.decode('utf-8'))
+
+    def by_id(self, rows):
+        return sorted(rows, key=lambda row: row['ID'])
+
+    # REST バックエンドの出力は CLI の JSON 出力と同じ形になる。
+    def test_user_list_project_matches_cli(self):
+        command = ['user', 'list', '--project', self.project1.id]
+
+        output = rest.run(command, 'project1', 'project1_admin')
+
+        self.assertEqual(
+            self.by_id(self.cli(command, 'project1_admin')),
+            self.by_id(output))
+        self.assertEqual(
+            set([self.project1_admin.id, self.project1_user.id]),
+            set(row['ID'] for row in output))
+
+    # 権限がなければ CLI と同じく HTTP 403 を含む CalledProcessError になる。
+    def test_forbidden_is_reported_like_cli(self):
+        command = ['user', 'list', '--project', self.project1.id]
+
+        with self.assertRaises(rest.RestError) as raised:
+            rest.run(command, 'project1', 'project1_user')
+
+        self.assertEqual(403, raised.exception.status_code)
+        self.assertIsInstance(raised.exception, subprocess.CalledProcessError)
+        self.assertRegex(raised.exception.output.decode('utf-8'), 'HTTP 403')
+        # Newer openstackclient releases word the error differently, but
+        # always mention the status.
+        with self.assertRaises(subprocess.CalledProcessError) as cli:
+            self.cli(command, 'project1_user')
+        self.assertRegex(cli.exception.output.decode('utf-8'), r'\b403\b')
+
+    def test_unsupported_command_is_rejected(self):
+        self.assertRaises(
+            ValueError, rest.run, ['server', 'list'], 'project1',
+            'project1_admin')
@@ -0,0 +1,125 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import unittest
+
+import mock
+
+from kpr import base
+from kpr.utils import clients
+from kpr.utils import schedule
+
+
+def unit(name, cost, key=None, setup=0):
+    return schedule.Unit(key, [name], setup, cost)
+
+
+class TestPartition(unittest.TestCase):
+
+    def worker_of(self, plan):
+        return dict(
+            (test, worker)
+            for worker, tests in enumerate(plan.tests) for test in tests)
+
+    # 長い順に、最も早く終わるワーカへ割り当てる。
+    def test_bins_are_balanced(self):
+        units = [
+            unit('t{}'.format(i), cost)
+            for i, cost in enumerate([5, 4, 3, 3, 2, 2, 1])
+        ]
+
+        plan = schedule.partition(units, 2)
+
+        self.assertEqual([10, 10], sorted(plan.loads))
+        self.assertEqual(
+            sorted(u.tests[0] for u in units),
+            sorted(t for tests in plan.tests for t in tests))
+
+    # 同じ形のクラスは同じワーカにまとめ、フィクスチャを一度だけ数える。
+    def test_same_shape_stays_together(self):
+        units = [
+            unit('a1', 3, key='a', setup=2),
+            unit('a2', 3, key='a', setup=2),
+            unit('a3', 3, key='a', setup=2),
+            unit('s1', 4),
+            unit('s2', 4),
+        ]
+
+        plan = schedule.partition(units, 2)
+
+        workers = self.worker_of(plan)
+        self.assertEqual(1, len(set(workers[t] for t in ('a1', 'a2', 'a3'))))
+        # The bundle costs 2 + 3 * (3 - 2); the other worker takes s1 and s2.
+        self.assertEqual(5, plan.loads[workers['a1']])
+        self.assertEqual([5, 8], sorted(plan.loads))
+
+    # 一つの形だけで均等な割り当てを超える場合は、複数のワーカに分ける。
+    def test_long_shape_is_spread(self):
+        units = [
+            unit('a{}'.format(i), 10, key='a', setup=1) for i in range(4)]
+
+        plan = schedule.partition(units, 2)
+
+        self.assertEqual([2, 2], [len(tests) for tests in plan.tests])
+        # Each worker builds the world once: 10 + (10 - 1).
+        self.assertEqual([19, 19], plan.loads)
+
+
+class TestUnits(unittest.TestCase):
+
+    def setUp(self):
+        super(TestUnits, self).setUp()
+        for name, value in (('KPR_FAKE_KEYSTONE', ''),
+                            ('KPR_FIXTURE_POOL_SIZE', 0)):
+            patch = mock.patch.object(clients, name, value)
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    # 履歴がなければ既定の呼び出し回数と 1 回あたりの時間で見積もる。
+    def test_units_without_history(self):
+        class PerTest(base.TestCase):
+            fixture_projects = ({'project': 'project1'},)
+
+            def test_a(self):
+                pass
+
+            def test_b(self):
+                pass
+
+        class PerClass(PerTest):
+            fixture_scope = 'class'
+
+        class Plain(unittest.TestCase):
+
+            def test_a(self):
+                pass
+
+        tests = [PerTest('test_a'), PerTest('test_b'),
+                 PerClass('test_a'), PerClass('test_b'), Plain('test_a')]
+
+        units = schedule.units(tests)
+
+        per_call = schedule.DEFAULT_SECONDS_PER_CALL
+        fixtures = schedule.fixture_calls(PerTest) * per_call
+        body = schedule.BODY_CALLS * per_call
+        self.assertEqual(4, len(units))
+        self.assertEqual([[t.id()] for t in tests[:2]],
+                         [u.tests for u in units[:2]])
+        for u in units[:2]:
+            self.assertAlmostEqual(body + fixtures, u.cost)
+        self.assertEqual([t.id() for t in tests[2:4]], units[2].tests)
+        self.assertIsNone(units[2].key)
+        self.assertAlmostEqual(fixtures + 2 * body, units[2].cost)
+        self.assertEqual(
+            schedule.Unit(None, [tests[4].id()], 0, schedule.MIN_COST),
+            units[3])
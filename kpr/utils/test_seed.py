@@ -0,0 +1,136 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import unittest
+
+from kpr.fake import app
+from kpr.fake import server
+from kpr.utils import seed
+
+POLICY = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'policy.project-admin.json')
+
+DESCRIPTION = {
+    'roles': ['seed_role', 'Member'],
+    'projects': [
+        {'name': 'seed1', 'description': 'first'},
+        {'name': 'seed2'},
+    ],
+    'users': [
+        {'name': 'seed1_user', 'project': 'seed1'},
+        {'name': 'seed2_user'},
+    ],
+    'grants': [
+        {'user': 'seed1_user', 'project': 'seed1', 'role': 'Member'},
+        {'user': 'seed2_user', 'project': 'seed2', 'role': 'seed_role'},
+    ],
+}
+
+NOTHING = {'roles': [], 'projects': [], 'users': [], 'grants': []}
+
+
+class TestSeed(unittest.TestCase):
+
+    def setUp(self):
+        super(TestSeed, self).setUp()
+        # A fresh fake Keystone per test, so each one starts from the
+        # bootstrap data.
+        fake = server.start(app.Application(POLICY))
+        self.addCleanup(fake.server_close)
+        self.addCleanup(fake.shutdown)
+        self.admin = server.client(fake)
+
+    def apply(self, description=DESCRIPTION, **kwargs):
+        return seed.apply(description, admin=self.admin, **kwargs)
+
+    def created(self, result):
+        # Calls run side by side, so the order of creation varies.
+        return dict(
+            (kind, sorted(names))
+            for kind, names in result['created'].items())
+
+    def grants(self):
+        return set(
+            (a.scope['project']['name'], a.user['name'], a.role['name'])
+            for a in self.admin.role_assignments.list(include_names=True)
+            if 'project' in a.scope and hasattr(a, 'user'))
+
+    def test_first_apply_creates_everything(self):
+        result = self.apply()
+
+        self.assertEqual({
+            'roles': ['seed_role'],
+            'projects': ['seed1', 'seed2'],
+            'users': ['seed1_user', 'seed2_user'],
+            'grants': [
+                ('seed1', 'seed1_user', 'Member'),
+                ('seed2', 'seed2_user', 'seed_role'),
+            ],
+        }, self.created(result))
+        user = self.admin.users.get(result['users']['seed1_user'])
+        self.assertEqual(result['projects']['seed1'], user.default_project_id)
+        project = self.admin.projects.get(result['projects']['seed1'])
+        self.assertEqual('first', project.description)
+        self.assertIn(('seed1', 'seed1_user', 'Member'), self.grants())
+        self.assertIn(('seed2', 'seed2_user', 'seed_role'), self.grants())
+
+    # 2 回目は何も作成せず、同じ ID を返す。
+    def test_apply_again_creates_nothing(self):
+        first = self.apply()
+        again = self.apply()
+
+        self.assertEqual(NOTHING, self.created(again))
+        for kind in ('roles', 'projects', 'users'):
+            self.assertEqual(first[kind], again[kind])
+
+    # 削除されたユーザと取り消された付与だけを作り直す。
+    def test_apply_repairs_what_is_missing(self):
+        first = self.apply()
+        self.admin.users.delete(first['users']['seed2_user'])
+        self.admin.roles.revoke(
+            first['roles']['Member'], user=first['users']['seed1_user'],
+            project=first['projects']['seed1'])
+
+        again = self.apply()
+
+        self.assertEqual({
+            'roles': [],
+            'projects': [],
+            'users': ['seed2_user'],
+            'grants': [
+                ('seed1', 'seed1_user', 'Member'),
+                ('seed2', 'seed2_user', 'seed_role'),
+            ],
+        }, self.created(again))
+        self.assertIn(('seed1', 'seed1_user', 'Member'), self.grants())
+        self.assertIn(('seed2', 'seed2_user', 'seed_role'), self.grants())
+
+    def test_dry_run_creates_nothing(self):
+        result = self.apply(dry_run=True)
+
+        self.assertEqual(
+            ['seed1_user', 'seed2_user'], self.created(result)['users'])
+        self.assertEqual(2, len(result['created']['grants']))
+        names = set(p.name for p in self.admin.projects.list())
+        self.assertNotIn('seed1', names)
+
+        self.apply()
+        self.assertEqual(NOTHING, self.created(self.apply(dry_run=True)))
+
+    def test_unknown_role_is_an_error(self):
+        description = dict(DESCRIPTION, grants=[
+            {'user': 'seed1_user', 'project': 'seed1', 'role': 'missing'},
+        ])
+
+        self.assertRaises(seed.SeedError, self.apply, description)
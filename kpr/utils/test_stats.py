@@ -0,0 +1,95 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from kpr.utils import stats
+
+
+class TestPercentile(unittest.TestCase):
+
+    def test_no_values(self):
+        self.assertRaises(ValueError, stats.percentile, [], 95)
+
+    def test_single_value(self):
+        for q in (0, 50, 95, 100):
+            self.assertEqual(0.25, stats.percentile([0.25], q))
+
+    # 最も近い 2 つの順位の間を線形に補間する。
+    def test_interpolates_between_ranks(self):
+        values = [1.0, 2.0, 3.0, 4.0]
+        self.assertAlmostEqual(1.0, stats.percentile(values, 0))
+        self.assertAlmostEqual(2.5, stats.percentile(values, 50))
+        self.assertAlmostEqual(3.85, stats.percentile(values, 95))
+        self.assertAlmostEqual(4.0, stats.percentile(values, 100))
+        self.assertAlmostEqual(
+            95.0, stats.percentile([float(v) for v in range(101)], 95))
+
+
+class TestAggregate(unittest.TestCase):
+
+    def setUp(self):
+        super(TestAggregate, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def write(self, pid, calls, phases):
+        with open(stats._path(self.directory, pid), 'w') as f:
+            json.dump({'calls': calls, 'phases': phases}, f)
+
+    # 全プロセスの記録を操作、テスト、ペルソナごとに集計する。
+    def test_aggregate_merges_processes(self):
+        self.write(1, [
+            ['t1', 'setUp', 'admin@admin', 'http', 'GET /v3/users', 0.1,
+             200],
+            ['t1', 'test', 'u@p', 'http', 'GET /v3/users', 0.3, 403],
+        ], [['t1', 'setUp', 1.0], ['t1', 'test', 3.0]])
+        self.write(2, [
+            [None, None, 'admin@admin', 'http', 'POST /v3/users', 0.2,
+             201],
+        ], [])
+
+        summary = stats.aggregate(self.directory)
+
+        users = summary['operations']['GET /v3/users']
+        self.assertEqual(2, users['calls'])
+        self.assertAlmostEqual(0.2, users['p50'])
+        self.assertAlmostEqual(0.29, users['p95'])
+        self.assertEqual(1, summary['operations']['POST /v3/users']['calls'])
+        self.assertEqual(['t1'], list(summary['tests']))
+        t1 = summary['tests']['t1']
+        self.assertEqual(2, t1['calls'])
+        self.assertAlmostEqual(0.4, t1['api_seconds'])
+        self.assertAlmostEqual(4.0, t1['seconds'])
+        self.assertAlmostEqual(1.0, t1['fixture_seconds'])
+        self.assertEqual(
+            {'admin@admin': 2, 'u@p': 1}, dict(summary['personas']))
+        self.assertAlmostEqual(0.25, summary['share']['wall']['fixture'])
+        # Calls outside of any fixture phase count as assertions.
+        self.assertAlmostEqual(0.5 / 0.6, summary['share']['api']['body'])
+
+    def test_report_of_nothing_recorded(self):
+        output = io.StringIO()
+
+        summary = stats.report(self.directory, output)
+
+        self.assertEqual({}, dict(summary['operations']))
+        self.assertEqual(0.0, summary['share']['wall']['fixture'])
+        self.assertIn('operation', output.getvalue())
+        self.assertTrue(os.path.exists(
+            os.path.join(self.directory, stats.REPORT)))
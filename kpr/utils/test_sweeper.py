@@ -0,0 +1,152 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from kpr.fake import app
+from kpr.fake import server
+from kpr.utils import sweeper
+
+POLICY = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'policy.project-admin.json')
+
+
+class TestSweeper(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        super(TestSweeper, cls).setUpClass()
+        cls.server = server.start(app.Application(POLICY))
+        cls.admin = server.client(cls.server)
+
+    @classmethod
+    def tearDownClass(cls):
+        super(TestSweeper, cls).tearDownClass()
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        super(TestSweeper, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.count = 0
+
+    def create_project(self, description=sweeper.MARKER):
+        self.count += 1
+        project = self.admin.projects.create(
+            'project1-{:08d}'.format(self.count), 'default',
+            description=description)
+        self.addCleanup(self.delete, self.admin.projects, project)
+        return project
+
+    def delete(self, manager, resource):
+        if resource.id in self.ids():
+            manager.delete(resource)
+
+    def ids(self):
+        return set(p.id for p in self.admin.projects.list())
+
+    def record(self, pid, *resources):
+        for resource in resources:
+            sweeper._record(self.directory, pid, resource)
+
+    def dead_pid(self):
+        process = subprocess.Popen(['true'])
+        process.wait()
+        return process.pid
+
+    def sweep(self, **kwargs):
+        return sweeper.sweep(
+            directory=self.directory, rate=0, admin=self.admin, **kwargs)
+
+    # 実行中のプロセスの記録にあるものは削除しない。
+    def test_live_ledger_is_kept(self):
+        project = self.create_project()
+        self.record(os.getppid(), project)
+
+        self.assertEqual(([], []), self.sweep())
+        self.assertEqual(([], []), self.sweep(unclaimed=True, age=0))
+        self.assertIn(project.id, self.ids())
+
+    # 終了したプロセスの記録にあるものは削除し、記録も消す。
+    def test_dead_ledger_is_swept(self):
+        project = self.create_project()
+        other = self.create_project()
+        pid = self.dead_pid()
+        self.record(pid, project)
+
+        users, projects = self.sweep()
+
+        self.assertEqual([project.id], [p.id for p in projects])
+        self.assertNotIn(project.id, self.ids())
+        self.assertIn(other.id, self.ids())
+        self.assertFalse(os.path.exists(
+            sweeper._ledger(self.directory, pid)))
+
+    # プールのワールドは記録や経過時間、--unmarked に関係なく削除しない。
+    def test_pooled_world_is_kept(self):
+        project = self.create_project(description=sweeper.POOL_MARKER)
+        self.record(self.dead_pid(), project)
+
+        self.assertEqual(([], []), self.sweep())
+        self.assertEqual(
+            ([], []), self.sweep(unclaimed=True, age=0, unmarked=True))
+        self.assertIn(project.id, self.ids())
+
+    # 記録にないものは unclaimed を指定したときだけ、age 秒経ってから削除する。
+    def test_unclaimed_is_swept_after_age(self):
+        project = self.create_project()
+
+        self.assertEqual(([], []), self.sweep())
+        self.assertEqual(([], []), self.sweep(unclaimed=True, age=3600))
+        users, projects = self.sweep(unclaimed=True, age=0, dry_run=True)
+        self.assertEqual([project.id], [p.id for p in projects])
+        self.assertIn(project.id, self.ids())
+
+        users, projects = self.sweep(unclaimed=True, age=0)
+
+        self.assertEqual([project.id], [p.id for p in projects])
+        self.assertNotIn(project.id, self.ids())
+
+    # 記録にあるユーザは、残すプロジェクトへの付与を取り消してから削除する。
+    def test_dead_ledger_user_is_swept_with_grants(self):
+        project = self.create_project()
+        user = self.admin.users.create(
+            'testuser-00000001', domain='default', password='openstack',
+            description=sweeper.MARKER)
+        member = self.admin.roles.list(name='Member')[0]
+        self.admin.roles.grant(member, user=user, project=project)
+        self.record(self.dead_pid(), user)
+
+        users, projects = self.sweep()
+
+        self.assertEqual([user.id], [u.id for u in users])
+        self.assertEqual([], projects)
+        self.assertNotIn(user.id, set(u.id for u in self.admin.users.list()))
+        self.assertEqual(
+            [], self.admin.role_assignments.list(project=project))
+
+    # 既に削除されたものは一覧を取らずに読み飛ばし、記録を消す。
+    def test_deleted_ledger_id_is_forgotten(self):
+        project = self.create_project()
+        pid = self.dead_pid()
+        self.record(pid, project)
+        self.admin.projects.delete(project)
+
+        self.assertEqual(([], []), self.sweep())
+        self.assertFalse(os.path.exists(
+            sweeper._ledger(self.directory, pid)))
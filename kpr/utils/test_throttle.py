@@ -0,0 +1,101 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import shutil
+import tempfile
+import time
+import unittest
+
+from kpr.utils import throttle
+
+
+class TestLimiter(unittest.TestCase):
+
+    def setUp(self):
+        super(TestLimiter, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def limiter(self, maximum=8, rate=0):
+        return throttle.Limiter(self.directory, maximum, rate, latency=1.0)
+
+    def window(self, limiter):
+        return limiter._update(lambda state: None)['window']
+
+    def release(self, limiter, seconds=0.01, overloaded=False):
+        limiter.release(limiter.acquire(), seconds, overloaded)
+
+    # 速い呼び出しが 1 ウィンドウ分完了するごとに約 1 増え、上限で止まる。
+    def test_window_grows_up_to_maximum(self):
+        limiter = self.limiter()
+        self.assertEqual(throttle.INITIAL_WINDOW, self.window(limiter))
+
+        for _ in range(throttle.INITIAL_WINDOW):
+            self.release(limiter)
+        window = self.window(limiter)
+        self.assertGreater(window, throttle.INITIAL_WINDOW + 0.5)
+        self.assertLess(window, throttle.INITIAL_WINDOW + 1)
+
+        for _ in range(100):
+            self.release(limiter)
+        self.assertEqual(8, self.window(limiter))
+
+    # 過負荷や遅い応答で半分になる。DECREASE_INTERVAL 内は一度だけで、
+    # 1 未満にはならない。
+    def test_window_is_halved_once_per_interval(self):
+        limiter = self.limiter()
+
+        self.release(limiter, overloaded=True)
+        self.assertEqual(2, self.window(limiter))
+        self.release(limiter, seconds=5)
+        self.assertEqual(2, self.window(limiter))
+
+        limiter._update(lambda state: state.update(decreased_at=0))
+        self.release(limiter, seconds=5)
+        self.assertEqual(1, self.window(limiter))
+        limiter._update(lambda state: state.update(decreased_at=0))
+        self.release(limiter, overloaded=True)
+        self.assertEqual(1, self.window(limiter))
+
+    # 時間を計らない呼び出し (CLI の実行) は過負荷のときだけ縮める。
+    def test_untimed_calls_only_count_overload(self):
+        limiter = self.limiter()
+
+        with limiter.hold(timed=False):
+            time.sleep(0.01)
+        self.assertGreater(self.window(limiter), throttle.INITIAL_WINDOW)
+
+        limiter.latency = 0
+        with limiter.hold(timed=False):
+            time.sleep(0.01)
+        self.assertGreater(self.window(limiter), throttle.INITIAL_WINDOW)
+
+        with limiter.hold(timed=False) as outcome:
+            outcome['overloaded'] = True
+        self.assertLess(self.window(limiter), throttle.INITIAL_WINDOW)
+
+    # rate 個までは続けて通し、その後は毎秒 rate 回に抑える。
+    def test_rate_is_a_token_bucket(self):
+        limiter = self.limiter(rate=20)
+
+        started = time.time()
+        for _ in range(20):
+            limiter._take_token()
+        self.assertLess(time.time() - started, 0.2)
+
+        started = time.time()
+        for _ in range(5):
+            limiter._take_token()
+        elapsed = time.time() - started
+        self.assertGreaterEqual(elapsed, 0.2)
+        self.assertLess(elapsed, 1.0)
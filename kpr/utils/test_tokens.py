@@ -0,0 +1,91 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import datetime
+import unittest
+
+from kpr.utils import tokens
+
+
+class Cache(tokens.TokenCache):
+    """Mints fake tokens, running ``during_mint`` while one is minted."""
+
+    def __init__(self):
+        super(Cache, self).__init__()
+        self.minted = 0
+        self.during_mint = None
+
+    def _mint(self, username, project):
+        self.minted += 1
+        if self.during_mint is not None:
+            during_mint, self.during_mint = self.during_mint, None
+            during_mint()
+        return tokens.Token(
+            user_id='{}-id'.format(username),
+            username=username,
+            project=project,
+            token='token{}'.format(self.minted),
+            endpoint='http://keystone/v3',
+            expires=datetime.datetime.now() + datetime.timedelta(hours=1),
+        )
+
+
+class TestTokenCache(unittest.TestCase):
+
+    def test_token_is_reused(self):
+        cache = Cache()
+        first = cache.get('user1', 'project1')
+        self.assertIs(first, cache.get('user1', 'project1'))
+        self.assertEqual(1, cache.minted)
+
+    def test_evict_forgets_the_user_tokens(self):
+        cache = Cache()
+        cache.get('user1', 'project1')
+        cache.get('user2', 'project1')
+
+        cache.evict('user1-id')
+
+        cache.get('user1', 'project1')
+        cache.get('user2', 'project1')
+        self.assertEqual(3, cache.minted)
+
+    # 取得中に無効化されたトークンは、古い権限を持ち得るため保存しない。
+    def test_token_minted_across_evict_is_not_stored(self):
+        cache = Cache()
+        cache.during_mint = lambda: cache.evict('user1')
+
+        stale = cache.get('user1', 'project1')
+        fresh = cache.get('user1', 'project1')
+
+        self.assertNotEqual(stale.token, fresh.token)
+        self.assertEqual(2, cache.minted)
+        self.assertIs(fresh, cache.get('user1', 'project1'))
+
+    def test_token_minted_across_clear_is_not_stored(self):
+        cache = Cache()
+        cache.during_mint = cache.clear
+
+        cache.get('user1', 'project1')
+        cache.get('user1', 'project1')
+
+        self.assertEqual(2, cache.minted)
+
+    def test_expiring_token_is_minted_again(self):
+        cache = Cache()
+        token = cache.get('user1', 'project1')
+        cache._tokens[('user1', 'project1')] = token._replace(
+            expires=datetime.datetime.now() + tokens.EXPIRY_MARGIN / 2)
+
+        cache.get('user1', 'project1')
+
+        self.assertEqual(2, cache.minted)
@@ -0,0 +1,307 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import contextlib
+import errno
+import fcntl
+import itertools
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+from requests import adapters
+
+from kpr.utils import clients
+
+# Seconds to wait before looking for a free slot again.
+POLL_INTERVAL = 0.01
+
+# Window of a limiter without history, and its ceiling when only
+# KPR_MAX_CALL_RATE is set.
+INITIAL_WINDOW = 4
+DEFAULT_MAXIMUM = 32
+
+# The window is halved on overload, at most once per DECREASE_INTERVAL
+# seconds so that one burst of failures counts once.
+DECREASE_FACTOR = 0.5
+DECREASE_INTERVAL = 1.0
+
+# Statuses telling that the identity service is overloaded, and those of
+# them worth retrying.
+OVERLOAD_STATUSES = frozenset([429, 500, 502, 503, 504])
+RETRY_STATUSES = frozenset([429, 502, 503, 504])
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'OPTIONS', 'PUT', 'DELETE'])
+
+MAX_RETRIES = 3
+BACKOFF_BASE = 0.5
+BACKOFF_CAP = 8.0
+
+# How a forked openstack command reports such a status.
+_CLI_OVERLOAD = re.compile(br'HTTP (429|502|503|504)\b')
+
+
+class Overloaded(Exception):
+    """An attempt failed because the identity service is overloaded.
+
+    When no retry is left, ``error`` is raised if set and ``response``
+    returned otherwise.
+    """
+
+    def __init__(self, response=None, error=None, retry_after=None):
+        super(Overloaded, self).__init__(response, error)
+        self.response = response
+        self.error = error
+        self.retry_after = retry_after
+
+
+class Limiter(object):
+    """An AIMD concurrency window and a rate shared through ``directory``.
+
+    Up to ``window`` calls run at once across every process using
+    ``directory``: each running call holds the flock of a slot file whose
+    index is below the window, so a crashed worker frees its slots by
+    itself. The window and the token bucket of the rate live in a state
+    file guarded by its own flock, and outlive the run.
+
+    The window grows by one per window of calls completed in less than
+    ``latency`` seconds and is halved when a call is slower or the
+    service answers with an overload status. Calls whose duration says
+    nothing about the service, such as a whole forked openstack command,
+    release their slot with ``seconds`` None and only count overload
+    statuses.
+    """
+
+    def __init__(self, directory, maximum, rate=0, latency=1.0):
+        self.directory = directory
+        self.maximum = maximum
+        self.rate = rate
+        self.latency = latency
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+
+    def acquire(self):
+        if self.rate:
+            self._take_token()
+        while True:
+            window = int(self._update(lambda state: None)['window'])
+            for slot in range(max(window, 1)):
+                lock_file = open(
+                    os.path.join(self.directory, '{}.lock'.format(slot)), 'a')
+                try:
+                    fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                except IOError as e:
+                    lock_file.close()
+                    if e.errno in (errno.EAGAIN, errno.EACCES):
+                        continue
+                    raise
+                return lock_file
+            time.sleep(POLL_INTERVAL)
+
+    def release(self, lock_file, seconds, overloaded):
+        fcntl.flock(lock_file, fcntl.LOCK_UN)
+        lock_file.close()
+
+        def adjust(state):
+            now = time.time()
+            slow = seconds is not None and seconds > self.latency
+            if overloaded or slow:
+                if now - state['decreased_at'] > DECREASE_INTERVAL:
+                    state['window'] = max(
+                        1.0, state['window'] * DECREASE_FACTOR)
+                    state['decreased_at'] = now
+            else:
+                state['window'] = min(
+                    float(self.maximum),
+                    state['window'] + 1.0 / state['window'])
+
+        self._update(adjust)
+
+    @contextlib.contextmanager
+    def hold(self, timed=True):
+        """Run the block in a slot; set ``overloaded`` on what it yields.
+
+        Unless ``timed``, the duration of the block is not compared with
+        ``latency``.
+        """
+        outcome = {'overloaded': False}
+        lock_file = self.acquire()
+        started = time.time()
+        try:
+            yield outcome
+        finally:
+            seconds = time.time() - started if timed else None
+            self.release(lock_file, seconds, outcome['overloaded'])
+
+    def _take_token(self):
+        while True:
+            def take(state):
+                now = time.time()
+                state['tokens'] = min(
+                    max(self.rate, 1.0),
+                    state['tokens'] +
+                    (now - state['refilled_at']) * self.rate)
+                state['refilled_at'] = now
+                if state['tokens'] >= 1:
+                    state['tokens'] -= 1
+                    return 0
+                return (1 - state['tokens']) / self.rate
+
+            wait = self._update(take, result=True)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def _update(self, function, result=False):
+        path = os.path.join(self.directory, 'state.json')
+        with open(path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                with open(path) as f:
+                    state = json.load(f)
+            except (IOError, ValueError):
+                state = {
+                    'window': float(min(INITIAL_WINDOW, self.maximum)),
+                    'decreased_at': 0,
+                    'tokens': max(self.rate, 1.0),
+                    'refilled_at': time.time(),
+                }
+            value = function(state)
+            with open(path + '.tmp', 'w') as f:
+                json.dump(state, f)
+            os.rename(path + '.tmp', path)
+        return value if result else state
+
+
+def backoff(attempt, retry_after=None):
+    """Return the seconds to wait before retry ``attempt`` (from 0)."""
+    if retry_after is not None:
+        return retry_after
+    # "Full jitter": workers that failed together do not retry together.
+    return random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+
+
+def retrying(function, idempotent, retries=MAX_RETRIES):
+    """Call ``function``, again after a backoff while it is ``Overloaded``.
+
+    Only ``idempotent`` operations are retried.
+    """
+    for attempt in itertools.count():
+        try:
+            return function()
+        except Overloaded as e:
+            if not idempotent or attempt >= retries:
+                if e.error is not None:
+                    raise e.error
+                return e.response
+            if e.response is not None:
+                e.response.close()
+            time.sleep(backoff(attempt, e.retry_after))
+
+
+def cli_overloaded(output):
+    """Tell whether a failed openstack command was refused by overload."""
+    return bool(_CLI_OVERLOAD.search(output or b''))
+
+
+_limiter = None
+_installed = False
+_lock = threading.Lock()
+
+
+def get_limiter():
+    """Return the process' ``Limiter``, or None when calls are not limited."""
+    global _limiter
+    with _lock:
+        if _limiter is None and (clients.KPR_MAX_INFLIGHT_CALLS > 0 or
+                                 clients.KPR_MAX_CALL_RATE > 0):
+            _limiter = Limiter(
+                clients.KPR_THROTTLE_DIR,
+                clients.KPR_MAX_INFLIGHT_CALLS or DEFAULT_MAXIMUM,
+                clients.KPR_MAX_CALL_RATE,
+                clients.KPR_THROTTLE_LATENCY,
+            )
+        return _limiter
+
+
+@contextlib.contextmanager
+def call(timed=True):
+    """Run the block as one limited call.
+
+    Yields a dict whose ``overloaded`` item the block sets when the
+    service refused the call for overload. Pass ``timed=False`` when the
+    block does more than one API call, so that its duration is not taken
+    for the latency of the service.
+    """
+    limiter = get_limiter()
+    if limiter is None:
+        yield {'overloaded': False}
+        return
+    with limiter.hold(timed) as outcome:
+        yield outcome
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get('Retry-After'))
+    except (TypeError, ValueError):
+        return None
+
+
+def _idempotent(request):
+    # Issuing a token changes nothing, so it is safe to retry too.
+    return (request.method in IDEMPOTENT_METHODS or
+            request.path_url.split('?')[0].endswith('/auth/tokens'))
+
+
+def install():
+    """Limit and retry every HTTP request of this process.
+
+    Forked ``openstack`` commands are not covered; ``TestCase.os_run_text``
+    runs them through ``call`` and ``retrying`` itself.
+    """
+    global _installed
+    if get_limiter() is None:
+        return
+    with _lock:
+        if _installed:
+            return
+        send = adapters.HTTPAdapter.send
+
+        def limited_send(adapter, request, **kwargs):
+            def attempt():
+                with call() as outcome:
+                    try:
+                        response = send(adapter, request, **kwargs)
+                    except requests.ConnectionError as e:
+                        outcome['overloaded'] = True
+                        raise Overloaded(error=e)
+                    if response.status_code in OVERLOAD_STATUSES:
+                        outcome['overloaded'] = True
+                    if response.status_code in RETRY_STATUSES:
+                        raise Overloaded(
+                            response=response,
+                            retry_after=_retry_after(response))
+                    return response
+
+            return retrying(attempt, _idempotent(request))
+
+        adapters.HTTPAdapter.send = limited_send
+        _installed = True
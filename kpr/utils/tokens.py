@@ -0,0 +1,111 @@
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+import collections
+import datetime
+import threading
+
+from keystoneauth1.identity import v3
+from keystoneauth1 import session
+
+from kpr.utils import clients
+
+# Tokens closer than this to their expiry are minted again.
+EXPIRY_MARGIN = datetime.timedelta(seconds=60)
+
+Token = collections.namedtuple(
+    'Token',
+    ['user_id', 'username', 'project', 'token', 'endpoint', 'expires'],
+)
+
+
+class TokenCache(object):
+    """Project scoped tokens keyed by (username, project name).
+
+    A persona authenticates with its password once; later CLI calls reuse
+    the token and the identity endpoint taken from its catalog. Entries
+    must be evicted whenever the roles of a user change, otherwise a
+    cached token would carry stale permissions.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tokens = {}
+        # Bumped by every eviction, so that a token minted meanwhile, which
+        # may carry the permissions being evicted, is not cached.
+        self._generation = 0
+
+    def get(self, username, project):
+        key = (username, project)
+        with self._lock:
+            token = self._tokens.get(key)
+            if token is not None and not self._is_expiring(token):
+                return token
+            self._tokens.pop(key, None)
+            generation = self._generation
+
+        token = self._mint(username, project)
+        with self._lock:
+            if generation == self._generation:
+                self._tokens[key] = token
+        return token
+
+    def evict(self, user):
+        """Forget every token of ``user`` (a user resource, id or name)."""
+        keys = set([getattr(user, 'id', user), getattr(user, 'name', user)])
+        with self._lock:
+            self._generation += 1
+            for key, token in list(self._tokens.items()):
+                if token.user_id in keys or token.username in keys:
+                    del self._tokens[key]
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self._tokens.clear()
+
+    def _is_expiring(self, token):
+        now = datetime.datetime.now(token.expires.tzinfo)
+        return token.expires - now < EXPIRY_MARGIN
+
+    def _mint(self, username, project):
+        auth = v3.Password(
+            auth_url=clients.OS_AUTH_URL,
+            username=username,
+            project_name=project,
+            password=clients.OS_PASSWORD,
+            user_domain_id=clients.OS_USER_DOMAIN_ID,
+            project_domain_id=clients.OS_PROJECT_DOMAIN_ID,
+        )
+        access = auth.get_access(session.Session(auth=auth))
+        try:
+            endpoint = access.service_catalog.url_for(
+                service_type='identity',
+                interface='public',
+                region_name=clients.OS_REGION_NAME,
+            )
+        except Exception as e:
+            endpoint = clients.OS_AUTH_URL
+        if not endpoint.rstrip('/').endswith('/v3'):
+            endpoint = "{}/v3".format(endpoint.rstrip('/'))
+        return Token(
+            user_id=access.user_id,
+            username=username,
+            project=project,
+            token=access.auth_token,
+            endpoint=endpoint,
+            expires=access.expires,
+        )
+
+
+token_cache = TokenCache()